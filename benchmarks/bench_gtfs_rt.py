@@ -0,0 +1,85 @@
+"""
+Compares the GTFS-Realtime protobuf path with the 511 Siri JSON path on the
+same synthetic trains: bytes on the wire, raw and gzipped, and the time
+from response body to the parsed vehicles frame (locate_trains comes after
+both and is left out). Before timing, it checks that both paths agree on
+every column the live view reads, so the synthetic feeds double as
+protobuf fixtures.
+
+Run from the repository root (needs gtfs-realtime-bindings):
+    python -m benchmarks.bench_gtfs_rt
+"""
+import gzip
+import json
+import sys
+import time
+
+import numpy as np
+
+from benchmarks import synthetic
+from functions import gtfs_rt
+from functions.siri import locate_trains, parse_vehicle_activity
+
+# Columns both sources fill from the feed; origin and stop_name differ by design
+CHECKED_COLUMNS = [
+    "stop_id", "stopname", "aimed_arrival_time", "expected_arrival_time", "AimedDepartureTime",
+    "id", "direction", "line_type", "destination", "stops_away",
+]
+
+
+def siri_path(body):
+    return parse_vehicle_activity(json.loads(body.decode("utf-8-sig")))
+
+
+def gtfs_rt_path(trip_updates, positions):
+    feed = gtfs_rt.decode_feed(trip_updates)
+    return gtfs_rt.parse_trip_updates(feed, gtfs_rt.vehicle_positions(gtfs_rt.decode_feed(positions)))
+
+
+def check(siri, rt):
+    """
+    Returns the checked columns on which the two frames disagree
+    """
+    siri = locate_trains(siri).reset_index(drop=True)
+    rt = locate_trains(rt).reset_index(drop=True)
+    mismatched = [column for column in CHECKED_COLUMNS if not siri[column].equals(rt[column])]
+    # Positions go through float32 in the protobuf
+    for column in ["train_latitude", "train_longitude"]:
+        if not np.allclose(siri[column], rt[column], atol=1e-5):
+            mismatched.append(column)
+    return mismatched
+
+
+def best_ms(func, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def main(repeat=50):
+    failed = False
+    print(f"{'trains':>6} {'JSON KiB':>9} {'gz':>7} {'PB KiB':>8} {'gz':>7} {'JSON ms':>8} {'PB ms':>7}")
+    for n_trains in [10, 50, 200]:
+        body = json.dumps(synthetic.vehicle_monitoring(n_trains)).encode("utf-8")
+        trip_updates, positions = synthetic.gtfs_rt_feeds(n_trains)
+
+        mismatched = check(siri_path(body), gtfs_rt_path(trip_updates, positions))
+        if mismatched:
+            failed = True
+            print(f"{n_trains:>6} MISMATCH in {', '.join(mismatched)}")
+            continue
+
+        protobuf = trip_updates + positions
+        print(f"{n_trains:>6} {len(body) / 1024:>9.1f} {len(gzip.compress(body)) / 1024:>7.1f} "
+              f"{len(protobuf) / 1024:>8.1f} "
+              f"{(len(gzip.compress(trip_updates)) + len(gzip.compress(positions))) / 1024:>7.1f} "
+              f"{best_ms(lambda: siri_path(body), repeat):>8.2f} "
+              f"{best_ms(lambda: gtfs_rt_path(trip_updates, positions), repeat):>7.2f}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
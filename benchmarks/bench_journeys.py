@@ -0,0 +1,99 @@
+"""
+Times origin-destination search over the scraped timetable: building the
+journey index, and finding the trains for every station pair with it
+against the original filter (drop the trains with no time at the
+destination), after checking both keep the same trains, also on tables
+with the empty cells a short row leaves.
+
+Run from the repository root:
+    python -m benchmarks.bench_journeys
+    python -m benchmarks.bench_journeys --trains 200
+"""
+import argparse
+import itertools
+import timeit
+
+from benchmarks.run import FakeResponse
+from benchmarks.synthetic import schedule_html
+from functions.ct_functions import parse_schedule_tables
+from functions.journeys import JourneyIndex
+from functions.timemodel import service_seconds
+
+
+def legacy_trains(tables, origin, destination):
+    # Both stations served, whichever order the train calls at them
+    trains = []
+    for table in tables.values():
+        if origin not in table.index or destination not in table.index:
+            continue
+        df = table.loc[[origin, destination]].replace("--", None).dropna(axis=1)
+        trains.extend(df.columns)
+    return trains
+
+
+def legacy_journeys(tables, origin, destination):
+    # The original filter's trains that reach the destination after the origin
+    trains = set()
+    for table in tables.values():
+        if origin not in table.index or destination not in table.index:
+            continue
+        df = table.loc[[origin, destination]].replace("--", None).dropna(axis=1)
+        # Without the unnamed columns short rows leave, as in schedule_departures
+        trains.update(train for train, (departs, arrives) in df.items()
+                      if isinstance(train, str) and service_seconds(arrives) > service_seconds(departs))
+    return trains
+
+
+def check(tables, pairs):
+    """
+    Raises SystemExit unless the index keeps the same trains as the
+    original filter for every pair
+    """
+    journeys = JourneyIndex.from_tables(tables)
+    # The index only keeps trains that reach the destination after the origin
+    for origin, destination in pairs:
+        if journeys.serving(origin, destination) != legacy_journeys(tables, origin, destination):
+            raise SystemExit(f"mismatch for {origin} -> {destination}")
+
+
+def with_short_rows(tables):
+    """
+    The tables as a short row on caltrain.com parses: a missing cell, an
+    unnamed column and an unnamed row, all None
+    """
+    short = {}
+    for direction, table in tables.items():
+        table = table.copy()
+        table.iloc[1, 0] = None
+        table[None] = None
+        table.loc[float("nan")] = None
+        short[direction] = table
+    return short
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--trains", type=int, default=100, help="trains per direction in the timetable")
+    args = parser.parse_args()
+
+    tables = parse_schedule_tables(FakeResponse(schedule_html(args.trains).encode("utf-8")))
+    stations = sorted(set().union(*(table.index for table in tables.values())))
+    pairs = list(itertools.permutations(stations, 2))
+    check(tables, pairs)
+    check(with_short_rows(tables), pairs)
+    journeys = JourneyIndex.from_tables(tables)
+
+    build = min(timeit.repeat(lambda: JourneyIndex.from_tables(tables), number=1, repeat=5))
+    indexed = min(timeit.repeat(
+        lambda: [journeys.trips(o, d) for o, d in pairs], number=1, repeat=5))
+    legacy = min(timeit.repeat(
+        lambda: [legacy_trains(tables, o, d) for o, d in pairs], number=1, repeat=3))
+
+    print(f"{len(pairs)} station pairs, {args.trains} trains per direction")
+    print(f"index build      {build * 1000:9.1f} ms")
+    print(f"indexed search   {indexed / len(pairs) * 1e6:9.1f} us per pair")
+    print(f"original filter  {legacy / len(pairs) * 1e6:9.1f} us per pair")
+
+
+if __name__ == "__main__":
+    main()
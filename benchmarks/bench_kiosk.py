@@ -0,0 +1,210 @@
+"""
+Measures the kiosk server against the Streamlit app showing the same live
+boards: CPU seconds and resident memory of the server process, and the
+bytes a screen receives per update.
+
+Both servers run as subprocesses on the same replayed 511 feed, one new
+snapshot a minute, for --duration seconds each. The kiosk screen is an SSE
+client on /events; the Streamlit screen is a websocket client asking for a
+rerun every --refresh seconds, as CALTRAIN_TICK would. Run it on the Pi
+itself for Pi numbers (Linux only, it reads /proc). Streamlit's JavaScript
+bundle, loaded once per screen, is not counted.
+
+Run from the repository root:
+    python -m benchmarks.bench_kiosk
+    python -m benchmarks.bench_kiosk --duration 300 --refresh 5 --trains 30
+"""
+import argparse
+import asyncio
+import base64
+import datetime
+import gzip
+import http.client
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from benchmarks import synthetic
+from functions.stations import get_stations
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+VM_URL = "https://api.511.org/transit/VehicleMonitoring?api_key=REDACTED&agency=CT"
+# The app's default origin station
+STATION = get_stations().names[8]
+
+
+def write_feed_log(path, n_trains, minutes):
+    """
+    A recorder log with one VehicleMonitoring response a minute from now on
+    """
+    now = datetime.datetime.now(datetime.timezone.utc).replace(microsecond=0)
+    with open(path, "wb") as f:
+        for minute in range(minutes):
+            start = now + datetime.timedelta(minutes=minute)
+            body = json.dumps(synthetic.vehicle_monitoring(n_trains, start=start)).encode("utf-8")
+            record = {"ts": start.timestamp(), "endpoint": "511-vehicle-monitoring", "url": VM_URL, "status": 200,
+                      "headers": {"Content-Type": "application/json"},
+                      "body": base64.b64encode(body).decode("ascii")}
+            f.write(gzip.compress(json.dumps(record).encode("utf-8") + b"\n"))
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def process_usage(pid):
+    """
+    (CPU seconds, resident MB, peak resident MB) of a process, from /proc
+    """
+    with open(f"/proc/{pid}/stat") as f:
+        fields = f.read().rsplit(")", 1)[1].split()
+    cpu = (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+    memory = {}
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            name, _, value = line.partition(":")
+            if name in ("VmRSS", "VmHWM"):
+                memory[name] = int(value.split()[0]) / 1024
+    return cpu, memory["VmRSS"], memory["VmHWM"]
+
+
+def wait_for_port(port, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise SystemExit(f"nothing listening on port {port}")
+
+
+def measure_kiosk(env, duration, refresh):
+    port = free_port()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "functions.kiosk", "--station", STATION, "--port", str(port), "--refresh", str(refresh)],
+        cwd=REPO, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        wait_for_port(port)
+        connection = http.client.HTTPConnection("127.0.0.1", port)
+        connection.request("GET", "/")
+        page = connection.getresponse().read()
+        version = page.split(b'data-version="', 1)[1].split(b'"', 1)[0].decode()
+
+        cpu_start = process_usage(server.pid)[0]
+        updates = []
+        events = http.client.HTTPConnection("127.0.0.1", port, timeout=duration + 60)
+        events.request("GET", f"/events?since={version}")
+        stream = events.getresponse()
+
+        def read():
+            message = b""
+            for line in stream:
+                message += line
+                if line == b"\n":
+                    if not message.startswith(b":"):
+                        updates.append(len(message))
+                    message = b""
+
+        threading.Thread(target=read, daemon=True).start()
+        time.sleep(duration)
+        cpu, rss, peak = process_usage(server.pid)
+        return {"first load bytes": len(page), "updates": len(updates), "update bytes": sum(updates),
+                "cpu seconds": cpu - cpu_start, "rss MB": rss, "peak rss MB": peak}
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def measure_streamlit(env, duration, refresh):
+    from streamlit.proto.BackMsg_pb2 import BackMsg
+    from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+    from tornado import ioloop, websocket
+
+    port = free_port()
+    workdir = tempfile.mkdtemp()
+    os.makedirs(os.path.join(workdir, ".streamlit"))
+    with open(os.path.join(workdir, ".streamlit", "secrets.toml"), "w") as f:
+        f.write('511_key = "x"\n')
+    server = subprocess.Popen(
+        [sys.executable, "-m", "streamlit", "run", os.path.join(REPO, "stcaltrain.py"), "--server.headless", "true",
+         "--server.port", str(port), "--browser.gatherUsageStats", "false"],
+        cwd=workdir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+
+    async def screen():
+        connection = await websocket.websocket_connect(f"ws://127.0.0.1:{port}/_stcore/stream")
+
+        async def rerun():
+            message = BackMsg()
+            message.rerun_script.query_string = ""
+            await connection.write_message(message.SerializeToString(), binary=True)
+            received = 0
+            while True:
+                data = await connection.read_message()
+                if data is None:
+                    raise SystemExit("Streamlit closed the connection")
+                received += len(data)
+                forward = ForwardMsg()
+                forward.ParseFromString(data)
+                if forward.WhichOneof("type") == "script_finished":
+                    return received
+
+        first = await rerun()
+        cpu_start = process_usage(server.pid)[0]
+        updates = []
+        deadline = time.monotonic() + duration
+        while time.monotonic() < deadline:
+            started = time.monotonic()
+            updates.append(await rerun())
+            await asyncio.sleep(max(0.0, refresh - (time.monotonic() - started)))
+        cpu, rss, peak = process_usage(server.pid)
+        connection.close()
+        return {"first load bytes": first, "updates": len(updates), "update bytes": sum(updates),
+                "cpu seconds": cpu - cpu_start, "rss MB": rss, "peak rss MB": peak}
+
+    try:
+        wait_for_port(port)
+        return ioloop.IOLoop.current().run_sync(screen, timeout=duration + 120)
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--duration", type=float, default=120, help="seconds to measure each server for")
+    parser.add_argument("--refresh", type=float, default=5, help="seconds between screen refreshes")
+    parser.add_argument("--trains", type=int, default=20)
+    args = parser.parse_args()
+
+    log = tempfile.NamedTemporaryFile(suffix=".jsonl.gz", delete=False).name
+    write_feed_log(log, args.trains, int(args.duration * 2 // 60) + 10)
+    env = dict(os.environ, CALTRAIN_REPLAY_PATH=log, CALTRAIN_REPLAY_SPEED="1", CALTRAIN_511_KEY="x",
+               CALTRAIN_POLL_POLICY="fixed", CALTRAIN_DELAY_DB="", CALTRAIN_APP_MODE="live",
+               CALTRAIN_BOARD_MODE="all", CALTRAIN_TICK="0", PYTHONPATH=REPO)
+
+    results = {"kiosk": measure_kiosk(env, args.duration, args.refresh),
+               "streamlit": measure_streamlit(env, args.duration, args.refresh)}
+    os.unlink(log)
+
+    print(f"{STATION}, {args.trains} trains, {args.duration:.0f} s, refresh every {args.refresh:g} s")
+    print(f"{'':<10} {'first load B':>12} {'updates':>8} {'B/update':>9} {'B/minute':>9} "
+          f"{'CPU s':>7} {'CPU %':>6} {'RSS MB':>7} {'peak MB':>8}")
+    for name, r in results.items():
+        per_update = r["update bytes"] / r["updates"] if r["updates"] else 0
+        print(f"{name:<10} {r['first load bytes']:>12} {r['updates']:>8} {per_update:>9.0f} "
+              f"{r['update bytes'] / args.duration * 60:>9.0f} {r['cpu seconds']:>7.2f} "
+              f"{r['cpu seconds'] / args.duration * 100:>6.1f} {r['rss MB']:>7.1f} {r['peak rss MB']:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
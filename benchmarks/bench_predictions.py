@@ -0,0 +1,78 @@
+"""
+Times caltrain.com stop predictions for several stations, one after
+another with build_caltrain_df against side by side with
+fetch_predictions, over replayed responses that each take --latency
+seconds. Also checks that sessions asking for the same stations at once
+share the requests in flight.
+
+Run from the repository root:
+    python -m benchmarks.bench_predictions
+    python -m benchmarks.bench_predictions --stations 8 --latency 0.3
+"""
+import argparse
+import concurrent.futures
+import json
+import time
+
+from benchmarks import synthetic
+from functions.ct_functions import build_caltrain_df
+from functions.predictions import PredictionFetcher
+from functions.recorder import ReplayAdapter
+from functions.stations import get_stations
+from functions.transport import CLIENT
+
+
+class SlowReplayAdapter(ReplayAdapter):
+    def __init__(self, records, latency):
+        super().__init__(records)
+        self.latency = latency
+
+    def send(self, request, **kwargs):
+        time.sleep(self.latency)
+        return super().send(request, **kwargs)
+
+
+def requests_made():
+    return CLIENT.stats().get("caltrain-predictions", {}).get("requests", 0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--stations", type=int, default=4)
+    parser.add_argument("--latency", type=float, default=0.2, help="seconds each response takes")
+    parser.add_argument("--concurrency", type=int, default=4)
+    args = parser.parse_args()
+
+    stations = get_stations()
+    names = stations.names[:args.stations]
+    records = []
+    for name in names:
+        url = f"https://www.caltrain.com/gtfs/stops/{stations.urlname[name]}/predictions"
+        records.append(synthetic.replay_record(url, json.dumps(synthetic.stop_predictions(10, 70011))))
+    CLIENT.session.mount("https://", SlowReplayAdapter(records, args.latency))
+    fetcher = PredictionFetcher(max_workers=args.concurrency)
+
+    start = time.perf_counter()
+    serial = [build_caltrain_df(name) for name in names]
+    serial_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    merged = fetcher.fetch_all(names)
+    concurrent_seconds = time.perf_counter() - start
+    if len(merged) != sum(len(df) for df in serial):
+        raise SystemExit("merged frame is missing rows")
+
+    # Three sessions showing the same stations at the same moment
+    before = requests_made()
+    with concurrent.futures.ThreadPoolExecutor(3) as sessions:
+        list(sessions.map(lambda _: fetcher.fetch_all(names), range(3)))
+    shared = requests_made() - before
+
+    print(f"{len(names)} stations, {args.latency * 1000:.0f} ms per response, concurrency {args.concurrency}")
+    print(f"serial      {serial_seconds * 1000:8.0f} ms")
+    print(f"concurrent  {concurrent_seconds * 1000:8.0f} ms")
+    print(f"3 sessions at once made {shared} requests for {len(names)} stations")
+
+
+if __name__ == "__main__":
+    main()
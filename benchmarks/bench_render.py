@@ -0,0 +1,132 @@
+"""
+Times the live board render stage (prepare_live_frame and clean_up_df)
+against the original row-wise implementation at 10, 100 and 1,000 trains,
+after checking both produce the same tables.
+
+Run from the repository root:
+    python -m benchmarks.bench_render
+"""
+import argparse
+import datetime
+import timeit
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.synthetic import START, vehicle_monitoring
+from functions.ct_functions import assign_train_type
+from functions.render import clean_up_df, prepare_live_frame
+from functions.siri import create_caltrain_dfs
+from functions.timemodel import to_datetimes
+
+NOW = START + datetime.timedelta(minutes=5)
+
+
+def legacy_frame(trains):
+    """
+    The frame as it was before epoch seconds: datetimes and timedeltas
+    """
+    trains = trains.copy()
+    for column in ["Departure Time", "Scheduled Time", "AimedDepartureTime", "aimed_arrival_time"]:
+        trains[column] = to_datetimes(trains[column]).to_series(index=trains.index)
+    for column in ["ETA", "ScheduledETA", "AimedDepartureTimeETA"]:
+        trains[column] = pd.to_timedelta(trains[column], unit="s")
+    return trains
+
+
+def legacy_prepare_live_frame(caltrain_data):
+    caltrain_data["Train Type"] = caltrain_data["Train #"].apply(assign_train_type)
+    caltrain_data["Train #"] = caltrain_data["Train #"].map(
+        lambda c: f"{assign_train_type(c)}-{c}")
+
+    caltrain_data["Departure Time"] = pd.to_datetime(
+        caltrain_data["Departure Time"]).dt.tz_convert("US/Pacific").dt.strftime("%I:%M %p")
+    caltrain_data["Scheduled Time"] = pd.to_datetime(
+        caltrain_data["Scheduled Time"]).dt.tz_convert("US/Pacific").dt.strftime("%I:%M %p")
+    caltrain_data["AimedDepartureTime"] = pd.to_datetime(
+        caltrain_data["AimedDepartureTime"]).dt.tz_convert("US/Pacific").dt.strftime("%I:%M %p")
+
+    caltrain_data = caltrain_data.reset_index(drop=True)
+
+    idx = (caltrain_data
+           .sort_values(["id", "aimed_arrival_time"])
+           .groupby("id")
+           .head(1)
+           .index)
+
+    first_stops = caltrain_data.loc[idx, ["id", "stop_name"]].drop_duplicates().set_index("id")["stop_name"]
+    caltrain_data["stopsaway2"] = caltrain_data["id"].map(first_stops)
+    caltrain_data["stopsaway2"] = caltrain_data["stopsaway2"].astype(str).str.replace(
+        r'\s*Caltrain Station\s+(Northbound|Southbound)\s*$',
+        '', regex=True
+    ).str.strip()
+    caltrain_data["stopsaway2"] = (
+        caltrain_data["stops_away"].astype(str)
+        + " // " + caltrain_data["stopsaway2"]
+        + " // " + caltrain_data["distance"]
+    )
+    return caltrain_data
+
+
+def legacy_clean_up_df(data):
+    data["ETA"] = data["ETA"].apply(lambda x: int(x.total_seconds() / 60))
+    data["ETA_COMPARE"] = data["ETA"]
+    data["ETA"] = data["ETA"].astype(str) + " min"
+
+    data["ScheduledETA"] = data["ScheduledETA"].apply(lambda x: int(x.total_seconds() / 60))
+    data["ScheduledETA_COMPARE"] = data["ScheduledETA"]
+    data["delayed"] = np.where(data["ETA_COMPARE"] > data["ScheduledETA_COMPARE"] + 1,
+                               '!!!!!--  I SLOW  --!!!!!', '')
+    data["ScheduledETA"] = data["ScheduledETA"].astype(str) + " min"
+
+    data["AimedDepartureTimeETA"] = data["AimedDepartureTimeETA"].apply(
+        lambda x: int(x.total_seconds() / 60))
+    data["AimedDepartureTimeETA"] = data["AimedDepartureTimeETA"].astype(str) + " min"
+
+    data["API Time"] = data.apply(
+        lambda row: f"{row['Departure Time']} // Train in {row['ETA']}", axis=1)
+    data["Scheduled Time"] = data.apply(
+        lambda row: f"{row['Departure Time']} // Train in {row['ScheduledETA']}", axis=1)
+    data["AimedDepartureTime"] = data.apply(
+        lambda row: f"{row['AimedDepartureTime']} // Train in {row['AimedDepartureTimeETA']}", axis=1)
+
+    data = data[["Train #", "API Time", "AimedDepartureTime", "delayed", "stopsaway2"]]
+    data.columns = ["Train #", "API Arrival", "Scheduled Depature", "Delayed", "Stops Away"]
+
+    data = data.T
+    data.columns = data.iloc[0]
+    data = data.drop(data.index[0])
+    return data
+
+
+def render(trains, prepare, clean_up):
+    # Every direction at every station, as the boards would show them
+    prepared = prepare(trains.copy())
+    return [clean_up(rows.copy()) for _, rows in prepared.groupby(["stopname", "direction"])]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--trains", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("-r", "--repeat", type=int, default=3, help="Timing runs, the best is reported")
+    args = parser.parse_args()
+
+    print(f"{'trains':>6} {'rows':>7} {'legacy ms':>10} {'new ms':>10} {'speedup':>8}")
+    for n_trains in args.trains:
+        trains = create_caltrain_dfs(vehicle_monitoring(n_trains), now=NOW)
+
+        legacy_trains = legacy_frame(trains)
+
+        for expected, actual in zip(render(legacy_trains, legacy_prepare_live_frame, legacy_clean_up_df),
+                                    render(trains, prepare_live_frame, clean_up_df)):
+            pd.testing.assert_frame_equal(actual, expected)
+
+        legacy = min(timeit.repeat(lambda: render(legacy_trains, legacy_prepare_live_frame, legacy_clean_up_df),
+                                   number=1, repeat=args.repeat))
+        new = min(timeit.repeat(lambda: render(trains, prepare_live_frame, clean_up_df),
+                                number=1, repeat=args.repeat))
+        print(f"{n_trains:>6} {len(trains):>7} {legacy * 1000:>10.1f} {new * 1000:>10.1f} {legacy / new:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+"""
+Compares the single-pass Siri parser in create_caltrain_dfs with the original
+per-train DataFrame implementation on recorded 511 VehicleMonitoring feeds.
+The original measures distances with geopy, which the app no longer needs:
+    pip install geopy==2.4.1
+
+Run from the repository root:
+    python -m benchmarks.bench_siri_parser feed1.json [feeds.jsonl.gz ...]
+"""
+import argparse
+import datetime
+import json
+import timeit
+
+import pandas as pd
+import pytz
+from geopy.distance import geodesic
+
+from functions.recorder import read_log, record_body
+from functions.siri import create_caltrain_dfs
+from functions.timemodel import to_datetimes
+
+# Columns that depend on the wall clock, filled from a shared `now` below
+CLOCK_COLUMNS = ["Current Time", "ETA", "ScheduledETA", "AimedDepartureTimeETA"]
+# Epoch seconds now, datetimes in the original
+TIME_COLUMNS = ["aimed_arrival_time", "expected_arrival_time", "AimedDepartureTime", "Departure Time",
+                "Scheduled Time"]
+
+
+def legacy_create_caltrain_dfs(data: dict) -> pd.DataFrame:
+    # The implementation create_caltrain_dfs replaced, kept as the reference
+    trains = []
+
+    for train in data["Siri"]["ServiceDelivery"]["VehicleMonitoringDelivery"]["VehicleActivity"]:
+        train_obj = train["MonitoredVehicleJourney"]
+
+        if train_obj.get("OnwardCalls") is None:
+            continue
+
+        next_stop_df = pd.DataFrame(
+            [
+                [
+                    train_obj["MonitoredCall"]["StopPointName"],
+                    train_obj["MonitoredCall"]["StopPointRef"],
+                    train_obj["MonitoredCall"]["AimedArrivalTime"],
+                    train_obj["MonitoredCall"]["ExpectedArrivalTime"],
+                    train_obj["MonitoredCall"]["AimedDepartureTime"],
+                ]
+            ],
+            columns=["stop_name", "stop_id", "aimed_arrival_time",
+                     "expected_arrival_time", "AimedDepartureTime"],
+        )
+
+        destinations_df = pd.DataFrame(
+            [
+                [
+                    stop["StopPointName"],
+                    stop["StopPointRef"],
+                    stop["AimedArrivalTime"],
+                    stop["ExpectedArrivalTime"],
+                    stop["AimedDepartureTime"]
+                ]
+                for stop in train_obj["OnwardCalls"]["OnwardCall"]
+            ],
+            columns=["stop_name", "stop_id", "aimed_arrival_time",
+                     "expected_arrival_time", "AimedDepartureTime"],
+        )
+
+        destinations_df = pd.concat([next_stop_df, destinations_df])
+        destinations_df["id"] = train_obj["VehicleRef"]
+        destinations_df["origin"] = train_obj["OriginName"]
+        destinations_df["origin_id"] = train_obj["OriginRef"]
+        destinations_df["direction"] = train_obj["DirectionRef"] + "B"
+        destinations_df["line_type"] = train_obj["PublishedLineName"]
+        destinations_df["destination"] = train_obj["DestinationName"]
+        destinations_df["train_longitude"] = train_obj["VehicleLocation"]["Longitude"]
+        destinations_df["train_latitude"] = train_obj["VehicleLocation"]["Latitude"]
+        destinations_df["stops_away"] = destinations_df.index
+
+        trains.append(destinations_df)
+
+    trains_df = pd.concat(trains)
+
+    trains_df["aimed_arrival_time"] = pd.to_datetime(trains_df["aimed_arrival_time"])
+    trains_df["expected_arrival_time"] = pd.to_datetime(trains_df["expected_arrival_time"])
+    trains_df["AimedDepartureTime"] = pd.to_datetime(trains_df["AimedDepartureTime"])
+    trains_df["train_longitude"] = trains_df["train_longitude"].astype(float)
+    trains_df["train_latitude"] = trains_df["train_latitude"].astype(float)
+    trains_df["stop_id"] = trains_df["stop_id"].astype(float)
+    trains_df["origin_id"] = trains_df["origin_id"].astype(float)
+
+    stop_ids = pd.read_csv("stop_ids.csv")
+
+    sb_trains_df = pd.merge(trains_df, stop_ids, left_on="stop_id",
+                            right_on="stop1", how="inner")
+    nb_trains_df = pd.merge(trains_df, stop_ids, left_on="stop_id",
+                            right_on="stop2", how="inner")
+    trains_df = pd.concat([sb_trains_df, nb_trains_df])
+
+    trains_df["distance"] = trains_df.apply(
+        lambda x: geodesic((x["train_latitude"], x["train_longitude"]),
+                           (x["lat"], x["lon"])).miles,
+        axis=1,
+    )
+    trains_df["distance"] = trains_df["distance"].round(1).astype("str") + " mi"
+
+    trains_df["Departure Time"] = trains_df["expected_arrival_time"]
+    trains_df["Scheduled Time"] = trains_df["aimed_arrival_time"]
+    trains_df["Current Time"] = datetime.datetime.now(pytz.timezone("UTC"))
+    trains_df["ETA"] = trains_df["Departure Time"] - trains_df["Current Time"]
+    trains_df["ScheduledETA"] = trains_df["Scheduled Time"] - trains_df["Current Time"]
+    trains_df["AimedDepartureTimeETA"] = trains_df["AimedDepartureTime"] - trains_df["Current Time"]
+
+    trains_df["Train #"] = trains_df["id"]
+    trains_df["Direction"] = trains_df["direction"]
+
+    return trains_df
+
+
+def load_feeds(path):
+    """
+    Yields (name, payload) for a saved 511 response body, or for every 511
+    response in a functions.recorder log
+    """
+    if path.endswith(".gz"):
+        for record in read_log(path, endpoint="511-vehicle-monitoring"):
+            yield f"{path}@{record['ts']:.0f}", json.loads(record_body(record).decode("utf-8-sig"))
+    else:
+        with open(path, "rb") as f:
+            yield path, json.loads(f.read().decode("utf-8-sig"))
+
+
+def check_same_output(data):
+    expected = legacy_create_caltrain_dfs(data).drop(columns=CLOCK_COLUMNS)
+    actual = create_caltrain_dfs(data).drop(columns=CLOCK_COLUMNS)
+    for column in TIME_COLUMNS:
+        actual[column] = to_datetimes(actual[column]).to_series(index=actual.index)
+    pd.testing.assert_frame_equal(actual, expected)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("feeds", nargs="+", help="Saved VehicleMonitoring responses or recorder logs (.gz)")
+    parser.add_argument("-n", "--number", type=int, default=20, help="Calls per timing run")
+    parser.add_argument("-r", "--repeat", type=int, default=5, help="Timing runs, the best is reported")
+    args = parser.parse_args()
+
+    print(f"{'feed':<40} {'rows':>6} {'legacy ms':>10} {'new ms':>10} {'speedup':>8}")
+    for name, data in (feed for path in args.feeds for feed in load_feeds(path)):
+        if data["Siri"]["ServiceDelivery"]["VehicleMonitoringDelivery"].get("VehicleActivity") is None:
+            continue
+        check_same_output(data)
+
+        rows = len(create_caltrain_dfs(data))
+        legacy = min(timeit.repeat(lambda: legacy_create_caltrain_dfs(data), number=args.number, repeat=args.repeat))
+        new = min(timeit.repeat(lambda: create_caltrain_dfs(data), number=args.number, repeat=args.repeat))
+        legacy_ms = legacy / args.number * 1000
+        new_ms = new / args.number * 1000
+        print(f"{name[-40:]:<40} {rows:>6} {legacy_ms:>10.2f} {new_ms:>10.2f} {legacy_ms / new_ms:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""
+Checks that timetable times land on the right Pacific clock time on
+daylight saving change days, for the caltrain.com timetable's wall-clock
+labels and for GTFS times, and that the Scheduled view's countdowns span
+the real time between now and the train.
+
+Run from the repository root:
+    python -m benchmarks.check_dst
+"""
+import datetime
+
+from functions.timemodel import (
+    format_clock,
+    format_timetable_clock,
+    gtfs_day_start,
+    service_seconds,
+    wall_clock_epochs,
+)
+
+# A normal day, the spring forward day and the fall back day, with the
+# real minutes from 12:30am to 7:05am on each
+DAYS = {datetime.date(2024, 3, 9): 395, datetime.date(2024, 3, 10): 335, datetime.date(2024, 11, 3): 455}
+LABELS = ["4:30am", "7:05am", "12:15pm", "11:58pm", "12:30am", "1:45am"]
+# Trains after the change, GTFS times count from noon minus 12 hours
+GTFS_LABELS = ["4:30am", "7:05am", "12:15pm", "11:58pm"]
+
+
+def main():
+    failures = []
+    for day, minutes in DAYS.items():
+        seconds = [service_seconds(label) for label in LABELS]
+        shown = format_timetable_clock(wall_clock_epochs(day, seconds))
+        if list(shown) != LABELS:
+            failures.append(f"{day} timetable: {list(shown)} != {LABELS}")
+
+        seconds = [service_seconds(label) for label in GTFS_LABELS]
+        shown = format_timetable_clock([gtfs_day_start(day) + s for s in seconds])
+        if list(shown) != GTFS_LABELS:
+            failures.append(f"{day} GTFS: {list(shown)} != {GTFS_LABELS}")
+
+        # A countdown from 12:30am, as the Scheduled view's ETA column would show it
+        start, train = wall_clock_epochs(day, [service_seconds("12:30am") - 24 * 3600, service_seconds("7:05am")])
+        if (train - start) // 60 != minutes:
+            failures.append(f"{day} countdown: {(train - start) // 60} min != {minutes} min")
+        print(f"{day}  12:30am {format_clock([start])[0]} -> 7:05am {format_clock([train])[0]}: "
+              f"{(train - start) // 60} min")
+
+    if failures:
+        raise SystemExit("\n".join(failures))
+    print("ok")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Import-time report for the app's startup paths.
+
+Each path is imported in a fresh interpreter after streamlit, which the
+server has loaded before the script first runs, and timed with
+python -X importtime. The report lists each path's total and the top-level
+packages that cost the most.
+
+Run from the repository root:
+    python -m benchmarks.import_times
+    python -m benchmarks.import_times --path live --top 15
+"""
+import argparse
+import collections
+import re
+import subprocess
+import sys
+
+# Modules each startup path imports, in the order the app needs them
+PATHS = {
+    # Imported by every run of stcaltrain.py
+    "startup": ["functions.ct_functions", "functions.metrics", "functions.startup", "functions.stations"],
+    # Imported on the first live run
+    "live": [
+        "functions.delay_store", "functions.incremental", "functions.poller",
+        "functions.siri", "functions.boards", "functions.render",
+    ],
+    # Imported on the first scheduled run
+    "schedule": ["bs4", "lxml.etree", "functions.gtfs_schedule"],
+}
+PRELUDE = ["streamlit"]
+
+LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)")
+
+
+def import_times(modules, prelude=PRELUDE):
+    """
+    Returns [(module, self_us, cumulative_us, depth)] for everything that
+    importing modules loaded beyond prelude
+    """
+    code = "; ".join(f"import {module}" for module in prelude + modules)
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code],
+                            capture_output=True, text=True, check=True)
+    entries = []
+    for line in result.stderr.splitlines():
+        match = LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            entries.append((name, int(self_us), int(cumulative_us), len(indent) // 2))
+
+    # Everything up to the prelude's last top-level import was loaded before
+    start = 0
+    for i, (name, _, _, depth) in enumerate(entries):
+        if depth == 0 and name in prelude:
+            start = i + 1
+    return entries[start:]
+
+
+def report(name, modules, top):
+    entries = import_times(modules)
+    total = sum(cumulative for _, _, cumulative, depth in entries if depth == 0)
+    by_package = collections.Counter()
+    for module, self_us, _, _ in entries:
+        by_package[module.split(".")[0]] += self_us
+
+    print(f"{name}: {total / 1000:.1f} ms for {len(entries)} modules ({', '.join(modules)})")
+    for package, self_us in by_package.most_common(top):
+        print(f"    {package:<28} {self_us / 1000:>8.1f} ms")
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--path", choices=list(PATHS), action="append", help="Only report these paths")
+    parser.add_argument("--top", type=int, default=10, help="Packages listed per path")
+    args = parser.parse_args()
+
+    for name in args.path or PATHS:
+        report(name, PATHS[name], args.top)
+
+
+if __name__ == "__main__":
+    main()
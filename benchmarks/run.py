@@ -0,0 +1,255 @@
+"""
+Benchmark suite for the live, schedule and SMS pipelines.
+
+Every stage runs on synthetic payloads at several sizes. For each case it
+records the best wall time, the peak traced memory of one run, and the
+number of memory blocks the run allocates and leaves alive while its result
+is held. Results are compared with a stored baseline and the exit status is
+1 if any case regressed by more than the tolerance or has no baseline.
+
+Run from the repository root:
+    python -m benchmarks.run                  # compare with benchmarks/baseline.json
+    python -m benchmarks.run --save-baseline  # record a new baseline on this machine
+    python -m benchmarks.run --stage sms      # only stages whose name contains "sms"
+"""
+import argparse
+import datetime
+import gc
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+import pandas as pd
+
+from benchmarks import synthetic
+from functions.ct_functions import parse_schedule_tables
+from functions.recorder import ReplayAdapter
+from functions.render import clean_up_df, prepare_live_frame
+from functions.siri import create_caltrain_dfs, locate_trains
+from functions.stations import get_stations
+from functions.transport import CLIENT
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+NOW = synthetic.START + datetime.timedelta(minutes=5)
+STATION = "Redwood City"
+
+
+# (session, adapters) to put back after each case, so replayed responses
+# never leak into the cases after it
+_REPLAYED_SESSIONS = []
+
+
+def replay(session, url, body):
+    """
+    Serves url from session with body until the current case ends
+    """
+    _REPLAYED_SESSIONS.append((session, session.adapters.copy()))
+    session.mount("https://", ReplayAdapter([synthetic.replay_record(url, body)]))
+
+
+def restore_sessions():
+    while _REPLAYED_SESSIONS:
+        session, adapters = _REPLAYED_SESSIONS.pop()
+        session.adapters = adapters
+
+
+class FakeResponse:
+    def __init__(self, content):
+        self.content = content
+
+
+def sms_module():
+    # The SMS function reads stop_ids.csv from the working directory on import
+    from caltrain_response import main as sms
+    return sms
+
+
+def live_pipeline(n_trains):
+    data = synthetic.vehicle_monitoring(n_trains)
+    return lambda: create_caltrain_dfs(data, now=NOW)
+
+
+def live_gtfs_rt(n_trains):
+    from functions import gtfs_rt
+
+    trip_updates, positions = synthetic.gtfs_rt_feeds(n_trains)
+
+    def parse():
+        feed = gtfs_rt.decode_feed(trip_updates)
+        return locate_trains(gtfs_rt.parse_trip_updates(feed, gtfs_rt.vehicle_positions(gtfs_rt.decode_feed(positions))))
+
+    return parse
+
+
+def live_render(n_trains):
+    trains = create_caltrain_dfs(synthetic.vehicle_monitoring(n_trains), now=NOW)
+
+    def render():
+        prepared = prepare_live_frame(trains)
+        station = prepared[prepared["stopname"] == STATION]
+        return [clean_up_df(rows.sort_values("ETA")) for _, rows in station.groupby("direction")]
+
+    return render
+
+
+def schedule_parse(n_trains):
+    response = FakeResponse(synthetic.schedule_html(n_trains).encode("utf-8"))
+    return lambda: parse_schedule_tables(response)
+
+
+def app_predictions(n_trains):
+    # Runs the real fetch code against a replayed response
+    from functions.ct_functions import build_caltrain_df
+
+    urlname = get_stations().urlname[STATION]
+    url = f"https://www.caltrain.com/gtfs/stops/{urlname}/predictions"
+    body = json.dumps(synthetic.stop_predictions(n_trains, 70141))
+    replay(CLIENT.session, url, body)
+    return lambda: build_caltrain_df(STATION)
+
+
+def sms_replay(n_trains):
+    sms = sms_module()
+    url = "https://www.caltrain.com/files/rt/tripupdates/CT.json"
+    body = json.dumps(synthetic.trip_updates(n_trains))
+    replay(sms.SESSION, url, body)
+    return sms
+
+
+def sms_build(n_trains):
+    sms = sms_replay(n_trains)
+    return sms.build_caltrain_df
+
+
+def sms_ping(n_trains):
+    sms = sms_replay(n_trains)
+
+    def ping():
+        # Time a full reply, not one answered from the warm feed
+        sms.clear_feed()
+        return sms.ping_caltrain(STATION)
+
+    return ping
+
+
+def sms_ping_warm(n_trains):
+    sms = sms_replay(n_trains)
+    sms.clear_feed()
+    return lambda: sms.ping_caltrain(STATION)
+
+
+def sms_ping_compact(n_trains):
+    sms = sms_replay(n_trains)
+
+    def ping():
+        sms.clear_feed()
+        return sms.ping_caltrain_compact(STATION)
+
+    return ping
+
+
+def sms_format(n_rows):
+    sms = sms_module()
+    frame = pd.DataFrame(
+        [[f"1{i % 100:02d}", "NB" if i % 2 else "SB", "05:42 PM", "Menlo Park", "05:37 PM"] for i in range(n_rows)],
+        columns=["#", "Dir", "Dep", "Cur", "Dep"],
+    )
+    return lambda: sms.format_df_as_text(frame)
+
+
+# name -> (setup(size) returning the function to time, sizes)
+STAGES = {
+    "live.create_caltrain_dfs": (live_pipeline, [10, 50, 200]),
+    "live.gtfs_rt": (live_gtfs_rt, [10, 50, 200]),
+    "live.render": (live_render, [10, 50, 200]),
+    "schedule.parse": (schedule_parse, [50, 100, 200]),
+    "app.build_caltrain_df": (app_predictions, [5, 20, 100]),
+    "sms.build_caltrain_df": (sms_build, [10, 50, 200]),
+    "sms.ping_caltrain": (sms_ping, [10, 50, 200]),
+    "sms.ping_caltrain_warm": (sms_ping_warm, [10, 50, 200]),
+    "sms.ping_caltrain_compact": (sms_ping_compact, [10, 50, 200]),
+    "sms.format_df_as_text": (sms_format, [5, 20, 100]),
+}
+
+
+def measure(func, repeat):
+    func()  # warm up caches and lazy imports
+
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+
+    gc.collect()
+    tracemalloc.start()
+    result = func()
+    _, peak = tracemalloc.get_traced_memory()
+    snapshot = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    # Only blocks allocated during the run are traced, so these are the ones it left alive
+    blocks = sum(stat.count for stat in snapshot.statistics("filename"))
+    del result
+    return {"ms": best * 1000, "peak_kib": peak / 1024, "blocks": blocks}
+
+
+def compare(results, baseline, tolerance):
+    regressions = []
+    for case, result in results.items():
+        if case not in baseline:
+            regressions.append(f"{case}: not in the baseline, record it with --save-baseline")
+            continue
+        for metric in ["ms", "peak_kib"]:
+            if result[metric] > baseline[case][metric] * (1 + tolerance):
+                regressions.append(f"{case} {metric}: {baseline[case][metric]:.1f} -> {result[metric]:.1f}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--stage", default="", help="Only run stages whose name contains this")
+    parser.add_argument("-r", "--repeat", type=int, default=5, help="Timing runs, the best is reported")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true", help="Write the results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed slowdown before failing, 0.25 = 25%%")
+    args = parser.parse_args()
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    elif not args.save_baseline:
+        # Timings only mean something against the same machine's baseline
+        raise SystemExit(f"No baseline at {args.baseline}: record one on this machine with --save-baseline")
+
+    results = {}
+    print(f"{'case':<34} {'ms':>9} {'base ms':>9} {'peak KiB':>10} {'blocks':>8}")
+    for name, (setup, sizes) in STAGES.items():
+        if args.stage not in name:
+            continue
+        for size in sizes:
+            case = f"{name}[{size}]"
+            try:
+                results[case] = measure(setup(size), args.repeat)
+            finally:
+                restore_sessions()
+            base_ms = f"{baseline[case]['ms']:.2f}" if case in baseline else "-"
+            print(f"{case:<34} {results[case]['ms']:>9.2f} {base_ms:>9} "
+                  f"{results[case]['peak_kib']:>10.1f} {results[case]['blocks']:>8}")
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump({**baseline, **results}, f, indent=2, sort_keys=True)
+        print(f"Baseline written to {args.baseline}")
+        return
+
+    regressions = compare(results, baseline, args.tolerance)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+Simulates a day of 511 polling under different policies and reports the
+calls made, the busiest hour against the quota, and how stale the board is
+on average: over the whole service day, and in the minutes when a train is
+about to reach the watched station, which is when staleness matters.
+
+Trains follow a synthetic weekday timetable (every 15 minutes at the peaks,
+every 30 otherwise), or a GTFS zip's timetable for the day with --gtfs.
+The adaptive policy sees each poll's expected arrivals, as it would from a
+real snapshot.
+
+Run from the repository root:
+    python -m benchmarks.simulate_polling
+    python -m benchmarks.simulate_polling --station "Palo Alto" --quota 120
+    python -m benchmarks.simulate_polling --gtfs caltrain_gtfs.zip --date 2024-05-06
+"""
+import argparse
+import datetime
+
+import numpy as np
+
+from functions.polling import PACIFIC, AdaptivePolicy, ServiceHours
+from functions.stations import get_stations
+
+DAY = datetime.date(2024, 5, 6)
+# Seconds before an arrival that count as "a train is about to arrive"
+NEAR = 5 * 60
+
+
+def synthetic_arrivals():
+    """
+    Seconds into the service day of every arrival at one station, both
+    directions: every 15 minutes in the peaks, every 30 otherwise
+    """
+    arrivals = []
+    for offset in [0, 7 * 60]:
+        t = 4 * 3600 + 50 * 60 + offset
+        while t < 25 * 3600 + 20 * 60:
+            arrivals.append(t)
+            peak = 6 * 3600 <= t < 9 * 3600 or 16 * 3600 <= t < 19 * 3600
+            t += 15 * 60 if peak else 30 * 60
+    return np.sort(np.array(arrivals, dtype="int64"))
+
+
+def gtfs_arrivals(path, station, day):
+    from functions.gtfs_schedule import load_timetable
+
+    timetable = load_timetable(path, get_stations().frame)
+    station_index = timetable.station_index[station]
+    trips = timetable.visit_keys // len(timetable.stations)
+    calls = (timetable.visit_keys % len(timetable.stations) == station_index)
+    calls &= timetable.active_services(day)[timetable.trip_services[trips]]
+    return np.sort(timetable.visit_times[calls].astype("int64")), timetable
+
+
+def simulate(policy, arrivals, midnight, calls_per_poll):
+    """
+    Returns the poll times, in seconds into the service day, over the 24
+    hours from 4am. policy is an AdaptivePolicy or a fixed number of seconds.
+    """
+    polls = []
+    t = 4 * 3600.0
+    while t < 28 * 3600:
+        polls.append(t)
+        if isinstance(policy, AdaptivePolicy):
+            now = midnight + datetime.timedelta(seconds=t)
+            upcoming = arrivals[arrivals > t - 60]
+            arrival = float(max(upcoming[0] - t, 0)) if len(upcoming) else None
+            t += policy.next_delay(now, arrival)
+        else:
+            t += policy
+    return np.array(polls)
+
+
+def report(name, polls, arrivals, calls_per_poll, service):
+    calls = len(polls) * calls_per_poll
+    # Calls in the busiest hour-long window, starting at each poll
+    ends = np.searchsorted(polls, polls + 3600)
+    busiest = int((ends - np.arange(len(polls))).max()) * calls_per_poll
+
+    seconds = np.arange(service[0], service[1], dtype="int64")
+    last_poll = polls[np.searchsorted(polls, seconds, side="right") - 1]
+    staleness = seconds - last_poll
+    next_train = arrivals[np.minimum(np.searchsorted(arrivals, seconds), len(arrivals) - 1)] - seconds
+    near = (next_train >= 0) & (next_train <= NEAR)
+
+    print(f"{name:<22} {calls:>9} {busiest:>9} {staleness.mean():>13.1f} {staleness[near].mean():>13.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--station", default="Redwood City")
+    parser.add_argument("--quota", type=int, default=60, help="511 calls allowed per hour")
+    parser.add_argument("--gtfs", help="GTFS zip to take the day's trains from")
+    parser.add_argument("--date", type=datetime.date.fromisoformat, default=DAY)
+    args = parser.parse_args()
+
+    if args.gtfs:
+        arrivals, timetable = gtfs_arrivals(args.gtfs, args.station, args.date)
+        service_hours = ServiceHours(timetable)
+    else:
+        arrivals = synthetic_arrivals()
+        service_hours = ServiceHours(start=int(arrivals[0]) - 30 * 60, end=int(arrivals[-1]))
+    service = service_hours.span(args.date)
+    midnight = PACIFIC.localize(datetime.datetime.combine(args.date, datetime.time()))
+
+    print(f"{len(arrivals)} trains at {args.station}, service {service[0] / 3600:.2f}h-{service[1] / 3600:.2f}h, "
+          f"quota {args.quota}/h")
+    print(f"{'policy':<22} {'calls/day':>9} {'max/hour':>9} {'stale s (all)':>13} {'stale s (near)':>13}")
+    for name, calls_per_poll, policy in [
+        ("fixed 60s siri", 1, 60),
+        ("fixed 30s siri", 1, 30),
+        ("fixed 60s gtfs-rt", 2, 60),
+        ("adaptive siri", 1, "adaptive"),
+        ("adaptive gtfs-rt", 2, "adaptive"),
+    ]:
+        if policy == "adaptive":
+            policy = AdaptivePolicy(service_hours, quota_per_hour=args.quota, calls_per_poll=calls_per_poll)
+        polls = simulate(policy, arrivals, midnight, calls_per_poll)
+        report(name, polls, arrivals, calls_per_poll, service)
+
+
+if __name__ == "__main__":
+    main()
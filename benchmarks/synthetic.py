@@ -0,0 +1,212 @@
+"""
+Synthetic upstream payloads for the benchmarks, shaped like the real feeds
+and scalable in train and stop count.
+"""
+import base64
+import datetime
+import random
+
+from functions.stations import get_stations
+
+START = datetime.datetime(2024, 5, 6, 16, 0, tzinfo=datetime.timezone.utc)
+
+
+def siri_time(value):
+    return value.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def vehicle_monitoring(n_trains, n_stops=None, seed=0, start=START):
+    """
+    A 511 VehicleMonitoring response with n_trains trains, each with up to
+    n_stops remaining calls (all remaining stations by default). Every
+    seventh train has no OnwardCalls, like trains that are about to finish.
+    """
+    rng = random.Random(seed)
+    stations = get_stations()
+    activity = []
+    for t in range(n_trains):
+        northbound = t % 2 == 0
+        line = list(range(len(stations.names)))[::-1] if northbound else list(range(len(stations.names)))
+        first = rng.randrange(0, len(line) - 2)
+        calls = []
+        base = start + datetime.timedelta(minutes=rng.randint(1, 10))
+        for i, station in enumerate(line[first:first + (n_stops or len(line))]):
+            aimed = base + datetime.timedelta(minutes=4 * i)
+            expected = aimed + datetime.timedelta(minutes=rng.choice([0, 0, 0, 2, 5]))
+            calls.append({
+                "StopPointRef": str(stations.stop1[station] if northbound else stations.stop2[station]),
+                "StopPointName": f"{stations.names[station]} Caltrain Station {'Northbound' if northbound else 'Southbound'}",
+                "AimedArrivalTime": siri_time(aimed),
+                "ExpectedArrivalTime": siri_time(expected),
+                "AimedDepartureTime": siri_time(aimed),
+                "ExpectedDepartureTime": siri_time(expected),
+            })
+        origin, destination = line[0], line[-1]
+        lat, lon = stations.lat[line[first]], stations.lon[line[first]]
+        journey = {
+            "LineRef": "Local",
+            "DirectionRef": "N" if northbound else "S",
+            "PublishedLineName": "Local",
+            "OperatorRef": "CT",
+            "OriginRef": str(stations.stop1[origin]),
+            "OriginName": stations.names[origin],
+            "DestinationRef": str(stations.stop1[destination]),
+            "DestinationName": stations.names[destination],
+            "Monitored": True,
+            "VehicleLocation": {"Longitude": str(lon + rng.uniform(-0.01, 0.01)),
+                                "Latitude": str(lat + rng.uniform(-0.01, 0.01))},
+            "VehicleRef": str(101 + t),
+            "MonitoredCall": calls[0],
+        }
+        if t % 7 != 6:
+            journey["OnwardCalls"] = {"OnwardCall": calls[1:]}
+        activity.append({"RecordedAtTime": siri_time(start), "MonitoredVehicleJourney": journey})
+
+    return {
+        "Siri": {
+            "ServiceDelivery": {
+                "ResponseTimestamp": siri_time(start),
+                "ProducerRef": "CT",
+                "VehicleMonitoringDelivery": {"ResponseTimestamp": siri_time(start), "VehicleActivity": activity},
+            }
+        }
+    }
+
+
+def gtfs_rt_feeds(n_trains, n_stops=None, seed=0, start=START):
+    """
+    Serialized GTFS-Realtime (TripUpdates, VehiclePositions) feeds carrying
+    the same trains, calls and positions as vehicle_monitoring with the same
+    arguments. Trains without OnwardCalls there are left out, as the Siri
+    parser skips them.
+    """
+    from google.transit import gtfs_realtime_pb2
+
+    def epoch(value):
+        return int(datetime.datetime.strptime(value, "%Y-%m-%dT%H:%M:%SZ")
+                   .replace(tzinfo=datetime.timezone.utc).timestamp())
+
+    data = vehicle_monitoring(n_trains, n_stops, seed, start)
+    activity = data["Siri"]["ServiceDelivery"]["VehicleMonitoringDelivery"]["VehicleActivity"]
+    trip_updates, positions = gtfs_realtime_pb2.FeedMessage(), gtfs_realtime_pb2.FeedMessage()
+    for feed in [trip_updates, positions]:
+        feed.header.gtfs_realtime_version = "2.0"
+        feed.header.timestamp = int(start.timestamp())
+
+    for journey in (train["MonitoredVehicleJourney"] for train in activity):
+        if "OnwardCalls" not in journey:
+            continue
+        entity = trip_updates.entity.add(id=journey["VehicleRef"])
+        trip = entity.trip_update.trip
+        trip.trip_id = journey["VehicleRef"]
+        trip.route_id = journey["PublishedLineName"]
+        trip.direction_id = 0 if journey["DirectionRef"] == "N" else 1
+        for call in [journey["MonitoredCall"]] + journey["OnwardCalls"]["OnwardCall"]:
+            update = entity.trip_update.stop_time_update.add(stop_id=call["StopPointRef"])
+            update.arrival.time = epoch(call["ExpectedArrivalTime"])
+            update.arrival.scheduled_time = epoch(call["AimedArrivalTime"])
+            update.departure.time = epoch(call["ExpectedDepartureTime"])
+            update.departure.scheduled_time = epoch(call["AimedDepartureTime"])
+
+        vehicle = positions.entity.add(id=journey["VehicleRef"]).vehicle
+        vehicle.trip.trip_id = journey["VehicleRef"]
+        vehicle.position.latitude = float(journey["VehicleLocation"]["Latitude"])
+        vehicle.position.longitude = float(journey["VehicleLocation"]["Longitude"])
+
+    return trip_updates.SerializeToString(), positions.SerializeToString()
+
+
+def schedule_html(n_trains, seed=0):
+    """
+    The caltrain.com route explorer page with an n_trains timetable in each
+    direction. About a quarter of the cells are skipped stops ("--").
+    """
+    rng = random.Random(seed)
+    stations = get_stations().names
+    tables = []
+    for direction in ["northbound", "southbound"]:
+        line = stations[::-1] if direction == "northbound" else stations
+        numbers = [f"{rng.choice('1456')}{t % 100:02d}" for t in range(n_trains)]
+        rows = ["<tr><td></td><td>Train</td>" + "".join(f"<td>{n}</td>" for n in numbers) + "</tr>"]
+        for s, station in enumerate(line):
+            cells = []
+            for t in range(n_trains):
+                minute = (270 + t * 1200 // max(n_trains, 1) + s * 3) % 1440
+                if rng.random() < 0.25:
+                    cells.append("--")
+                else:
+                    hour = minute // 60
+                    cells.append(f"{(hour - 1) % 12 + 1}:{minute % 60:02d}{'am' if hour < 12 else 'pm'}")
+            rows.append(f"<tr><td>Zone {s // 6 + 1}</td><td>{station}</td>"
+                        + "".join(f"<td>{c}</td>" for c in cells) + "</tr>")
+        tables.append(f'<table class="caltrain_schedule table table-striped" data-direction="{direction}">'
+                      f'<thead></thead><tbody>{"".join(rows)}</tbody></table>')
+    return f"<html><body>{''.join(tables)}</body></html>"
+
+
+def stop_predictions(n_trains, stop_id, start=START, seed=0):
+    """
+    A caltrain.com /gtfs/stops/<station>/predictions response for one
+    platform with n_trains upcoming trains
+    """
+    rng = random.Random(seed)
+    now = int(start.timestamp())
+    predictions = []
+    for t in range(n_trains):
+        arrival = now + 120 + t * 600 + rng.randint(0, 120)
+        update = {"StopId": str(stop_id), "Departure": {"Time": arrival + 30}}
+        if t:
+            # The first train is already at the platform, so it only has a departure
+            update["Arrival"] = {"Time": arrival}
+        predictions.append({"TripUpdate": {"Trip": {"TripId": f"1{t % 100:02d}", "RouteId": "Local"},
+                                           "StopTimeUpdate": [update]}})
+    return {
+        "data": [{"stop": {"field_location": [{"latlon": "37.48,-122.23"}]}, "predictions": predictions}],
+        "meta": {"routes": {"Local": {"title": [{"value": "Local"}]}}},
+    }
+
+
+def trip_updates(n_trains, n_stops=None, start=START, seed=0):
+    """
+    A caltrain.com /files/rt/tripupdates/CT.json response with n_trains
+    trips, each with up to n_stops remaining stops
+    """
+    rng = random.Random(seed)
+    stations = get_stations()
+    now = int(start.timestamp())
+    entities = []
+    for t in range(n_trains):
+        direction = t % 2
+        line = list(range(len(stations.names)))
+        line = line[::-1] if direction == 0 else line
+        first = rng.randrange(0, len(line) - 2)
+        updates = []
+        for i, station in enumerate(line[first:first + (n_stops or len(line))]):
+            arrival = now + 60 + t * 300 + i * 240
+            stop_id = stations.stop1[station] if direction == 0 else stations.stop2[station]
+            update = {"StopId": str(stop_id), "Departure": {"Time": arrival + 30}}
+            if i:
+                update["Arrival"] = {"Time": arrival}
+            updates.append(update)
+        entities.append({"Id": str(t), "TripUpdate": {
+            "Trip": {"TripId": f"{rng.choice('1456')}{t % 100:02d}", "DirectionId": direction},
+            "StopTimeUpdate": updates,
+        }})
+    return {"Header": {"Timestamp": now}, "Entities": entities}
+
+
+def replay_record(url, body, content_type="application/json"):
+    """
+    A functions.recorder log record, for serving synthetic payloads through
+    ReplayAdapter
+    """
+    if not isinstance(body, bytes):
+        body = body.encode("utf-8")
+    return {
+        "ts": START.timestamp(),
+        "endpoint": "synthetic",
+        "url": url,
+        "status": 200,
+        "headers": {"Content-Type": content_type},
+        "body": base64.b64encode(body).decode("ascii"),
+    }
@@ -2,5 +2,6 @@
 gcloud config set project tylerpersonalprojects
 gcloud config set compute/zone us-west2-a
 
-gcloud functions deploy caltrain_check --entry-point main --runtime python38 --trigger-http --allow-unauthenticated --env-vars-file config.yaml --memory=2048MB --timeout=540s
+# 128MB fits the default compact engine; CALTRAIN_SMS_ENGINE=pandas needs 256MB
+gcloud functions deploy caltrain_check --entry-point main --runtime python38 --trigger-http --allow-unauthenticated --env-vars-file config.yaml --memory=128MB --timeout=60s
 
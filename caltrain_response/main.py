@@ -1,66 +1,133 @@
+import contextlib
+import csv
+import datetime
+import functools
+import json
 import logging
 import requests
-from twilio.rest import Client
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import os
-import pandas as pd
-import yaml
-import pytz
-import datetime
+import time
 
+# pandas, pytz and twilio are imported where they are used, so a cold start
+# only pays for what the text actually needs
 
-def create_train_df(train):
-    # Create a dataframe for the train where each stop has arrival and departure times
-    stops_df = pd.json_normalize(train["TripUpdate"]["StopTimeUpdate"])
-    # If Arrival.Time is not in the columns, return None
-    if "Arrival.Time" not in stops_df.columns:
-        return None
-    stops_df["train_num"] = train["TripUpdate"]["Trip"]["TripId"]
-    stops_df["direction"] = train["TripUpdate"]["Trip"]["DirectionId"]
-    # Fill in missing Arrival.Time values with Departure.Time
-    stops_df["Arrival.Time"] = stops_df["Arrival.Time"].fillna(stops_df["Departure.Time"])
 
-    # Convert the arrival and departure times to datetime objects with pacfic timezone in the format strftime ("%-I:%M:%S %p")
-    tz = pytz.timezone("US/Pacific")
-    stops_df["arrival_time"] = stops_df["Arrival.Time"].apply(
-        lambda x: datetime.datetime.fromtimestamp(x, tz).strftime("%I:%M %p")
+def load_stop_map(path="stop_ids.csv"):
+    """Read stop_ids.csv into a single stop id to station name map"""
+    with open(path, newline="") as f:
+        rows = list(csv.DictReader(f))
+    # Create two dictionaries, one for stop1 to stopname and one for stop2 to stopname
+    stop1_to_stopname = {int(row["stop1"]): row["stopname"] for row in rows}
+    stop2_to_stopname = {int(row["stop2"]): row["stopname"] for row in rows}
+
+    # Combine the two dictionaries into one
+    return {**stop1_to_stopname, **stop2_to_stopname}
+
+
+# Loaded once per instance, warm invocations reuse it
+STOP_MAP = load_stop_map()
+
+# Pooled keep-alive session with bounded retries; the timeout stops a hung feed from holding the function
+SESSION = requests.Session()
+SESSION.mount(
+    "https://",
+    HTTPAdapter(max_retries=Retry(total=2, backoff_factor=0.5, status_forcelist=(429, 500, 502, 503, 504))),
+)
+REQUEST_TIMEOUT = (3.05, 10)
+
+
+# Seconds a warm instance reuses the parsed feed for
+FEED_TTL = float(os.environ.get("CALTRAIN_FEED_TTL", 30))
+# "compact" answers texts without pandas, "pandas" with the original data frames
+SMS_ENGINE = os.environ.get("CALTRAIN_SMS_ENGINE", "compact")
+# parse function -> (monotonic time the feed was fetched at, parsed feed)
+_FEEDS = {}
+# Stage -> seconds spent answering the current text, printed once it is sent
+TIMINGS = {}
+# Texts this instance has answered; the first one paid for the cold start
+_answered = 0
+
+
+@contextlib.contextmanager
+def timed(stage):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        TIMINGS[stage] = TIMINGS.get(stage, 0.0) + time.perf_counter() - start
+
+
+def pacific_clock(seconds):
+    # Epoch seconds as "%I:%M %p" in Pacific time
+    import pandas as pd
+
+    return pd.to_datetime(seconds, unit="s", utc=True).dt.tz_convert("US/Pacific").dt.strftime("%I:%M %p")
+
+
+def parse_trip_updates(real_time_trains):
+    """One row per remaining stop of every train, in feed order"""
+    import pandas as pd
+
+    # Trains without a single arrival time are skipped
+    trains = [
+        train for train in real_time_trains["Entities"]
+        if any("Time" in (stop.get("Arrival") or {}) for stop in train["TripUpdate"]["StopTimeUpdate"])
+    ]
+    if not trains:
+        return pd.DataFrame(columns=["StopId", "train_num", "direction", "arrival_time", "departure_time"])
+    # Normalize every train's stops at once instead of a frame per train
+    stops_df = pd.json_normalize(
+        trains,
+        record_path=["TripUpdate", "StopTimeUpdate"],
+        meta=[["TripUpdate", "Trip", "TripId"], ["TripUpdate", "Trip", "DirectionId"]],
     )
-    stops_df["departure_time"] = stops_df["Departure.Time"].apply(
-        lambda x: datetime.datetime.fromtimestamp(x, tz).strftime("%I:%M %p")
+    # Fill in missing Arrival.Time values with Departure.Time
+    arrival = stops_df["Arrival.Time"].fillna(stops_df["Departure.Time"])
+    return pd.DataFrame(
+        {
+            "StopId": stops_df["StopId"],
+            "train_num": stops_df["TripUpdate.Trip.TripId"],
+            "direction": stops_df["TripUpdate.Trip.DirectionId"].astype("int64"),
+            "arrival_time": pacific_clock(arrival),
+            "departure_time": pacific_clock(stops_df["Departure.Time"]),
+        }
     )
-    # drop where Arrival.Time is null
-    # Drop the arrival and departure times in seconds
-    stops_df.drop(["Arrival.Time", "Departure.Time"], axis=1, inplace=True)
-    return stops_df
+
+
+def fetch_trip_updates():
+    # The time parameter keeps caches between us and caltrain.com from serving an old feed
+    ping_url = f"https://www.caltrain.com/files/rt/tripupdates/CT.json?time={int(time.time() * 1000)}"
+    return SESSION.get(ping_url, timeout=REQUEST_TIMEOUT).json()
 
 
 def build_caltrain_df():
-    tz = pytz.timezone("US/Pacific")
-    curr_timestamp = datetime.datetime.utcnow().replace(tzinfo=tz).strftime("%s")
-    curr_timestamp = int(curr_timestamp) * 1000
-    ping_url = f"https://www.caltrain.com/files/rt/tripupdates/CT.json?time={curr_timestamp}"
-    real_time_trains = requests.get(ping_url).json()
+    return parse_trip_updates(fetch_trip_updates())
 
-    all_trains = []
-    for train in real_time_trains["Entities"]:
-        all_trains.append(create_train_df(train))
-    all_trains_df = pd.concat(all_trains)
-    return all_trains_df
 
+def cached_trains(parse=parse_trip_updates, ttl=None):
+    """The feed parsed by parse, refetched once it is older than ttl seconds"""
+    ttl = FEED_TTL if ttl is None else ttl
+    fetched_at, trains = _FEEDS.get(parse, (0.0, None))
+    if trains is None or time.monotonic() - fetched_at > ttl:
+        with timed("fetch"):
+            feed = fetch_trip_updates()
+        with timed("parse"):
+            trains = parse(feed)
+        _FEEDS[parse] = (time.monotonic(), trains)
+    return trains
 
-def ping_caltrain(station):
-    ct_df = build_caltrain_df()
 
-    # Read in stops_ids from CSV file
-    stops_df = pd.read_csv("stop_ids.csv")
-    # Create two dictionaries, one for stop1 to stopname and one for stop2 to stopname
-    stop1_to_stopname = dict(zip(stops_df["stop1"], stops_df["stopname"]))
-    stop2_to_stopname = dict(zip(stops_df["stop2"], stops_df["stopname"]))
+def clear_feed():
+    _FEEDS.clear()
 
-    # Combine the two dictionaries into one
-    stopmap = {**stop1_to_stopname, **stop2_to_stopname}
 
-    # Map the stop ids to the stop names
-    ct_df["StopId"] = ct_df["StopId"].astype("int").map(stopmap)
+def ping_caltrain(station):
+    ct_df = cached_trains()
+
+    # Map the stop ids to the stop names, leaving the cached feed as it is
+    ct_df = ct_df.assign(StopId=ct_df["StopId"].astype("int").map(STOP_MAP))
 
     # Filter for the desired station and for the first row of each train
     ct_df_first_train = ct_df.groupby("train_num").head(1)
@@ -92,7 +159,7 @@ def format_df_as_text(df):
     rows = []
     for row in df.itertuples(index=False):
         # Format the first three columns
-        formatted_row = [f"{v:<{max_lengths[i]}}" for i, v in enumerate(row[:3])]
+        formatted_row = [f"{v:<{max_lengths.iloc[i]}}" for i, v in enumerate(row[:3])]
         # Format the fourth and fifth columns as a single line, wrapped in parentheses
         formatted_row.append(f"\n({row[3]} {row[4]})")
         rows.append(" ".join(formatted_row))
@@ -101,6 +168,118 @@ def format_df_as_text(df):
     return "\n\n".join(rows)
 
 
+@functools.lru_cache(maxsize=None)
+def twilio_client(account_sid: str, auth_token: str):
+    # Warm invocations reuse the client and its connections
+    from twilio.rest import Client
+
+    return Client(account_sid, auth_token)
+
+
+class TrainStops:
+    """One train's remaining stops as station names and departure labels"""
+
+    __slots__ = ("train_num", "direction", "stations", "departures")
+
+    def __init__(self, train_num, direction, stations, departures):
+        self.train_num = train_num
+        self.direction = direction
+        self.stations = stations
+        self.departures = departures
+
+
+class Departure:
+    """One line of the text: a train leaving the station and where it is now"""
+
+    __slots__ = ("train_num", "direction", "departure", "current_stop", "current_departure")
+
+    def __init__(self, train_num, direction, departure, current_stop, current_departure):
+        self.train_num = train_num
+        self.direction = direction
+        self.departure = departure
+        self.current_stop = current_stop
+        self.current_departure = current_departure
+
+
+def parse_compact_trains(real_time_trains):
+    """The trip updates as TrainStops, keeping only what a text needs"""
+    import pytz
+
+    tz = pytz.timezone("US/Pacific")
+    # UTC offsets only change on the hour, so one label per minute is exact
+    labels = {}
+
+    def clock(seconds):
+        # A stop without a departure gets a blank label, like format_df_as_text's fillna
+        if seconds is None:
+            return ""
+        minute = seconds // 60
+        if minute not in labels:
+            labels[minute] = datetime.datetime.fromtimestamp(minute * 60, tz).strftime("%I:%M %p")
+        return labels[minute]
+
+    trains = []
+    for train in real_time_trains["Entities"]:
+        stops = train["TripUpdate"]["StopTimeUpdate"]
+        # Trains without a single arrival time are skipped, like parse_trip_updates
+        if not any("Time" in (stop.get("Arrival") or {}) for stop in stops):
+            continue
+        trip = train["TripUpdate"]["Trip"]
+        trains.append(TrainStops(
+            trip["TripId"],
+            trip["DirectionId"],
+            [STOP_MAP.get(int(stop["StopId"])) for stop in stops],
+            [clock(stop.get("Departure", {}).get("Time")) for stop in stops],
+        ))
+    return trains
+
+
+def ping_caltrain_compact(station):
+    """Same text as ping_caltrain, without building a single data frame"""
+    first_stops = {}
+    rows = []
+    for train in cached_trains(parse_compact_trains):
+        # Where the train is now: the first stop of the first train with this number
+        first_stops.setdefault(train.train_num, (train.stations[0], train.departures[0]))
+        for name, departure in zip(train.stations, train.departures):
+            if name == station:
+                rows.append((train.direction, departure, train.train_num))
+
+    # A stable sort, like sort_values(["direction", "departure_time"]), which puts blanks last
+    rows.sort(key=lambda row: (row[0], row[1] == "", row[1]))
+    departures = []
+    for direction, departure, train_num in rows:
+        current_stop, current_departure = first_stops[train_num]
+        departures.append(Departure(
+            train_num, {0: "NB", 1: "SB"}.get(direction, ""), departure, current_stop or "", current_departure
+        ))
+    return format_departures(departures)
+
+
+def reply(station):
+    """The text for a station from the engine picked by CALTRAIN_SMS_ENGINE"""
+    if SMS_ENGINE == "compact":
+        return ping_caltrain_compact(station)
+    return ping_caltrain(station)
+
+
+def format_departures(departures):
+    """format_df_as_text for a list of Departures"""
+    if not departures:
+        return ""
+    widths = [
+        max(len(d.train_num) for d in departures),
+        max(len(d.direction) for d in departures),
+        max(len(d.departure) for d in departures),
+    ]
+    rows = []
+    for d in departures:
+        formatted_row = [f"{v:<{width}}" for v, width in zip((d.train_num, d.direction, d.departure), widths)]
+        formatted_row.append(f"\n({d.current_stop} {d.current_departure})")
+        rows.append(" ".join(formatted_row))
+    return "\n\n".join(rows)
+
+
 def send_twilio_message(message_body: str, account_sid: str, auth_token: str, from_number: str, to_number: str):
     """Send a text message to a phone number from a twilio account
     Args:
@@ -113,7 +292,7 @@ def send_twilio_message(message_body: str, account_sid: str, auth_token: str, fr
     Returns:
         str: Message sent success
     """
-    client = Client(account_sid, auth_token)
+    client = twilio_client(account_sid, auth_token)
     message = client.messages.create(body=message_body, from_=from_number, to=to_number)
 
     return f"Message Sent: {message.sid}"
@@ -147,7 +326,25 @@ def main(request):
         "hillsdale": "Hillsdale",
     }
     station = station_map.get(station, station)
-    message = ping_caltrain(station)
+    TIMINGS.clear()
+    with timed("reply"):
+        message = reply(station)
     print(message)
-    send_twilio_message(message, ACCOUNT_SID, AUTH_TOKEN, FROM_NUMBER, TO_NUMBER)
+    with timed("send"):
+        send_twilio_message(message, ACCOUNT_SID, AUTH_TOKEN, FROM_NUMBER, TO_NUMBER)
+    log_timings(station)
     return "OK"
+
+
+def log_timings(station):
+    # One JSON line per text, which Cloud Logging keeps as a structured entry
+    global _answered
+    _answered += 1
+    print(json.dumps({
+        "message": f"Answered {station}",
+        "engine": SMS_ENGINE,
+        "cold": _answered == 1,
+        # A warm instance only fetches once the feed is older than FEED_TTL
+        "feed_cached": "fetch" not in TIMINGS,
+        "stages_ms": {stage: round(seconds * 1000, 1) for stage, seconds in TIMINGS.items()},
+    }))
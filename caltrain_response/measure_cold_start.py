@@ -0,0 +1,109 @@
+"""
+Measures the SMS function's cold start the way Cloud Functions sees it: each
+run is a fresh interpreter that imports main, answers one text and then a
+second one from the warm instance. Twilio is imported but nothing is sent.
+
+Run from this directory, against the live feed or a saved CT.json:
+    python measure_cold_start.py --station rwc
+    python measure_cold_start.py --feed CT.json --runs 5
+    CALTRAIN_SMS_ENGINE=pandas python measure_cold_start.py --feed CT.json
+
+Exits with status 1 if the median cold reply takes longer than --budget
+seconds or the peak memory is over --memory-budget MB.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def child(station, feed):
+    # Runs in the fresh interpreter and prints its timings as JSON
+    import resource
+
+    timings = {}
+    start = time.perf_counter()
+    import main
+    timings["import_main"] = time.perf_counter() - start
+
+    if feed:
+        import requests
+        from requests.adapters import BaseAdapter
+
+        class FileAdapter(BaseAdapter):
+            def send(self, request, **kwargs):
+                response = requests.Response()
+                response.status_code = 200
+                response.url = request.url
+                with open(feed, "rb") as f:
+                    response._content = f.read()
+                return response
+
+            def close(self):
+                pass
+
+        main.SESSION.mount("https://", FileAdapter())
+
+    station = {"rwc": "Redwood City", "mp": "Menlo Park", "sf": "San Francisco", "pa": "Palo Alto"}.get(station, station)
+    start = time.perf_counter()
+    main.reply(station)
+    timings["first_reply"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    import twilio.rest  # noqa: F401
+    timings["import_twilio"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    main.reply(station)
+    timings["warm_reply"] = time.perf_counter() - start
+
+    timings["cold_total"] = timings["import_main"] + timings["first_reply"] + timings["import_twilio"]
+    # ru_maxrss is in KB on Linux
+    timings["peak_rss_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(json.dumps(timings))
+
+
+def run_once(station, feed):
+    result = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--child", "--station", station] + (["--feed", feed] if feed else []),
+        cwd=HERE,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--station", default="rwc")
+    parser.add_argument("--feed", help="Saved tripupdates CT.json to serve instead of the network")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--budget", type=float, default=1.0, help="Seconds allowed for a cold reply")
+    parser.add_argument("--memory-budget", type=float, default=256, help="MB the function is deployed with")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    feed = os.path.abspath(args.feed) if args.feed else None
+    if args.child:
+        child(args.station, feed)
+        return
+
+    runs = [run_once(args.station, feed) for _ in range(args.runs)]
+    medians = {name: statistics.median(run[name] for run in runs) for name in runs[0]}
+    for name, value in medians.items():
+        unit = "MB" if name.endswith("_mb") else "ms"
+        print(f"{name:<14} {value if unit == 'MB' else value * 1000:>9.1f} {unit}")
+
+    over = medians["cold_total"] > args.budget or medians["peak_rss_mb"] > args.memory_budget
+    print(f"Budget {args.budget:.1f}s / {args.memory_budget:.0f}MB: {'OVER' if over else 'ok'}")
+    sys.exit(1 if over else 0)
+
+
+if __name__ == "__main__":
+    main()
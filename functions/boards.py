@@ -0,0 +1,97 @@
+import datetime
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+import pytz
+
+from functions.interpolate import interpolate_trains
+from functions.journeys import JourneyIndex
+from functions.metrics import METRICS
+from functions.render import clean_up_df, prepare_live_frame
+from functions.siri import add_clock_columns
+
+# "session" builds the chosen station's boards on every rerun, "all" shares
+# the boards of every station shown, built once per snapshot and minute
+BOARD_MODE = os.environ.get("CALTRAIN_BOARD_MODE", "session")
+
+
+class DepartureBoards:
+    """
+    The live boards of one snapshot. The rows are prepared for every
+    station in a single grouped pass; each station and direction's board,
+    with its typical delay query, is only formatted the first time it is
+    looked up, then shared by every session showing it.
+
+    typical_delay(trains, station), if given, labels each board's typical
+    delay row like the per-session boards.
+    """
+
+    def __init__(self, trains: pd.DataFrame, typical_delay=None):
+        prepared = prepare_live_frame(trains).sort_values("ETA", kind="stable")
+        self.typical_delay = typical_delay
+        # The trains still to call at each station, and in what order
+        self.journeys = JourneyIndex.from_trains(prepared)
+        # (station, direction) -> the board's rows
+        self._rows = dict(tuple(prepared.groupby(["stopname", "direction"], sort=False)))
+        # (station, direction) -> (train id per board column, board), once built
+        self._boards = {}
+        self._lock = threading.Lock()
+
+    def _board(self, station, direction):
+        with self._lock:
+            if (station, direction) not in self._boards:
+                rows = self._rows[station, direction]
+                delay = self.typical_delay(rows, station) if self.typical_delay is not None else None
+                self._boards[station, direction] = (rows["id"].to_numpy(), clean_up_df(rows, delay))
+            return self._boards[station, direction]
+
+    def board(self, station, direction, trains=None):
+        """
+        Returns the board for station and direction ("NB" or "SB"), keeping
+        only the trains in trains if given, or None if no train is due
+        """
+        if (station, direction) not in self._rows:
+            return None
+        ids, board = self._board(station, direction)
+        if trains is not None:
+            keep = np.isin(ids, list(trains))
+            if not keep.any():
+                return None
+            board = board.iloc[:, keep]
+        return board
+
+
+class BoardCache:
+    """
+    Keeps the DepartureBoards of the latest snapshot. They are rebuilt when
+    a new snapshot is published or every resolution seconds, since the ETAs
+    count down; concurrent sessions wait for one build instead of each
+    running their own. With interpolate, the snapshot is moved forward to
+    the build time by interpolate_trains first.
+    """
+
+    def __init__(self, typical_delay=None, resolution=60, interpolate=False):
+        self.typical_delay = typical_delay
+        self.resolution = resolution
+        self.interpolate = interpolate
+        self._lock = threading.Lock()
+        self._key = None
+        self._boards = None
+
+    def boards(self, snapshot, now=None) -> DepartureBoards:
+        now = now or datetime.datetime.now(pytz.utc)
+        key = (snapshot.fetched_at, int(now.timestamp() // self.resolution))
+        with self._lock:
+            if key != self._key:
+                METRICS.count("cache_misses_total", cache="boards")
+                trains = snapshot.payload
+                if self.interpolate:
+                    trains = interpolate_trains(trains, snapshot.fetched_at, now)
+                with METRICS.span("format", view="boards"):
+                    self._boards = DepartureBoards(add_clock_columns(trains, now), self.typical_delay)
+                self._key = key
+            else:
+                METRICS.count("cache_hits_total", cache="boards")
+            return self._boards
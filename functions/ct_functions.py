@@ -1,15 +1,23 @@
-import requests
+import os
+import threading
+import time
+import numpy as np
 import pandas as pd
-import streamlit as st
 import pytz
 import datetime
-from streamlit_extras.badges import badge
-from bs4 import BeautifulSoup
-
-def to_time(seconds):
-    delta = datetime.timedelta(seconds=seconds)
-    return (datetime.datetime.utcfromtimestamp(0) + delta).strftime("%H:%M")
-
+from functions.journeys import JourneyIndex, ride_label
+from functions.metrics import METRICS
+from functions.stations import get_stations
+from functions.timemodel import (
+    format_clock,
+    format_countdown,
+    format_timetable_clock,
+    now_epoch,
+    service_day,
+    service_seconds,
+    wall_clock_epochs,
+)
+from functions.transport import CLIENT
 
 def create_train_df(train):
     # Create a dataframe for the train where each stop has arrival and departure times
@@ -22,14 +30,9 @@ def create_train_df(train):
     # Fill in missing Arrival.Time values with Departure.Time
     stops_df["Arrival.Time"] = stops_df["Arrival.Time"].fillna(stops_df["Departure.Time"])
 
-    # Convert the arrival and departure times to datetime objects with pacfic timezone in the format strftime ("%-I:%M:%S %p")
-    tz = pytz.timezone("US/Pacific")
-    stops_df["arrival_time"] = stops_df["Arrival.Time"].apply(
-        lambda x: datetime.datetime.fromtimestamp(x, tz).strftime("%I:%M %p")
-    )
-    stops_df["departure_time"] = stops_df["Departure.Time"].apply(
-        lambda x: datetime.datetime.fromtimestamp(x, tz).strftime("%I:%M %p")
-    )
+    # Format the epoch arrival and departure times as Pacific "%I:%M %p" labels
+    stops_df["arrival_time"] = format_clock(stops_df["Arrival.Time"].to_numpy(dtype="int64"))
+    stops_df["departure_time"] = format_clock(stops_df["Departure.Time"].to_numpy(dtype="int64"))
     # drop where Arrival.Time is null
     # Drop the arrival and departure times in seconds
     stops_df.drop(["Arrival.Time", "Departure.Time"], axis=1, inplace=True)
@@ -38,49 +41,49 @@ def create_train_df(train):
 
 # Add train type where locals are 100s and 200s, limited is 300s through 600s and bullets are 700s
 # 1XX is Local, 4XX is Limited, 5XX is Express, 6XX is Weekend Local
+TRAIN_TYPES = {
+    "1": "Local",
+    "4": "Limited",
+    "5": "Express",
+    "6": "Weekend",
+}
+UNKNOWN_TRAIN_TYPE = "Contact Dev"
+
+
 def assign_train_type(x):
-    if x.startswith("1"):
-        return "Local"
-    if x.startswith("4"):
-        return "Limited"
-    if x.startswith("5"):
-        return "Express"
-    if x.startswith("6"):
-        return "Weekend"
-    if x.startswith("1"):
-        return "SouthCounty"
-    else:
-        return "Contact Dev"
+    return TRAIN_TYPES.get(x[:1], UNKNOWN_TRAIN_TYPE)
 
 
-def build_caltrain_df(stopname):
-    # tz = pytz.timezone("US/Pacific")
+def train_types(train_numbers: pd.Series) -> pd.Series:
+    """
+    Vectorized assign_train_type over a column of train numbers
+    """
+    return train_numbers.str[:1].map(TRAIN_TYPES).fillna(UNKNOWN_TRAIN_TYPE)
 
-    # read in the station list and get the matching urlname
-    stops_df = pd.read_csv("stop_ids.csv")
 
-    # Get the urlname for the chosen station
-    chosen_station_urlname = stops_df[stops_df["stopname"] == stopname]["urlname"].tolist()[0]
+def train_labels(train_numbers: pd.Series) -> pd.Series:
+    """
+    Train numbers prefixed with their type, e.g. Local-101
+    """
+    return train_types(train_numbers) + "-" + train_numbers
 
-    curr_timestamp = datetime.datetime.utcnow().strftime("%s")
 
-    curr_timestamp = int(curr_timestamp) * 1000
-    # ping_url = f"https://www.caltrain.com/files/rt/vehiclepositions/CT.json?time={curr_timestamp}"
-    ping_url = f"https://www.caltrain.com/gtfs/stops/{chosen_station_urlname}/predictions"
-    real_time_trains = requests.get(ping_url).json()
+def build_caltrain_df(stopname):
+    """
+    The caltrain.com predictions for a station, one row per train and
+    platform, with ETA and Departure in epoch seconds
+    """
+    # Get the urlname for the chosen station
+    chosen_station_urlname = get_stations().urlname[stopname]
 
-    # Assuming `json_data` is the JSON object you provided
-    json_data = real_time_trains
+    ping_url = f"https://www.caltrain.com/gtfs/stops/{chosen_station_urlname}/predictions"
+    json_data = CLIENT.get_parsed(ping_url, "caltrain-predictions", lambda response: response.json())
 
     # Initialize a list to collect data
     data = []
-    lat_lons = []
     # Loop through the 'data' part of the JSON
     for entry in json_data["data"]:
         # Each 'entry' corresponds to a 'stop' and its 'predictions'
-        lat_lon = entry.get("stop", {}).get("field_location", {})[0].get("latlon")
-        lat_lons.append(lat_lon)
-
         stop_predictions = entry.get("predictions", [])
         for prediction in stop_predictions:
             trip_update = prediction.get("TripUpdate", {})
@@ -88,27 +91,7 @@ def build_caltrain_df(stopname):
             stop_time_updates = trip_update.get("StopTimeUpdate", [])
 
             for stop_time_update in stop_time_updates:
-                # Extract the required information
-                train_number = trip.get("TripId")
                 route_id = trip.get("RouteId")
-                stop_id = stop_time_update.get("StopId")
-
-                # Convert the arrival and departure timestamps to human-readable format
-                arrival_timestamp = stop_time_update.get("Arrival", {}).get("Time")
-                departure_timestamp = stop_time_update.get("Departure", {}).get("Time")
-
-                eta = (
-                    datetime.datetime.fromtimestamp(arrival_timestamp).strftime("%Y-%m-%d %H:%M:%S")
-                    if arrival_timestamp
-                    else None
-                )
-                departure = (
-                    datetime.datetime.fromtimestamp(departure_timestamp).strftime(
-                        "%Y-%m-%d %H:%M:%S"
-                    )
-                    if departure_timestamp
-                    else None
-                )
 
                 # Get the route type from the 'meta' part using the route_id
                 route_info = json_data["meta"]["routes"].get(route_id, {})
@@ -119,12 +102,12 @@ def build_caltrain_df(stopname):
                 # Append the collected data to the list
                 data.append(
                     {
-                        "Train Number": train_number,
+                        "Train Number": trip.get("TripId"),
                         "Train Type": train_type,
-                        "ETA": eta,
-                        "Departure": departure,
+                        "ETA": stop_time_update.get("Arrival", {}).get("Time"),
+                        "Departure": stop_time_update.get("Departure", {}).get("Time"),
                         "Route ID": route_id,
-                        "Stop ID": stop_id,
+                        "Stop ID": stop_time_update.get("StopId"),
                     }
                 )
     # Create a DataFrame from the collected data
@@ -133,25 +116,14 @@ def build_caltrain_df(stopname):
         return pd.DataFrame()
 
     # If ETA is null, it means the train is there already, use the departure time instead
-    df["ETA"] = df["ETA"].fillna(df["Departure"])
-
-    pacific = pytz.timezone("US/Pacific")
-    current_time2 = datetime.datetime.now(pacific)
-
-    lt = (
-        df["ETA"]
-        .apply(
-            lambda x: (datetime.datetime.strptime(x, "%Y-%m-%d %H:%M:%S") - current_time2)
-        )
-        .to_list()
-    )
-    lt = [i.total_seconds() for i in lt]
-    # Change to hours:minutes
-    lt = [str(datetime.timedelta(seconds=i))[0:4] for i in lt]
-    # Remove negatives
-    lt = [i if i[0] != "-" else "-" for i in lt]
-    df["departs_in"] = lt
-    # If the stopID is even, the train is northbound, otherwise it is southbound -- make this a string
+    df["ETA"] = df["ETA"].fillna(df["Departure"]).astype("Int64")
+    df["Departure"] = df["Departure"].astype("Int64")
+
+    # Like str(timedelta)[0:4], e.g. 0:12, and "-" once the train is due
+    seconds = (df["ETA"] - now_epoch()).fillna(-1).to_numpy(dtype="int64")
+    hours, minutes = divmod(seconds // 60, 60)
+    df["departs_in"] = [f"{h}:{m:02d}"[:4] if s >= 0 else "-" for h, m, s in zip(hours, minutes, seconds)]
+    # If the stopID is even, the train is southbound, otherwise it is northbound
     df["direction"] = df["Stop ID"].apply(lambda x: "SB" if int(x) % 2 == 0 else "NB")
 
     return df
@@ -162,85 +134,56 @@ def is_northbound(chosen_station, chosen_destination):
     Returns True if the chosen destination is before
     the chosen station in the list of stations
     """
-    stops = pd.read_csv("stop_ids.csv")
-    station_index = stops[stops["stopname"] == chosen_station].index[0]
-    destination_index = stops[stops["stopname"] == chosen_destination].index[0]
-    return station_index > destination_index
+    return get_stations().is_northbound(chosen_station, chosen_destination)
 
 
 def ping_caltrain(station, destination):
-    # try:
-    ct_df = build_caltrain_df(station)
-    # except:
-    # return False
+    # Sessions asking for the same station at once share one request
+    from functions.predictions import fetch_predictions
+
+    ct_df = fetch_predictions([station])
     if ct_df.empty:
         return pd.DataFrame(columns=["Train #", "Direction", "Departure Time", "ETA"])
 
-    # Move num_stops to the end
-    ct_df = ct_df[["Train Number", "direction", "Departure", "departs_in"]]
-    # Change column names to TN, Dir, Dep
-    ct_df.columns = [
-        "Train #",
-        "Direction",
-        "Departure Time",
-        "ETA",
-    ]
-
     # Clean up the dataframe
-    ct_df.dropna(inplace=True)
-    ct_df = ct_df[ct_df["ETA"] != "-"]
-
-    deps = [
-        datetime.datetime.strptime(i, "%Y-%m-%d %H:%M:%S").strftime("%I:%M %p")
-        for i in ct_df["Departure Time"].tolist()
-    ]
-    ct_df["Departure Time"] = deps
+    ct_df = ct_df.dropna(subset=["Departure"])
+    ct_df = ct_df[ct_df["departs_in"] != "-"]
+    departs = ct_df["Departure"].to_numpy(dtype="int64")
+
+    ct_df = pd.DataFrame(
+        {
+            "Train #": ct_df["Train Number"].to_numpy(),
+            "Direction": ct_df["direction"].to_numpy(),
+            "Departure Time": format_clock(departs),
+            "ETA": ct_df["departs_in"].to_numpy(),
+        }
+    )
 
     # Check the destination and if it's before the station, then the direction is southbound
-    nb_sched = get_schedule("northbound", station, destination, rows_return=100)
-    sb_sched = get_schedule("southbound", station, destination, rows_return=100)
-
     if destination != "--" and destination != station:
-        if is_northbound(station, destination):
-            sched = nb_sched
-            ct_df = ct_df[ct_df["Direction"] == "NB"]
-        else:
-            sched = sb_sched
-            ct_df = ct_df[ct_df["Direction"] == "SB"]
-    else:
-        sched = pd.concat([nb_sched, sb_sched])
-
-    sched["ETA_sched"] = sched["ETA"]
-    sched = sched[["Train #", "ETA_sched"]]
-    merged = ct_df.merge(sched, how="inner", on=["Train #"], suffixes=("_test", "_sched"))
-
-    # Calculate the difference between the scheduled and real time
-    merged["diff"] = [
-        datetime.datetime.strptime(i, "%H:%M") - datetime.datetime.strptime(j, "%H:%M")
-        for i, j in zip(merged["ETA"], merged["ETA_sched"])
-        if i != "-" and j != "-"
-    ]
-    merged["total_seconds"] = [i.total_seconds() for i in merged["diff"]]
-
-    # Change the minutes to a time
-    merged["diff"] = [to_time(i) for i in merged["total_seconds"].tolist()]
+        ct_df = ct_df[ct_df["Direction"] == ("NB" if is_northbound(station, destination) else "SB")]
 
     return ct_df
 
 
-def get_schedule(datadirection, chosen_station, chosen_destination=None, rows_return=5):
-    if chosen_destination == "--" or chosen_station == chosen_destination:
-        chosen_destination = None
+SCHEDULE_URL = "https://www.caltrain.com/?active_tab=route_explorer_tab"
+SCHEDULE_DIRECTIONS = ["northbound", "southbound"]
 
-    # Pull the scheduled train times from this url
-    url = "https://www.caltrain.com/?active_tab=route_explorer_tab"
+# How long the scraped timetable is reused before caltrain.com is asked again
+SCHEDULE_TTL = int(os.environ.get("CALTRAIN_SCHEDULE_TTL", 6 * 60 * 60))
+# After a failed fetch, keep serving the old timetable and retry after this long
+SCHEDULE_RETRY = 60
 
-    # Get the html from the url
-    html = requests.get(url).content
+# "web" scrapes caltrain.com, "gtfs" reads a local Caltrain GTFS zip instead
+SCHEDULE_SOURCE = os.environ.get("CALTRAIN_SCHEDULE_SOURCE", "web")
+GTFS_PATH = os.environ.get("CALTRAIN_GTFS_PATH", "caltrain_gtfs.zip")
 
-    # Parse the html
-    soup = BeautifulSoup(html, "lxml")
 
+def parse_schedule_table(soup, datadirection):
+    """
+    Parses one direction's route explorer table into a frame indexed by
+    station name with one column per train number
+    """
     # Get the table from the html
     table = soup.find(
         "table",
@@ -263,13 +206,10 @@ def get_schedule(datadirection, chosen_station, chosen_destination=None, rows_re
 
     # Convert the data to a dataframe
     df = pd.DataFrame(data)
-    # Shift the first row over by 1 to the right
-    # first_row_vals = df.iloc[0, :][:-1]                   #this no longer applies
-    # df.iloc[0, :] = ["Zone"] + first_row_vals.tolist()    #this no longer applies
 
     # Drop the first column and any nas
     df = df.drop(0, axis=1)
-    df = df = df[df.iloc[:, 0].notna()] #Remove extra rows
+    df = df[df.iloc[:, 0].notna()]  # Remove extra rows
 
     # Set the first column as the index
     df.index = df[1]
@@ -280,75 +220,158 @@ def get_schedule(datadirection, chosen_station, chosen_destination=None, rows_re
     df.columns = new_header
 
     # Drop the first column
-    df = df.drop(df.columns[0], axis=1)
-
-    # Drop any columns with the value -- in the 2nd row
-    if chosen_destination:
-        df = df[[i in [chosen_station, chosen_destination] for i in df.index]]
-        df.replace("--", pd.NA, inplace=True)
-        df = df.dropna(axis=1)
-
-        # Drop the second row
-        df = df.drop(df.index[1])
-    else:
-        df = df[df.index == chosen_station]
-
-    # Convert this row to the same as the other caltrain output
-    pstz = pytz.timezone("US/Pacific")
-    # utz = pytz.timezone("UTC")
-    old_day = datetime.datetime(1900, 1, 1)
-    old_day_time = datetime.datetime.now(tz=pstz).time()
-    now = datetime.datetime.combine(
-        old_day,
-        datetime.time(old_day_time.hour, old_day_time.minute),
-    )
-    #Need to localize for streamlit servers
-    pacific = pytz.timezone("US/Pacific")
-    current_time2 = datetime.datetime.now(pacific)
-    weekday = True if current_time2.weekday() < 5 else False
+    return df.drop(df.columns[0], axis=1)
 
-    # Transpose the dataframe
-    df = df.T.reset_index()
-    # Drop any rows with the value -- in the 2nd column
-    df = df[df.iloc[:, 1] != "--"]
 
-    df.columns = ["Train #", "Departure Time"]
-    df["Direction"] = datadirection
-    # Map NB to Northbound and SB to Southbound
-    df["Direction"] = df["Direction"].map({"northbound": "NB", "southbound": "SB"})
-    df["ETA"] = [datetime.datetime.strptime(i, "%I:%M%p") for i in df["Departure Time"].tolist()]
+def parse_schedule_tables(response):
+    # bs4 and lxml are only loaded once the web timetable is first needed
+    from bs4 import BeautifulSoup
 
-    # If the hour is between 12 and 4, add a day to the ETA
-    df["ETA"] = [i + datetime.timedelta(days=1) if i.hour < 4 else i for i in df["ETA"].tolist()]
+    with METRICS.span("parse", source="caltrain-schedule"):
+        soup = BeautifulSoup(response.content, "lxml")
+        return {direction: parse_schedule_table(soup, direction) for direction in SCHEDULE_DIRECTIONS}
 
-    # Sort by the ETA
-    df.sort_values(by="ETA", inplace=True)
 
-    diffs = [i - now for i in df["ETA"].tolist()]
+class TimetableCache:
+    """
+    Process-wide cache of both parsed direction tables. Every session and
+    every caller shares one copy, which is refetched when it is older than
+    ttl seconds or when the service day rolls over. Only one thread fetches
+    at a time; the others wait for it and reuse its result.
+    """
 
-    # 0 if a diff is negative
-    time_diffs = [i if i.total_seconds() > 0 else datetime.timedelta(0) for i in diffs]
-    time_diffs = [i.total_seconds() for i in time_diffs]
+    def __init__(self, ttl=SCHEDULE_TTL, url=SCHEDULE_URL):
+        self.ttl = ttl
+        self.url = url
+        self._lock = threading.Lock()
+        self._tables = None
+        self._service_day = None
+        self._expires = 0.0
+        # (tables, JourneyIndex built from them)
+        self._journeys = None
+
+    def fetch(self):
+        # A 304 hands back the tables parsed from the previous download
+        return CLIENT.get_parsed(self.url, "caltrain-schedule", parse_schedule_tables)
+
+    def tables(self):
+        with self._lock:
+            today = service_day()
+            if self._tables is None or time.monotonic() >= self._expires or self._service_day != today:
+                METRICS.count("cache_misses_total", cache="timetable")
+                try:
+                    self._tables = self.fetch()
+                except Exception:
+                    # Keep serving the last timetable rather than failing the page
+                    if self._tables is None:
+                        raise
+                    # and only try again after SCHEDULE_RETRY, also at the day's rollover
+                    self._expires = time.monotonic() + SCHEDULE_RETRY
+                else:
+                    self._expires = time.monotonic() + self.ttl
+                self._service_day = today
+            else:
+                METRICS.count("cache_hits_total", cache="timetable")
+            return self._tables
+
+    def journeys(self) -> JourneyIndex:
+        """
+        The journey index of the current tables, rebuilt when they are refetched
+        """
+        tables = self.tables()
+        with self._lock:
+            if self._journeys is None or self._journeys[0] is not tables:
+                self._journeys = (tables, JourneyIndex.from_tables(tables))
+            return self._journeys[1]
+
+    def clear(self):
+        with self._lock:
+            self._tables = None
+            self._journeys = None
+
+
+TIMETABLE_CACHE = TimetableCache()
+
+
+def schedule_departures(datadirection, chosen_station, chosen_destination=None, now=None, n=None):
+    """
+    The timetable's next departures from chosen_station in datadirection
+    at or after now (epoch seconds), in order: Train #, Direction, departs
+    in epoch seconds and, with a destination, ride in seconds
+    """
+    if chosen_destination == "--" or chosen_station == chosen_destination:
+        chosen_destination = None
+    now = now_epoch() if now is None else now
 
-    # Convert the time difference to a string like 00:00
-    time_diffs = [to_time(i) for i in time_diffs]
+    if SCHEDULE_SOURCE == "gtfs":
+        from functions.gtfs_schedule import load_timetable
 
-    # Add the time difference to the dataframe
-    df["ETA"] = time_diffs
+        timetable = load_timetable(GTFS_PATH, get_stations().frame)
+        return timetable.departures(datadirection, chosen_station, chosen_destination, now, n)
 
-    # Drop the trains that have already left
-    df = df[df["ETA"] != "00:00"]
-    df.reset_index(drop=True, inplace=True)
-    df.dropna(inplace=True)
+    # The parsed tables are shared, so only read them
+    table = TIMETABLE_CACHE.tables()[datadirection]
+    labels = table.loc[chosen_station] if chosen_station in table.index else pd.Series(dtype=object)
+    # "--" where a train doesn't stop; short rows leave unnamed, empty columns
+    labels = labels[labels.notna() & (labels != "--") & labels.index.notna()]
 
-    # Drop any SF stations northbound
-    if chosen_station in ["San Francisco"]:
-        df = df[df["Direction"] != "NB"]
+    ride = None
+    if chosen_destination:
+        # Only the trains that go on to the destination, with their ride times
+        trips = TIMETABLE_CACHE.journeys().trips(chosen_station, chosen_destination)
+        ride = dict(zip(trips.trains, trips.ride))
+        labels = labels[[train in ride for train in labels.index]]
+
+    # Timetable times are seconds into the service day, which runs past midnight
+    seconds = np.array([service_seconds(label) for label in labels], dtype="int64")
+    trains = labels.index.to_numpy(dtype=object)
+    # 6xx trains run on weekends, the others on weekdays
+    weekend = np.array([train.startswith("6") for train in trains], dtype=bool)
+    # No northbound trains leave San Francisco
+    if chosen_station == "San Francisco" and datadirection == "northbound":
+        weekend = weekend[:0]
+        seconds, trains = seconds[:0], trains[:0]
+
+    # After the last train, the next service day's first trains are next
+    today = service_day(datetime.datetime.fromtimestamp(now, pytz.utc))
+    days = []
+    for day in [today, today + datetime.timedelta(days=1)]:
+        runs = weekend if day.weekday() >= 5 else ~weekend
+        days.append(pd.DataFrame(
+            {
+                "Train #": trains[runs],
+                "Direction": "NB" if datadirection == "northbound" else "SB",
+                "departs": wall_clock_epochs(day, seconds[runs]),
+            },
+            columns=["Train #", "Direction", "departs"],
+        ))
+    df = pd.concat(days, ignore_index=True)
+    if ride is not None:
+        df["ride"] = np.array([ride[train] for train in df["Train #"]], dtype="int64")
+
+    df = df[df["departs"] >= now].sort_values("departs", kind="stable")
+    return df.head(n) if n is not None else df
 
-    # Remove 6 trains on weekdays, 6 are weekend trains
-    if not weekday:
-        df = df[df["Train #"].str.startswith("6")]
-    else:
-        df = df[~df["Train #"].str.startswith("6")]
 
-    return df.head(rows_return)
\ No newline at end of file
+def get_schedule(datadirection, chosen_station, chosen_destination=None, rows_return=5):
+    """
+    The next rows_return departures as display text: Train #, Departure
+    Time, Direction, ETA as an HH:MM countdown and, with a destination, Ride
+    """
+    # Countdowns are to the minute, and a train under a minute away has left
+    now = now_epoch() // 60 * 60
+    df = schedule_departures(datadirection, chosen_station, chosen_destination, now + 60, rows_return)
+
+    departs = df["departs"].to_numpy()
+    schedule = pd.DataFrame(
+        {
+            "Train #": df["Train #"].to_numpy(),
+            "Departure Time": format_timetable_clock(departs),
+            "Direction": df["Direction"].to_numpy(),
+            "ETA": format_countdown(departs - now),
+        },
+        columns=["Train #", "Departure Time", "Direction", "ETA"],
+    )
+    if "ride" in df:
+        schedule["Ride"] = [ride_label(seconds) for seconds in df["ride"]]
+    return schedule
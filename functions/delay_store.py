@@ -0,0 +1,163 @@
+import datetime
+import logging
+import os
+import sqlite3
+import threading
+
+import numpy as np
+import pandas as pd
+
+from functions.timemodel import SERVICE_DAY_START_HOUR, local_days, local_seconds, now_epoch, service_day
+
+logger = logging.getLogger(__name__)
+
+# The SQLite file for the delay history, which is off unless this is set
+DELAY_DB_PATH = os.environ.get("CALTRAIN_DELAY_DB", "")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS delays (
+    service_date TEXT NOT NULL,
+    train TEXT NOT NULL,
+    station TEXT NOT NULL,
+    weekday INTEGER NOT NULL,
+    hour INTEGER NOT NULL,
+    delay_s INTEGER NOT NULL,
+    observed_at INTEGER NOT NULL,
+    PRIMARY KEY (train, station, service_date)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS delays_station_slot ON delays (station, weekday, hour, service_date);
+"""
+
+UPSERT = """
+INSERT INTO delays (service_date, train, station, weekday, hour, delay_s, observed_at)
+VALUES (?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (train, station, service_date) DO UPDATE SET
+    delay_s = excluded.delay_s,
+    observed_at = excluded.observed_at
+"""
+
+
+class DelayStore:
+    """
+    Expected minus aimed arrival per train, station and service day, in
+    SQLite. Every poll updates the row for each train's remaining stops, so
+    a row ends up holding the last prediction made before the train got
+    there. The primary key serves per-train queries and a second index
+    serves station, weekday and hour queries, so a month of history is
+    read with one index range scan.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(SCHEMA)
+
+    def record(self, trains: pd.DataFrame, observed_at=None):
+        """
+        Stores the delays in a located trains frame (see locate_trains)
+        """
+        if trains is None or trains.empty:
+            return
+        aimed = trains["aimed_arrival_time"].to_numpy()
+        # Service days end at 4am, like the timetable's
+        service_days = local_days(aimed - SERVICE_DAY_START_HOUR * 3600)
+        delay = trains["expected_arrival_time"].to_numpy() - aimed
+
+        rows = zip(
+            service_days.astype("M8[D]").astype(str).tolist(),
+            trains["id"].astype(str),
+            trains["stopname"],
+            # 1970-01-01 was a Thursday
+            ((service_days + 3) % 7).tolist(),
+            (local_seconds(aimed) // 3600).tolist(),
+            delay.tolist(),
+            [now_epoch(observed_at)] * len(trains),
+        )
+        with self._lock, self._db:
+            self._db.executemany(UPSERT, rows)
+
+    def delays(self, station, trains=None, days=30, weekday=None, hour=None, now=None):
+        """
+        Returns a (train, delay_s) frame for station over the last days
+        service days, optionally narrowed to some trains, a weekday (0 is
+        Monday) or an hour of the day
+        """
+        since = service_day(now) - datetime.timedelta(days=days)
+
+        query = "SELECT train, delay_s FROM delays WHERE station = ? AND service_date >= ?"
+        params = [station, since.isoformat()]
+        if trains is not None:
+            trains = [str(train) for train in trains]
+            query += f" AND train IN ({','.join('?' * len(trains))})"
+            params += trains
+        if weekday is not None:
+            query += " AND weekday = ?"
+            params.append(weekday)
+        if hour is not None:
+            query += " AND hour = ?"
+            params.append(hour)
+
+        with self._lock:
+            rows = self._db.execute(query, params).fetchall()
+        return pd.DataFrame(rows, columns=["train", "delay_s"]).astype({"train": str, "delay_s": "int64"})
+
+    def percentiles(self, train, station, percentiles=(50, 90), days=30, **filters):
+        """
+        Returns {percentile: delay in seconds} for one train at one station,
+        or None without history, e.g. p50/p90 for train 139 at Redwood City
+        """
+        delays = self.delays(station, trains=[train], days=days, **filters)["delay_s"].to_numpy()
+        if not len(delays):
+            return None
+        return dict(zip(percentiles, np.percentile(delays, percentiles)))
+
+    def typical_delays(self, trains, station, percentiles=(50, 90), days=30, now=None):
+        """
+        Returns a frame indexed by train with one column per percentile of
+        delay in seconds, for every train in trains with history at station
+        """
+        delays = self.delays(station, trains=trains, days=days, now=now)
+        if delays.empty:
+            return pd.DataFrame(columns=list(percentiles), dtype="float64")
+        typical = delays.groupby("train")["delay_s"].quantile([p / 100 for p in percentiles]).unstack()
+        typical.columns = list(percentiles)
+        return typical
+
+
+def format_typical_delay(typical: pd.DataFrame, train_ids: pd.Series) -> pd.Series:
+    """
+    Labels like "p50 +1 / p90 +4 min" per row of train_ids, blank for
+    trains without history
+    """
+    if typical.empty:
+        return pd.Series("", index=train_ids.index)
+    minutes = (typical / 60).round().astype("int64")
+    labels = "p50 " + minutes.iloc[:, 0].map("{:+d}".format) + " / p90 " + minutes.iloc[:, -1].map("{:+d}".format) + " min"
+    return train_ids.astype(str).map(labels).fillna("")
+
+
+def open_delay_store(path=DELAY_DB_PATH):
+    """
+    Returns the DelayStore at path, or None when the history is turned off
+    """
+    return DelayStore(path) if path else None
+
+
+def recording(fetch, store):
+    """
+    Wraps a Poller fetch so every snapshot that changed is also written to
+    store. A failed write is logged and never costs the board its snapshot.
+    """
+    def fetch_and_record():
+        snapshot = fetch()
+        # Without a tracker changes is None and every snapshot is written
+        if store is not None and (snapshot.changes is None or snapshot.changes):
+            try:
+                store.record(snapshot.payload, snapshot.fetched_at)
+            except sqlite3.Error:
+                logger.exception("Could not record delays to %s", store.path)
+        return snapshot
+
+    return fetch_and_record
@@ -0,0 +1,121 @@
+import numpy as np
+
+METERS_PER_MILE = 1609.344
+EARTH_RADIUS_MILES = 3958.7613
+
+# WGS-84, the ellipsoid geopy's geodesic uses by default
+WGS84_A = 6378137.0
+WGS84_F = 1 / 298.257223563
+WGS84_B = WGS84_A * (1 - WGS84_F)
+
+
+def haversine_miles(lat1, lon1, lat2, lon2):
+    """
+    Great-circle distance in miles on a spherical earth. Inputs are degrees
+    and broadcast against each other like any NumPy ufunc.
+    """
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(v, dtype="float64")) for v in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_MILES * np.arcsin(np.sqrt(a))
+
+
+def ellipsoidal_miles(lat1, lon1, lat2, lon2, max_iterations=20, tolerance=1e-12):
+    """
+    Distance in miles on the WGS-84 ellipsoid using Vincenty's inverse
+    formula, iterated on whole arrays at once. Inputs are degrees and
+    broadcast like haversine_miles. Agrees with geopy's geodesic to well
+    under 0.1 mi for any pair of points on the Caltrain line.
+    """
+    lat1, lon1, lat2, lon2 = np.broadcast_arrays(
+        *(np.radians(np.asarray(v, dtype="float64")) for v in (lat1, lon1, lat2, lon2))
+    )
+
+    f = WGS84_F
+    u1 = np.arctan((1 - f) * np.tan(lat1))
+    u2 = np.arctan((1 - f) * np.tan(lat2))
+    sin_u1, cos_u1 = np.sin(u1), np.cos(u1)
+    sin_u2, cos_u2 = np.sin(u2), np.cos(u2)
+
+    big_l = lon2 - lon1
+    lam = big_l
+    with np.errstate(invalid="ignore", divide="ignore"):
+        for _ in range(max_iterations):
+            sin_lam, cos_lam = np.sin(lam), np.cos(lam)
+            sin_sigma = np.hypot(cos_u2 * sin_lam, cos_u1 * sin_u2 - sin_u1 * cos_u2 * cos_lam)
+            cos_sigma = sin_u1 * sin_u2 + cos_u1 * cos_u2 * cos_lam
+            sigma = np.arctan2(sin_sigma, cos_sigma)
+
+            # Coincident points have sin_sigma == 0 and a distance of 0
+            sin_alpha = np.where(sin_sigma == 0, 0.0, cos_u1 * cos_u2 * sin_lam / sin_sigma)
+            cos2_alpha = 1 - sin_alpha ** 2
+            # Points on the equator have cos2_alpha == 0
+            cos_2sigma_m = np.where(cos2_alpha == 0, 0.0, cos_sigma - 2 * sin_u1 * sin_u2 / cos2_alpha)
+
+            c = f / 16 * cos2_alpha * (4 + f * (4 - 3 * cos2_alpha))
+            lam_prev = lam
+            lam = big_l + (1 - c) * f * sin_alpha * (
+                sigma + c * sin_sigma * (cos_2sigma_m + c * cos_sigma * (-1 + 2 * cos_2sigma_m ** 2))
+            )
+            if np.all(np.abs(lam - lam_prev) < tolerance):
+                break
+
+    u_sq = cos2_alpha * (WGS84_A ** 2 - WGS84_B ** 2) / WGS84_B ** 2
+    big_a = 1 + u_sq / 16384 * (4096 + u_sq * (-768 + u_sq * (320 - 175 * u_sq)))
+    big_b = u_sq / 1024 * (256 + u_sq * (-128 + u_sq * (74 - 47 * u_sq)))
+    delta_sigma = big_b * sin_sigma * (
+        cos_2sigma_m + big_b / 4 * (
+            cos_sigma * (-1 + 2 * cos_2sigma_m ** 2)
+            - big_b / 6 * cos_2sigma_m * (-3 + 4 * sin_sigma ** 2) * (-3 + 4 * cos_2sigma_m ** 2)
+        )
+    )
+    return WGS84_B * big_a * (sigma - delta_sigma) / METERS_PER_MILE
+
+
+DISTANCE_METHODS = {
+    "ellipsoidal": ellipsoidal_miles,
+    "haversine": haversine_miles,
+}
+
+
+def distance_miles(lat1, lon1, lat2, lon2, method="ellipsoidal"):
+    """
+    Distance in miles between two sets of points, with method one of
+    DISTANCE_METHODS
+    """
+    if method not in DISTANCE_METHODS:
+        raise ValueError(f"Unknown distance method {method!r}, expected one of {list(DISTANCE_METHODS)}")
+    return DISTANCE_METHODS[method](lat1, lon1, lat2, lon2)
+
+
+class StationDistances:
+    """
+    Holds the station coordinates once and measures every train against
+    every station in one batched call
+    """
+
+    def __init__(self, station_lat, station_lon, method="ellipsoidal"):
+        self.station_lat = np.asarray(station_lat, dtype="float64")
+        self.station_lon = np.asarray(station_lon, dtype="float64")
+        self.method = method
+
+    def matrix(self, train_lat, train_lon):
+        """
+        Returns a (trains, stations) array of distances in miles
+        """
+        train_lat = np.asarray(train_lat, dtype="float64")[:, None]
+        train_lon = np.asarray(train_lon, dtype="float64")[:, None]
+        return distance_miles(train_lat, train_lon, self.station_lat[None, :], self.station_lon[None, :], self.method)
+
+    def for_rows(self, train_codes, train_lat, train_lon, station_index):
+        """
+        Distances for row-aligned arrays where each row pairs a train, coded
+        0..n-1, with a station index. Each distinct train is measured against
+        the stations once and the rows are gathered from that matrix.
+        """
+        train_codes = np.asarray(train_codes)
+        n_trains = train_codes.max() + 1 if len(train_codes) else 0
+        lat = np.zeros(n_trains)
+        lon = np.zeros(n_trains)
+        lat[train_codes] = train_lat
+        lon[train_codes] = train_lon
+        return self.matrix(lat, lon)[train_codes, np.asarray(station_index)]
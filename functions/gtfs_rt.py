@@ -0,0 +1,188 @@
+"""
+GTFS-Realtime ingestion for the live view.
+
+511 publishes Caltrain's TripUpdates and VehiclePositions as binary
+protobuf. This module decodes them straight into the frame
+parse_vehicle_activity builds from Siri JSON, reading only the fields the
+live view uses, so locate_trains and everything after it run unchanged.
+
+Needs the optional gtfs-realtime-bindings package. Select it for the live
+view with CALTRAIN_LIVE_SOURCE=gtfs-rt.
+"""
+import datetime
+import os
+
+import numpy as np
+import pandas as pd
+import pytz
+
+from functions.metrics import METRICS
+from functions.poller import Snapshot
+from functions.siri import VEHICLE_COLUMNS, locate_trains
+from functions.stations import get_stations
+from functions.transport import CLIENT
+
+try:
+    from google.transit import gtfs_realtime_pb2
+except ImportError:  # gtfs-realtime-bindings is optional
+    gtfs_realtime_pb2 = None
+
+# "siri" reads 511 VehicleMonitoring JSON, "gtfs-rt" the protobuf feeds
+LIVE_SOURCE = os.environ.get("CALTRAIN_LIVE_SOURCE", "siri")
+
+TRIP_UPDATES_URL = "https://api.511.org/transit/tripupdates?api_key={api_key}&agency=CT"
+VEHICLE_POSITIONS_URL = "https://api.511.org/transit/vehiclepositions?api_key={api_key}&agency=CT"
+
+# GTFS direction_id, as in the SMS function
+DIRECTIONS = {0: "NB", 1: "SB"}
+
+
+def decode_feed(content: bytes):
+    """
+    Decodes a serialized GTFS-Realtime FeedMessage
+    """
+    if gtfs_realtime_pb2 is None:
+        raise ImportError("GTFS-Realtime feeds need gtfs-realtime-bindings: pip install gtfs-realtime-bindings")
+    feed = gtfs_realtime_pb2.FeedMessage()
+    with METRICS.span("decode", source="gtfs-rt"):
+        feed.ParseFromString(content)
+    return feed
+
+
+def vehicle_positions(feed) -> dict:
+    """
+    Returns {trip_id: (latitude, longitude)} from a VehiclePositions feed
+    """
+    positions = {}
+    for entity in feed.entity:
+        if entity.HasField("vehicle") and entity.vehicle.HasField("position"):
+            vehicle = entity.vehicle
+            positions[vehicle.trip.trip_id] = (vehicle.position.latitude, vehicle.position.longitude)
+    return positions
+
+
+def parse_trip_updates(feed, positions=None) -> pd.DataFrame:
+    """
+    Builds the parse_vehicle_activity frame from a TripUpdates feed, one row
+    per stop still ahead of each train as of the feed's timestamp.
+
+    Trains missing from positions are placed at their next stop. Stop ids
+    that are not Caltrain platforms are skipped, like the Siri join does.
+    """
+    stations = get_stations()
+    # Looked up by the feed's string stop ids, so no row is converted twice
+    station_names = {str(stop): stations.names[i] for stop, i in stations.station_of_stop.items()}
+    positions = positions or {}
+    skipped = (
+        gtfs_realtime_pb2.TripUpdate.StopTimeUpdate.SKIPPED,
+        gtfs_realtime_pb2.TripUpdate.StopTimeUpdate.NO_DATA,
+    )
+    feed_time = feed.header.timestamp
+
+    stop_name, stop_id, stops_away = [], [], []
+    aimed_arrival, expected_arrival, aimed_departure = [], [], []
+
+    calls_per_train = []
+    train_id, origin, origin_id, direction, line_type, destination = [], [], [], [], [], []
+    train_longitude, train_latitude = [], []
+
+    for entity in feed.entity:
+        if not entity.HasField("trip_update"):
+            continue
+        trip_update = entity.trip_update
+        updates = [update for update in trip_update.stop_time_update if update.stop_id in station_names]
+        if not updates:
+            continue
+
+        calls = 0
+        for update in updates:
+            if update.schedule_relationship in skipped:
+                continue
+            # Unset times read as 0; the first stop has no arrival, the last no departure
+            arrival, departure = update.arrival, update.departure
+            arrival_time, departure_time = arrival.time, departure.time
+            if not arrival_time:
+                arrival, arrival_time = departure, departure_time
+            if not departure_time:
+                departure, departure_time = arrival, arrival_time
+            if not arrival_time or max(arrival_time, departure_time) < feed_time:
+                continue
+            stop_name.append(station_names[update.stop_id])
+            stop_id.append(int(update.stop_id))
+            # Feeds carry either the scheduled time or the delay from it
+            aimed_arrival.append(arrival.scheduled_time or arrival_time - arrival.delay)
+            expected_arrival.append(arrival_time)
+            aimed_departure.append(departure.scheduled_time or departure_time - departure.delay)
+            calls += 1
+        if not calls:
+            continue
+        # As in Siri, the next stop and the one after it are both 0 stops away
+        stops_away.append(0)
+        stops_away.extend(range(calls - 1))
+
+        trip = trip_update.trip
+        first_stop, last_stop = updates[0].stop_id, updates[-1].stop_id
+        calls_per_train.append(calls)
+        train_id.append(trip.trip_id)
+        origin.append(station_names[first_stop])
+        origin_id.append(int(first_stop))
+        if trip.HasField("direction_id"):
+            direction.append(DIRECTIONS.get(trip.direction_id, ""))
+        else:
+            # Northbound platforms have odd stop ids
+            direction.append("NB" if int(first_stop) % 2 else "SB")
+        line_type.append(trip.route_id)
+        destination.append(station_names[last_stop])
+
+        latitude, longitude = positions.get(trip.trip_id, stations.coordinates[stop_name[-calls]])
+        train_latitude.append(latitude)
+        train_longitude.append(longitude)
+
+    counts = np.asarray(calls_per_train, dtype="int64")
+
+    def per_train(values, dtype):
+        return np.repeat(np.asarray(values, dtype=dtype), counts)
+
+    return pd.DataFrame(
+        {
+            "stop_name": np.asarray(stop_name, dtype=object),
+            "stop_id": np.asarray(stop_id, dtype="int64").astype("float64"),
+            "aimed_arrival_time": np.asarray(aimed_arrival, dtype="int64"),
+            "expected_arrival_time": np.asarray(expected_arrival, dtype="int64"),
+            "AimedDepartureTime": np.asarray(aimed_departure, dtype="int64"),
+            "id": per_train(train_id, object),
+            "origin": per_train(origin, object),
+            "origin_id": per_train(origin_id, "int64").astype("float64"),
+            "direction": per_train(direction, object),
+            "line_type": per_train(line_type, object),
+            "destination": per_train(destination, object),
+            "train_longitude": per_train(train_longitude, "float64"),
+            "train_latitude": per_train(train_latitude, "float64"),
+            "stops_away": np.asarray(stops_away, dtype="int64"),
+        },
+        columns=VEHICLE_COLUMNS,
+    )
+
+
+def feed_timestamp(feed) -> str:
+    # The format of the Siri ResponseTimestamp the live view shows
+    return datetime.datetime.fromtimestamp(feed.header.timestamp, pytz.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def fetch_gtfs_rt(api_key: str) -> Snapshot:
+    """
+    Fetches 511's Caltrain TripUpdates and VehiclePositions. The snapshot is
+    shaped like fetch_vehicle_monitoring's, with the locate_trains frame as
+    payload, or None when no train has stops ahead.
+    """
+    positions = CLIENT.get_parsed(
+        VEHICLE_POSITIONS_URL.format(api_key=api_key), "511-vehicle-positions",
+        lambda response: vehicle_positions(decode_feed(response.content)),
+    )
+    feed = CLIENT.get_parsed(
+        TRIP_UPDATES_URL.format(api_key=api_key), "511-trip-updates", lambda response: decode_feed(response.content)
+    )
+    with METRICS.span("parse", source="gtfs-rt"):
+        vehicles = parse_trip_updates(feed, positions)
+    trains = locate_trains(vehicles) if len(vehicles) else None
+    return Snapshot(trains, datetime.datetime.now(pytz.utc), feed_timestamp(feed))
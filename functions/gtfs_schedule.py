@@ -0,0 +1,253 @@
+import csv
+import datetime
+import io
+import threading
+import zipfile
+
+import numpy as np
+import pandas as pd
+import pytz
+
+from functions.timemodel import gtfs_day_start, now_epoch, service_day
+
+DIRECTIONS = {"northbound": 0, "southbound": 1}
+DIRECTION_LABELS = ["NB", "SB"]
+WEEKDAYS = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+
+
+def read_gtfs_table(archive, name):
+    with archive.open(name) as f:
+        return list(csv.DictReader(io.TextIOWrapper(f, encoding="utf-8-sig")))
+
+
+def gtfs_seconds(value):
+    """
+    Converts a GTFS HH:MM:SS time, which can run past 24:00:00, to seconds
+    since the start of the service day
+    """
+    hours, minutes, seconds = value.strip().split(":")
+    return int(hours) * 3600 + int(minutes) * 60 + int(seconds)
+
+
+class GtfsTimetable:
+    """
+    Caltrain's static GTFS timetable held as flat NumPy arrays.
+
+    Departures are grouped by (station, direction) and sorted by time, so
+    finding the next trains from a station is a binary search. Stations are
+    the rows of stop_ids.csv; GTFS platform ids are matched against its
+    stop1/stop2 columns.
+    """
+
+    def __init__(self, stations, trip_numbers, trip_directions, trip_services, service_ids,
+                 calendar, calendar_dates, board_offsets, board_times, board_trips, visit_keys, visit_times):
+        self.stations = stations
+        self.station_index = {name: i for i, name in enumerate(stations)}
+        self.trip_numbers = trip_numbers
+        self.trip_directions = trip_directions
+        self.trip_services = trip_services
+        self.service_ids = service_ids
+        self.calendar = calendar
+        self.calendar_dates = calendar_dates
+        # Departures for board b are board_times[board_offsets[b]:board_offsets[b + 1]]
+        self.board_offsets = board_offsets
+        self.board_times = board_times
+        self.board_trips = board_trips
+        # Every (trip, station) call as trip * len(stations) + station, sorted
+        self.visit_keys = visit_keys
+        self.visit_times = visit_times
+        self._active = {}
+
+    @classmethod
+    def from_zip(cls, path, stop_ids):
+        """
+        Loads stops.txt, trips.txt, stop_times.txt, calendar.txt and, when
+        present, calendar_dates.txt from a GTFS zip. stop_ids is the
+        stop_ids.csv frame.
+        """
+        stations = stop_ids["stopname"].tolist()
+        station_of_stop = {}
+        for i, row in stop_ids.iterrows():
+            station_of_stop[str(row["stop1"])] = i
+            station_of_stop[str(row["stop2"])] = i
+
+        with zipfile.ZipFile(path) as archive:
+            names = set(archive.namelist())
+            stops = read_gtfs_table(archive, "stops.txt")
+            trips = read_gtfs_table(archive, "trips.txt")
+            stop_times = read_gtfs_table(archive, "stop_times.txt")
+            calendar_rows = read_gtfs_table(archive, "calendar.txt")
+            calendar_date_rows = (
+                read_gtfs_table(archive, "calendar_dates.txt") if "calendar_dates.txt" in names else []
+            )
+
+        # Platforms missing from stop_ids.csv take the station of a sibling platform
+        parents = {row["stop_id"]: row.get("parent_station", "") for row in stops}
+        station_of_parent = {
+            parents[stop]: station for stop, station in station_of_stop.items() if parents.get(stop)
+        }
+        for stop, parent in parents.items():
+            if stop not in station_of_stop and parent in station_of_parent:
+                station_of_stop[stop] = station_of_parent[parent]
+
+        service_ids = sorted({row["service_id"] for row in trips})
+        service_index = {service: i for i, service in enumerate(service_ids)}
+        trip_index = {row["trip_id"]: i for i, row in enumerate(trips)}
+        trip_numbers = np.array([row.get("trip_short_name") or row["trip_id"] for row in trips], dtype=object)
+        trip_directions = np.array([int(row.get("direction_id") or 0) for row in trips], dtype="int8")
+        trip_services = np.array([service_index[row["service_id"]] for row in trips], dtype="int32")
+
+        calendar = {row["service_id"]: row for row in calendar_rows}
+        calendar_dates = {}
+        for row in calendar_date_rows:
+            calendar_dates.setdefault(row["date"], []).append((row["service_id"], row["exception_type"]))
+
+        call_trip, call_station, call_time, call_sequence = [], [], [], []
+        for row in stop_times:
+            station = station_of_stop.get(row["stop_id"])
+            trip = trip_index.get(row["trip_id"])
+            if station is None or trip is None:
+                continue
+            call_trip.append(trip)
+            call_station.append(station)
+            call_time.append(gtfs_seconds(row["departure_time"] or row["arrival_time"]))
+            call_sequence.append(int(row["stop_sequence"]))
+
+        call_trip = np.array(call_trip, dtype="int32")
+        call_station = np.array(call_station, dtype="int32")
+        call_time = np.array(call_time, dtype="int32")
+        call_sequence = np.array(call_sequence, dtype="int32")
+
+        # A train doesn't depart from the last stop of its trip
+        last_sequence = np.full(len(trips), -1, dtype="int32")
+        np.maximum.at(last_sequence, call_trip, call_sequence)
+        departs = call_sequence != last_sequence[call_trip]
+
+        boards = call_station[departs] * 2 + trip_directions[call_trip[departs]]
+        order = np.lexsort((call_time[departs], boards))
+        board_offsets = np.searchsorted(boards[order], np.arange(len(stations) * 2 + 1)).astype("int32")
+
+        visit_keys = call_trip.astype("int64") * len(stations) + call_station
+        visit_order = np.argsort(visit_keys, kind="stable")
+
+        return cls(
+            stations=stations,
+            trip_numbers=trip_numbers,
+            trip_directions=trip_directions,
+            trip_services=trip_services,
+            service_ids=service_ids,
+            calendar=calendar,
+            calendar_dates=calendar_dates,
+            board_offsets=board_offsets,
+            board_times=call_time[departs][order],
+            board_trips=call_trip[departs][order],
+            visit_keys=visit_keys[visit_order],
+            visit_times=call_time[visit_order],
+        )
+
+    def active_services(self, day):
+        """
+        Returns a boolean array over service_ids for the services running on day
+        """
+        if day not in self._active:
+            key = day.strftime("%Y%m%d")
+            weekday = WEEKDAYS[day.weekday()]
+            active = np.zeros(len(self.service_ids), dtype=bool)
+            for i, service in enumerate(self.service_ids):
+                row = self.calendar.get(service)
+                if row and row["start_date"] <= key <= row["end_date"] and row[weekday] == "1":
+                    active[i] = True
+            for service, exception_type in self.calendar_dates.get(key, []):
+                if service in self.service_ids:
+                    active[self.service_ids.index(service)] = exception_type == "1"
+            self._active[day] = active
+        return self._active[day]
+
+    def service_span(self, day):
+        """
+        Returns (first, last) call in seconds into service day `day`, or
+        None when nothing runs that day
+        """
+        trips = self.visit_keys // len(self.stations)
+        times = self.visit_times[self.active_services(day)[self.trip_services[trips]]]
+        if not len(times):
+            return None
+        return int(times.min()), int(times.max())
+
+    def arrival_at(self, trips, station):
+        """
+        Returns the time each trip calls at station, or -1 where it doesn't
+        """
+        keys = trips.astype("int64") * len(self.stations) + station
+        pos = np.searchsorted(self.visit_keys, keys)
+        pos = np.minimum(pos, len(self.visit_keys) - 1)
+        found = self.visit_keys[pos] == keys
+        return np.where(found, self.visit_times[pos], -1)
+
+    def next_departures(self, direction, station, day, after, n, destination=None):
+        """
+        Returns (times, trips) for the next n departures at or after `after`
+        seconds into service day `day`, optionally only trains that go on to
+        call at destination
+        """
+        board = self.station_index[station] * 2 + direction
+        lo, hi = self.board_offsets[board], self.board_offsets[board + 1]
+        start = lo + np.searchsorted(self.board_times[lo:hi], after)
+
+        times = self.board_times[start:hi]
+        trips = self.board_trips[start:hi]
+        keep = self.active_services(day)[self.trip_services[trips]]
+        if destination is not None:
+            keep &= self.arrival_at(trips, self.station_index[destination]) > times
+        return times[keep][:n], trips[keep][:n]
+
+    def departures(self, datadirection, chosen_station, chosen_destination=None, now=None, n=None):
+        """
+        Returns the same Train #/Direction/departs/ride frame as
+        ct_functions.schedule_departures, departs in epoch seconds
+        """
+        now = now_epoch() if now is None else now
+        direction = DIRECTIONS[datadirection]
+
+        # Trains after midnight belong to the previous day's service
+        today = service_day(datetime.datetime.fromtimestamp(now, pytz.utc))
+        departs, times, trips = [], [], []
+        for day in [today, today + datetime.timedelta(days=1)]:
+            start = gtfs_day_start(day)
+            day_times, day_trips = self.next_departures(direction, chosen_station, day, now - start, n,
+                                                        chosen_destination)
+            departs.append(start + day_times.astype("int64"))
+            times.append(day_times)
+            trips.append(day_trips)
+        departs = np.concatenate(departs)
+        times = np.concatenate(times)
+        trips = np.concatenate(trips)
+        order = np.argsort(departs, kind="stable")[:n]
+
+        df = pd.DataFrame(
+            {
+                "Train #": self.trip_numbers[trips[order]],
+                "Direction": DIRECTION_LABELS[direction],
+                "departs": departs[order],
+            },
+            columns=["Train #", "Direction", "departs"],
+        )
+        if chosen_destination is not None:
+            # Both in seconds into the trip's service day
+            arrivals = self.arrival_at(trips[order], self.station_index[chosen_destination])
+            df["ride"] = (arrivals - times[order]).astype("int64")
+        return df
+
+
+_TIMETABLES = {}
+_TIMETABLES_LOCK = threading.Lock()
+
+
+def load_timetable(path, stop_ids):
+    """
+    Returns the timetable for a GTFS zip, loading it once per process
+    """
+    with _TIMETABLES_LOCK:
+        if path not in _TIMETABLES:
+            _TIMETABLES[path] = GtfsTimetable.from_zip(path, stop_ids)
+        return _TIMETABLES[path]
@@ -0,0 +1,122 @@
+import numpy as np
+import pandas as pd
+
+from functions.metrics import METRICS
+from functions.poller import ChangeSet
+from functions.siri import locate_trains, monitored_journeys, parse_journeys, read_vehicle_monitoring
+from functions.stations import get_stations
+
+
+def journey_fingerprint(journey: dict) -> tuple:
+    """
+    Everything create_caltrain_dfs reads from a journey. Two polls with the
+    same fingerprint produce the same rows for that train.
+    """
+    calls = [journey["MonitoredCall"]] + journey["OnwardCalls"]["OnwardCall"]
+    return (
+        journey["VehicleLocation"]["Latitude"],
+        journey["VehicleLocation"]["Longitude"],
+        journey["DirectionRef"],
+        journey["OriginName"],
+        journey["OriginRef"],
+        journey["DestinationName"],
+        journey["PublishedLineName"],
+        tuple(
+            (
+                call["StopPointRef"],
+                call["StopPointName"],
+                call["AimedArrivalTime"],
+                call["ExpectedArrivalTime"],
+                call["AimedDepartureTime"],
+            )
+            for call in calls
+        ),
+    )
+
+
+def assemble_blocks(blocks: list) -> pd.DataFrame:
+    """
+    Joins per-train blocks, in feed order, into the layout locate_trains
+    gives the whole feed: the rows it matched on stop1, then those matched
+    on stop2, each numbered from 0
+    """
+    frame = pd.concat(blocks, ignore_index=True)
+    at_stop2 = frame.pop("at_stop2").to_numpy()
+    frame = frame.iloc[np.argsort(at_stop2, kind="stable")]
+    frame.index = np.concatenate([np.arange(len(at_stop2) - at_stop2.sum()), np.arange(at_stop2.sum())])
+    return frame
+
+
+class IncrementalTrains:
+    """
+    Keeps the located rows of each train keyed by VehicleRef between polls.
+    Each update re-parses and re-measures only the trains whose position,
+    times or calls changed, drops trains that left the feed, and reassembles
+    the frame only when something changed. frame holds the same rows, in
+    the same order and with the same index, as
+    locate_trains(parse_vehicle_activity(data)).
+    """
+
+    def __init__(self, distance_method="ellipsoidal"):
+        self.distance_method = distance_method
+        self.frame = None
+        self.changes = ChangeSet((), (), ())
+        self.updates = 0
+        self._fingerprints = {}
+        self._blocks = {}
+        self._order = []
+
+    def update(self, data: dict) -> ChangeSet:
+        return self.update_journeys(monitored_journeys(data))
+
+    def update_journeys(self, journeys: list) -> ChangeSet:
+        journeys = {journey["VehicleRef"]: journey for journey in journeys}
+        fingerprints = {ref: journey_fingerprint(journey) for ref, journey in journeys.items()}
+
+        new = tuple(ref for ref in fingerprints if ref not in self._fingerprints)
+        updated = tuple(
+            ref for ref in fingerprints if ref in self._fingerprints and fingerprints[ref] != self._fingerprints[ref]
+        )
+        departed = tuple(ref for ref in self._fingerprints if ref not in fingerprints)
+
+        changed = new + updated
+        if changed:
+            with METRICS.span("parse", source="siri"):
+                vehicles = parse_journeys([journeys[ref] for ref in changed])
+            located = locate_trains(vehicles, self.distance_method)
+            # locate_trains lists every row matched on stop1 first. A station
+            # whose two platforms share a stop id is matched in both groups.
+            stop1_rows = np.isin(vehicles["stop_id"].to_numpy(), get_stations().stop1).sum()
+            located["at_stop2"] = np.arange(len(located)) >= stop1_rows
+            blocks = dict(tuple(located.groupby("id", sort=False)))
+            for ref in changed:
+                # A train whose stops are all missing from stop_ids.csv has no rows
+                self._blocks[ref] = blocks.get(ref)
+        for ref in departed:
+            del self._blocks[ref]
+
+        order = list(journeys)
+        if changed or departed or order != self._order:
+            blocks = [self._blocks[ref] for ref in order if self._blocks[ref] is not None]
+            with METRICS.span("merge", step="concat"):
+                self.frame = assemble_blocks(blocks) if blocks else None
+
+        self._fingerprints = fingerprints
+        self._order = order
+        self.changes = ChangeSet(new, updated, departed)
+        self.updates += 1
+        return self.changes
+
+    def parse_response(self, response):
+        """
+        HttpClient parse callback, returning the same (trains, response time)
+        pair as parse_vehicle_monitoring_response
+        """
+        with METRICS.span("decode", source="siri"):
+            journeys, response_time = read_vehicle_monitoring(response.content)
+        if journeys is None:
+            # Every train has left the feed
+            self.update_journeys([])
+            return None, response_time
+        self.update_journeys(journeys)
+        return self.frame, response_time
@@ -0,0 +1,79 @@
+"""
+Between-poll predictions for the live boards.
+
+A snapshot is a minute old by the time the next one arrives. Rather than
+poll more often, interpolate_trains moves the latest snapshot forward to
+the current second: a train that has not reached its next stop by the time
+it was expected there holds that stop at "due" and pushes its later stops
+back by as much, and each train's position is moved along the line toward
+its next stop. Every new snapshot replaces the estimate, so upstream data
+corrects it each poll.
+"""
+import datetime
+import os
+
+import numpy as np
+import pandas as pd
+import pytz
+
+from functions.metrics import METRICS
+from functions.siri import train_distances
+from functions.timemodel import now_epoch
+
+# Seconds between live board refreshes on an otherwise idle page; 0 only
+# refreshes when the page is used
+TICK_SECONDS = float(os.environ.get("CALTRAIN_TICK", 0))
+# "0" shows each snapshot as 511 sent it
+INTERPOLATE = os.environ.get("CALTRAIN_INTERPOLATE", "1") != "0"
+
+
+def next_stops(train_codes: np.ndarray, expected: np.ndarray) -> np.ndarray:
+    """
+    Returns the row of each train's earliest expected call, indexed by
+    train code
+    """
+    order = np.lexsort((expected, train_codes))
+    sorted_codes = train_codes[order]
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = sorted_codes[1:] != sorted_codes[:-1]
+    return order[first]
+
+
+def interpolate_trains(trains: pd.DataFrame, fetched_at, now=None, distance_method="ellipsoidal") -> pd.DataFrame:
+    """
+    Returns a copy of a locate_trains frame fetched at fetched_at with the
+    expected arrivals, train positions and distances estimated as of now
+    """
+    now = now or datetime.datetime.now(pytz.utc)
+    trains = trains.copy()
+    if trains.empty:
+        return trains
+
+    with METRICS.span("interpolate"):
+        train_codes, _ = pd.factorize(trains["id"])
+        expected = trains["expected_arrival_time"].to_numpy()
+        now_s = now_epoch(now)
+        fetched_s = now_epoch(fetched_at)
+
+        next_rows = next_stops(train_codes, expected)
+        next_eta = expected[next_rows]
+
+        # A train still short of a stop it was due at is at least that late everywhere after it
+        overdue = np.maximum(now_s - next_eta, 0)
+        trains["expected_arrival_time"] = expected + overdue[train_codes]
+
+        # Share of the way from the reported position to the next stop covered since the fetch
+        remaining = next_eta - fetched_s
+        with np.errstate(divide="ignore", invalid="ignore"):
+            covered = np.where(remaining > 0, (now_s - fetched_s) / remaining, 1.0)
+        covered = np.clip(covered, 0.0, 1.0)
+
+        latitude = trains["train_latitude"].to_numpy()[next_rows]
+        longitude = trains["train_longitude"].to_numpy()[next_rows]
+        latitude = latitude + covered * (trains["lat"].to_numpy()[next_rows] - latitude)
+        longitude = longitude + covered * (trains["lon"].to_numpy()[next_rows] - longitude)
+        trains["train_latitude"] = latitude[train_codes]
+        trains["train_longitude"] = longitude[train_codes]
+
+    trains["distance"] = train_distances(trains, distance_method)
+    return trains
@@ -0,0 +1,140 @@
+"""
+Origin-destination search over every train's calls.
+
+A JourneyIndex holds each call as integers: the train's code, the
+station's position in stop_ids.csv and the time. Calls are sorted by
+station and time, so the trains leaving a station after a given time are
+one binary search away, and each (train, station) pair is a sorted key, so
+whether those trains go on to a destination, and when they get there, is
+one more vectorized search. Built from the scraped timetable or from a
+live snapshot.
+"""
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+
+from functions.stations import get_stations
+from functions.timemodel import service_seconds
+
+
+class Trips(NamedTuple):
+    """
+    Trains from an origin that call at a destination later, in departure
+    order, with their times in the index's unit
+    """
+
+    trains: np.ndarray
+    departs: np.ndarray
+    arrives: np.ndarray
+
+    @property
+    def ride(self) -> np.ndarray:
+        return self.arrives - self.departs
+
+    def __len__(self):
+        return len(self.trains)
+
+
+class JourneyIndex:
+    """
+    Every call of every train, indexed for origin-destination queries.
+    trains labels the train codes used in call_train; stations are
+    positions in stop_ids.csv.
+    """
+
+    def __init__(self, trains, call_train, call_station, call_time):
+        self.stations = get_stations()
+        n_stations = len(self.stations.names)
+        self.trains = np.asarray(trains, dtype=object)
+        call_train = np.asarray(call_train, dtype="int64")
+        call_station = np.asarray(call_station, dtype="int64")
+        call_time = np.asarray(call_time, dtype="int64")
+
+        # Calls at station s are station_train/station_time[offsets[s]:offsets[s + 1]], by time
+        order = np.lexsort((call_time, call_station))
+        self.station_train = call_train[order]
+        self.station_time = call_time[order]
+        self.offsets = np.searchsorted(call_station[order], np.arange(n_stations + 1))
+
+        # Every (train, station) call as train * n_stations + station, sorted
+        keys = call_train * n_stations + call_station
+        key_order = np.argsort(keys, kind="stable")
+        self.visit_keys = keys[key_order]
+        self.visit_times = call_time[key_order]
+
+    @classmethod
+    def from_trains(cls, trains: pd.DataFrame) -> "JourneyIndex":
+        """
+        Indexes a locate_trains frame by expected arrival, in epoch seconds
+        """
+        train_codes, train_ids = pd.factorize(trains["id"])
+        stations = get_stations()
+        return cls(
+            train_ids,
+            train_codes,
+            trains["stopname"].map(stations.order).to_numpy(),
+            trains["expected_arrival_time"].to_numpy(),
+        )
+
+    @classmethod
+    def from_tables(cls, tables: dict) -> "JourneyIndex":
+        """
+        Indexes the scraped timetable's direction tables (station rows,
+        one column per train, "--" where it doesn't stop) in seconds into
+        the service day
+        """
+        order = get_stations().order
+        trains, call_train, call_station, call_time = [], [], [], []
+        for table in tables.values():
+            # Rows that aren't stations, NaN labels included, map to -1
+            stations = np.array([order.get(name, -1) if isinstance(name, str) else -1 for name in table.index])
+            for train, times in table.items():
+                # Short rows leave unnamed columns
+                if not isinstance(train, str):
+                    continue
+                code = len(trains)
+                trains.append(train)
+                for station, label in zip(stations, times):
+                    # "--" where a train doesn't stop, None or NaN where a short row ended
+                    if station >= 0 and isinstance(label, str) and label != "--":
+                        call_train.append(code)
+                        call_station.append(station)
+                        call_time.append(service_seconds(label))
+        return cls(trains, call_train, call_station, call_time)
+
+    def time_at(self, train_codes: np.ndarray, station: int) -> np.ndarray:
+        """
+        Each train's time at station, or -1 where it doesn't call there
+        """
+        if not len(self.visit_keys):
+            return np.full(len(train_codes), -1, dtype="int64")
+        keys = train_codes * len(self.stations.names) + station
+        pos = np.minimum(np.searchsorted(self.visit_keys, keys), len(self.visit_keys) - 1)
+        return np.where(self.visit_keys[pos] == keys, self.visit_times[pos], -1)
+
+    def trips(self, origin: str, destination: str, after=None, n=None) -> Trips:
+        """
+        The next n trains (all by default) calling at origin at or after
+        `after` and at destination later on
+        """
+        o = self.stations.order[origin]
+        d = self.stations.order[destination]
+        lo, hi = self.offsets[o], self.offsets[o + 1]
+        if after is not None:
+            lo += np.searchsorted(self.station_time[lo:hi], after)
+        departs = self.station_time[lo:hi]
+        train_codes = self.station_train[lo:hi]
+        arrives = self.time_at(train_codes, d)
+        keep = np.flatnonzero(arrives > departs)[:n]
+        return Trips(self.trains[train_codes[keep]], departs[keep], arrives[keep])
+
+    def serving(self, origin: str, destination: str) -> set:
+        """
+        Every train that calls at origin and then destination
+        """
+        return set(self.trips(origin, destination).trains)
+
+
+def ride_label(seconds) -> str:
+    return f"{int(seconds) // 60} min"
@@ -0,0 +1,373 @@
+"""
+Kiosk mode for a wall monitor: the live northbound and southbound boards
+of one station as a static HTML page, kept current over Server-Sent Events.
+
+Streamlit reruns the whole app on every refresh and the browser redraws the
+page. Here the boards are built from the shared BoardCache on one thread,
+compared with what the screens already show, and only the cells that
+changed are pushed: a countdown ticking over is a few dozen bytes. A board
+whose trains changed is sent whole as HTML. The page itself has no
+dependencies beyond a browser, so it can run full-screen on the Pi.
+
+Run from the repository root:
+    CALTRAIN_511_KEY=... python -m functions.kiosk --station "Redwood City"
+    python -m functions.kiosk --station "Palo Alto" --destination "San Francisco" --port 8080
+"""
+import argparse
+import datetime
+import html
+import json
+import logging
+import os
+import queue
+import threading
+from typing import NamedTuple, Optional
+
+import pytz
+
+from functions.boards import BoardCache
+from functions.interpolate import INTERPOLATE
+from functions.metrics import METRICS, serve_metrics
+from functions.stations import get_stations
+from functions.timemodel import PACIFIC
+
+logger = logging.getLogger(__name__)
+
+# Seconds between checks for changed cells; nothing is sent when none changed
+REFRESH_SECONDS = float(os.environ.get("CALTRAIN_KIOSK_REFRESH", 5))
+# A comment line this often lets the server notice screens that went away
+KEEPALIVE_SECONDS = 30
+# Older snapshots are treated as the API being down, as in the app
+MAX_SNAPSHOT_AGE = 5 * 60
+# Destinations every train in a direction reaches
+TERMINALS = ["San Francisco", "Tamien", "San Jose Diridon"]
+DIRECTIONS = [("nb", "NB", "Northbound"), ("sb", "SB", "Southbound")]
+
+
+class BoardView(NamedTuple):
+    """
+    A board's text as shown: train labels across, row labels down
+    """
+
+    columns: tuple
+    rows: tuple
+    cells: tuple
+
+    @classmethod
+    def from_board(cls, board) -> Optional["BoardView"]:
+        if board is None:
+            return None
+        return cls(tuple(str(c) for c in board.columns), tuple(str(r) for r in board.index),
+                   tuple(tuple(str(v) for v in row) for row in board.itertuples(index=False)))
+
+    def html(self, key) -> str:
+        """
+        The board as a table whose cells have ids the updates refer to
+        """
+        head = "".join(f'<th id="{key}-h-{j}">{html.escape(c)}</th>' for j, c in enumerate(self.columns))
+        body = "".join(
+            f"<tr><th>{html.escape(label)}</th>"
+            + "".join(f'<td id="{key}-{i}-{j}">{html.escape(value)}</td>' for j, value in enumerate(row))
+            + "</tr>"
+            for i, (label, row) in enumerate(zip(self.rows, self.cells))
+        )
+        return f"<table><thead><tr><th></th>{head}</tr></thead><tbody>{body}</tbody></table>"
+
+    def texts(self, key) -> dict:
+        texts = {f"{key}-h-{j}": c for j, c in enumerate(self.columns)}
+        for i, row in enumerate(self.cells):
+            texts.update((f"{key}-{i}-{j}", value) for j, value in enumerate(row))
+        return texts
+
+
+def board_html(key, view, label):
+    if view is None:
+        return f'<p class="none">No trains {label.lower()}.</p>'
+    return view.html(key)
+
+
+def sse(event, data) -> bytes:
+    return f"event: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n".encode("utf-8")
+
+
+# What a screen that has loaded nothing shows
+BLANK_STATE = {"text": {}, "nb": False, "sb": False}
+
+
+def diff_messages(old, new) -> list:
+    """
+    SSE messages turning page state old into new: changed text in a
+    "cells" message, and a "board" message with the HTML of each board
+    whose trains or rows changed
+    """
+    messages = []
+    cells = {key: text for key, text in new["text"].items() if old["text"].get(key) != text}
+    for key, _, label in DIRECTIONS:
+        before, after = old[key], new[key]
+        if before == after:
+            continue
+        same_shape = (isinstance(before, BoardView) and isinstance(after, BoardView)
+                      and len(before.columns) == len(after.columns) and before.rows == after.rows)
+        changed = {}
+        if same_shape:
+            shown = before.texts(key)
+            changed = {cell: text for cell, text in after.texts(key).items() if shown[cell] != text}
+        # A board that mostly changed is smaller sent whole
+        if not same_shape or len(changed) * 2 > len(after.columns) * (len(after.rows) + 1):
+            messages.append(sse("board", {"id": key, "html": board_html(key, after, label)}))
+        else:
+            cells.update(changed)
+    if cells:
+        messages.insert(0, sse("cells", cells))
+    return messages
+
+
+PAGE = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>Caltrain Platform - {station}</title>
+<meta name="viewport" content="width=device-width, initial-scale=1">
+<style>
+body {{ background: #0e1117; color: #fafafa; font-family: sans-serif; margin: 1em; }}
+h2 {{ margin: 0.6em 0 0.3em; font-size: 1.3em; }}
+#status {{ font-size: 0.9em; }}
+table {{ border-collapse: collapse; width: 100%; font-size: 0.85em; }}
+th, td {{ border: 1px solid #333; padding: 0.3em 0.5em; text-align: left; }}
+thead th {{ background: #1c1f26; }}
+.none {{ color: #8ab4f8; }}
+</style></head>
+<body data-version="{version}">
+<div id="status">{status}</div>
+<h2 id="nb-title">{nb_title}</h2><div id="nb">{nb}</div>
+<h2 id="sb-title">{sb_title}</h2><div id="sb">{sb}</div>
+<script>
+var events = new EventSource("/events?since=" + document.body.dataset.version);
+events.addEventListener("cells", function (e) {{
+  var cells = JSON.parse(e.data);
+  for (var id in cells) {{
+    var cell = document.getElementById(id);
+    if (cell) cell.textContent = cells[id];
+  }}
+}});
+events.addEventListener("board", function (e) {{
+  var board = JSON.parse(e.data);
+  document.getElementById(board.id).innerHTML = board.html;
+}});
+</script>
+</body></html>
+"""
+
+
+class Kiosk:
+    """
+    Builds one station's page state from the poller's latest snapshot and
+    pushes the differences to every connected screen
+    """
+
+    def __init__(self, poller, station, destination=None, board_cache=None, policy=None, refresh=REFRESH_SECONDS,
+                 max_age=MAX_SNAPSHOT_AGE):
+        self.poller = poller
+        # The AdaptivePolicy polling faster while trains near the station
+        self.policy = policy
+        self.station = station
+        self.destination = destination if destination != station else None
+        self.board_cache = board_cache or BoardCache(resolution=60, interpolate=INTERPOLATE)
+        self.refresh = refresh
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._subscribers = []
+        self.version = 0
+        self.state = self.page_state()
+        self._stop = threading.Event()
+
+    def page_state(self, now=None) -> dict:
+        """
+        {"text": {element id: text}, "nb": BoardView or None, "sb": ...}
+        """
+        now = now or datetime.datetime.now(pytz.utc)
+        if self.policy is not None:
+            self.policy.watch(self.station, now)
+        clock = now.astimezone(PACIFIC).strftime("%I:%M %p")
+        state = {"text": {f"{key}-title": f"{label} Trains - {clock}" for key, _, label in DIRECTIONS},
+                 "nb": None, "sb": None}
+
+        snapshot = self.poller.latest()
+        if snapshot is None or snapshot.payload is None or \
+                snapshot.age(now) >= max(self.max_age, self.poller.delay + self.poller.interval):
+            state["text"]["status"] = "❌ No live data from the 511 API right now"
+            return state
+
+        api_time = datetime.datetime.strptime(snapshot.response_time, "%Y-%m-%dT%H:%M:%SZ") \
+            .replace(tzinfo=pytz.utc).astimezone(PACIFIC)
+        if abs((api_time - now).total_seconds()) < 90:
+            state["text"]["status"] = f"✅ Caltrain API is up 🚂 (API Time: {api_time.strftime('%I:%M %p')})"
+        else:
+            state["text"]["status"] = f"❌ Caltrain API Time is off by {api_time - now} minutes"
+
+        boards = self.board_cache.boards(snapshot, now)
+        trains = None
+        if self.destination is not None and self.destination not in TERMINALS:
+            trains = boards.journeys.serving(self.station, self.destination)
+        show = None
+        if self.destination is not None:
+            show = "NB" if get_stations().is_northbound(self.station, self.destination) else "SB"
+        for key, direction, _ in DIRECTIONS:
+            if show is None or show == direction:
+                state[key] = BoardView.from_board(boards.board(self.station, direction, trains))
+        return state
+
+    def page(self) -> bytes:
+        with self._lock:
+            state, version = self.state, self.version
+        return PAGE.format(
+            station=html.escape(self.station),
+            version=version,
+            status=html.escape(state["text"]["status"]),
+            nb_title=html.escape(state["text"]["nb-title"]),
+            sb_title=html.escape(state["text"]["sb-title"]),
+            nb=board_html("nb", state["nb"], "Northbound"),
+            sb=board_html("sb", state["sb"], "Southbound"),
+        ).encode("utf-8")
+
+    def subscribe(self, since=None) -> queue.Queue:
+        """
+        A queue of SSE messages for one screen, starting with what changed
+        since the page version it loaded
+        """
+        subscriber = queue.Queue()
+        with self._lock:
+            if since != self.version:
+                for message in diff_messages(BLANK_STATE, self.state):
+                    subscriber.put(message)
+            self._subscribers.append(subscriber)
+        METRICS.gauge("kiosk_screens", len(self._subscribers))
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            if subscriber in self._subscribers:
+                self._subscribers.remove(subscriber)
+        METRICS.gauge("kiosk_screens", len(self._subscribers))
+
+    def update(self, now=None) -> list:
+        """
+        Rebuilds the page state and pushes what changed; returns the messages
+        """
+        with METRICS.span("format", view="kiosk"):
+            state = self.page_state(now)
+        with self._lock:
+            messages = diff_messages(self.state, state)
+            if messages:
+                self.state = state
+                self.version += 1
+                for subscriber in self._subscribers:
+                    for message in messages:
+                        subscriber.put(message)
+        if messages:
+            METRICS.count("kiosk_updates_total")
+            METRICS.count("kiosk_update_bytes_total", sum(len(m) for m in messages))
+        return messages
+
+    def run(self):
+        while not self._stop.is_set():
+            try:
+                self.update()
+            except Exception:
+                logger.exception("Kiosk update failed")
+            self._stop.wait(self.refresh)
+
+    def start(self) -> "Kiosk":
+        threading.Thread(target=self.run, name="kiosk", daemon=True).start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+
+def serve_kiosk(kiosk, port=8502, host="0.0.0.0"):
+    """
+    Serves the page at / and its updates at /events, blocking
+    """
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    from urllib.parse import parse_qs, urlsplit
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlsplit(self.path)
+            if url.path == "/":
+                self.send_page()
+            elif url.path == "/events":
+                since = parse_qs(url.query).get("since", [""])[0]
+                self.send_events(int(since) if since.isdigit() else None)
+            else:
+                self.send_error(404)
+
+        def send_page(self):
+            body = kiosk.page()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def send_events(self, since):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Cache-Control", "no-cache")
+            self.end_headers()
+            subscriber = kiosk.subscribe(since)
+            try:
+                while True:
+                    try:
+                        message = subscriber.get(timeout=KEEPALIVE_SECONDS)
+                    except queue.Empty:
+                        message = b": keepalive\n\n"
+                    self.wfile.write(message)
+                    self.wfile.flush()
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+            finally:
+                kiosk.unsubscribe(subscriber)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    logger.info("Serving the %s kiosk on port %s", kiosk.station, port)
+    server.serve_forever()
+
+
+def main():
+    from functions.delay_store import format_typical_delay, open_delay_store
+    from functions.poller import vehicle_poller
+    from functions.polling import live_policy
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--station", default="Redwood City")
+    parser.add_argument("--destination", help="Only show trains going on to this station")
+    parser.add_argument("--port", type=int, default=8502)
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--refresh", type=float, default=REFRESH_SECONDS, help="Seconds between checks for changes")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    store = open_delay_store()
+
+    def typical_delay(trains, station):
+        if store is None:
+            return None
+        return format_typical_delay(store.typical_delays(trains["id"].unique(), station), trains["id"])
+
+    policy = live_policy()
+    if policy is not None:
+        policy.watch(args.station)
+    poller = vehicle_poller(os.environ["CALTRAIN_511_KEY"], store, policy).start()
+    poller.wait(10)
+
+    serve_metrics()
+    board_cache = BoardCache(typical_delay, resolution=60, interpolate=INTERPOLATE)
+    kiosk = Kiosk(poller, args.station, args.destination, board_cache, policy, refresh=args.refresh).start()
+    serve_kiosk(kiosk, args.port, args.host)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+"""
+Per-stage timings and counters for the app, served as Prometheus text.
+
+Stages are timed with METRICS.span("parse") around the code that does the
+work, on the poller thread or in a rerun alike. Collectors registered with
+add_collector are read at scrape time, for values that already live
+somewhere else (the HttpClient's tallies, the age of the latest snapshot).
+
+Off unless CALTRAIN_METRICS=1 or CALTRAIN_METRICS_PORT is set. When off, a
+span is a shared no-op context manager and a count returns straight away.
+"""
+import contextlib
+import logging
+import os
+import threading
+import time
+from typing import NamedTuple
+
+logger = logging.getLogger(__name__)
+
+# /metrics is served on this port when set
+METRICS_PORT = os.environ.get("CALTRAIN_METRICS_PORT")
+METRICS_ENABLED = os.environ.get("CALTRAIN_METRICS") == "1" or bool(METRICS_PORT)
+
+PREFIX = "caltrain_"
+
+_NO_SPAN = contextlib.nullcontext()
+
+
+class Sample(NamedTuple):
+    """
+    One value a collector reports, kind being "counter" or "gauge"
+    """
+
+    name: str
+    kind: str
+    value: float
+    labels: tuple = ()
+
+
+class StageTimes:
+    __slots__ = ("count", "seconds", "last", "max")
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.last = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        self.count += 1
+        self.seconds += seconds
+        self.last = seconds
+        self.max = max(self.max, seconds)
+
+
+def label_key(labels: dict) -> tuple:
+    return tuple(sorted(labels.items()))
+
+
+def format_labels(labels: tuple) -> str:
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"') for _, value in labels)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(labels, escaped)) + "}"
+
+
+class Metrics:
+    """
+    Stage timings, counters and gauges shared by every thread of the process
+    """
+
+    def __init__(self, enabled=METRICS_ENABLED):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        # (stage, labels) -> StageTimes
+        self._stages = {}
+        # (name, labels) -> value
+        self._counters = {}
+        self._gauges = {}
+        self._collectors = []
+
+    @contextlib.contextmanager
+    def _span(self, stage, labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            key = (stage, label_key(labels))
+            with self._lock:
+                times = self._stages.get(key)
+                if times is None:
+                    times = self._stages[key] = StageTimes()
+                times.add(elapsed)
+
+    def span(self, stage, **labels):
+        """
+        Context manager timing one run of stage
+        """
+        if not self.enabled:
+            return _NO_SPAN
+        return self._span(stage, labels)
+
+    def count(self, name, value=1, **labels):
+        if not self.enabled:
+            return
+        key = (name, label_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def gauge(self, name, value, **labels):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._gauges[name, label_key(labels)] = value
+
+    def add_collector(self, collect):
+        """
+        Registers collect(), which returns Samples when metrics are read
+        """
+        with self._lock:
+            self._collectors.append(collect)
+
+    def samples(self) -> list:
+        with self._lock:
+            samples = [Sample(name, "counter", value, labels) for (name, labels), value in self._counters.items()]
+            samples += [Sample(name, "gauge", value, labels) for (name, labels), value in self._gauges.items()]
+            collectors = list(self._collectors)
+        for collect in collectors:
+            try:
+                samples.extend(collect())
+            except Exception:
+                # A broken collector must not take the endpoint down
+                logger.exception("Metrics collector %r failed", collect)
+        return samples
+
+    def stages(self) -> dict:
+        """
+        Returns {(stage, labels): {count, seconds, mean_ms, last_ms, max_ms}}
+        """
+        with self._lock:
+            return {
+                key: {"count": times.count, "seconds": times.seconds,
+                      "mean_ms": times.seconds / times.count * 1000, "last_ms": times.last * 1000,
+                      "max_ms": times.max * 1000}
+                for key, times in self._stages.items()
+            }
+
+    def render(self) -> str:
+        """
+        The Prometheus text exposition of every stage, counter and gauge
+        """
+        lines = []
+        stages = self.stages()
+        if stages:
+            lines.append(f"# TYPE {PREFIX}stage_seconds summary")
+            for (stage, labels), times in sorted(stages.items()):
+                labels = format_labels((("stage", stage),) + labels)
+                lines.append(f"{PREFIX}stage_seconds_sum{labels} {times['seconds']:.6f}")
+                lines.append(f"{PREFIX}stage_seconds_count{labels} {times['count']}")
+            lines.append(f"# TYPE {PREFIX}stage_seconds_max gauge")
+            for (stage, labels), times in sorted(stages.items()):
+                labels = format_labels((("stage", stage),) + labels)
+                lines.append(f"{PREFIX}stage_seconds_max{labels} {times['max_ms'] / 1000:.6f}")
+
+        by_name = {}
+        for sample in self.samples():
+            by_name.setdefault((sample.name, sample.kind), []).append(sample)
+        for (name, kind), samples in sorted(by_name.items()):
+            name = PREFIX + name
+            lines.append(f"# TYPE {name} {kind}")
+            for sample in samples:
+                lines.append(f"{name}{format_labels(sample.labels)} {sample.value:g}")
+        return "\n".join(lines) + "\n"
+
+
+METRICS = Metrics()
+
+
+def serve_metrics(metrics=METRICS, port=METRICS_PORT, host="0.0.0.0"):
+    """
+    Serves metrics.render() at /metrics from a daemon thread and returns
+    the server, or None when no port is set
+    """
+    if not port:
+        return None
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = metrics.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            # Scrapes would flood the app's log
+            pass
+
+    server = ThreadingHTTPServer((host, int(port)), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    logger.info("Serving metrics on port %s", port)
+    return server
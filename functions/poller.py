@@ -0,0 +1,143 @@
+import datetime
+import logging
+import threading
+from typing import Any, Callable, NamedTuple, Optional
+
+import pytz
+
+logger = logging.getLogger(__name__)
+
+
+class ChangeSet(NamedTuple):
+    """
+    Vehicle refs that appeared, changed or disappeared between two polls
+    """
+
+    new: tuple
+    updated: tuple
+    departed: tuple
+
+    def __bool__(self):
+        return bool(self.new or self.updated or self.departed)
+
+
+class Snapshot(NamedTuple):
+    """
+    One parsed upstream response. Snapshots are shared by every session, so
+    treat the payload as read-only.
+    """
+
+    payload: Any
+    fetched_at: datetime.datetime
+    response_time: Optional[str] = None
+    changes: Optional[ChangeSet] = None
+
+    def age(self, now=None) -> float:
+        """
+        Seconds since the snapshot was fetched
+        """
+        now = now or datetime.datetime.now(pytz.utc)
+        return (now - self.fetched_at).total_seconds()
+
+
+class Poller:
+    """
+    Calls fetch on a background thread every interval seconds and keeps the
+    latest Snapshot it returned. Readers never wait on the network: they get
+    whatever was published last, however stale, while the thread refreshes
+    it. Upstream calls are bounded by the interval no matter how many
+    readers there are.
+
+    fetch returns a Snapshot, or raises to keep the previous one. Failures
+    back off up to max_backoff seconds. schedule, if given, is called with
+    the latest snapshot after each successful poll and returns the seconds
+    to wait instead of interval. retry, if given, is called with the
+    backoff after each failed poll and returns the seconds to wait instead.
+    """
+
+    def __init__(self, fetch: Callable[[], Snapshot], interval: float = 60, max_backoff: float = 600, name="poller",
+                 schedule: Optional[Callable[[Optional[Snapshot]], float]] = None,
+                 retry: Optional[Callable[[float], float]] = None):
+        self.fetch = fetch
+        self.interval = interval
+        self.schedule = schedule
+        self.retry = retry
+        # Seconds the thread is waiting before its next poll
+        self.delay = interval
+        self.max_backoff = max_backoff
+        self.name = name
+        self.failures = 0
+        self._snapshot = None
+        self._published = threading.Condition()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self) -> "Poller":
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def latest(self) -> Optional[Snapshot]:
+        return self._snapshot
+
+    def wait(self, timeout: float) -> Optional[Snapshot]:
+        """
+        Returns the latest snapshot, waiting up to timeout seconds if nothing
+        has been published yet
+        """
+        with self._published:
+            self._published.wait_for(lambda: self._snapshot is not None, timeout)
+        return self._snapshot
+
+    def poll_once(self):
+        try:
+            snapshot = self.fetch()
+        except Exception:
+            self.failures += 1
+            logger.exception("%s fetch failed (%d in a row)", self.name, self.failures)
+            return
+        self.failures = 0
+        with self._published:
+            self._snapshot = snapshot
+            self._published.notify_all()
+
+    def next_delay(self) -> float:
+        if self.failures:
+            backoff = min(self.interval * 2 ** (self.failures - 1), self.max_backoff)
+            return self.retry(backoff) if self.retry is not None else backoff
+        if self.schedule is not None:
+            return self.schedule(self._snapshot)
+        return self.interval
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.poll_once()
+            self.delay = self.next_delay()
+            self._stop.wait(self.delay)
+
+
+def vehicle_poller(api_key, store=None, policy=None, interval=60) -> Poller:
+    """
+    The 511 poller for CALTRAIN_LIVE_SOURCE, not yet started. Every
+    snapshot is written to the delay store if one is given, and policy, an
+    AdaptivePolicy, picks the delay between polls if given.
+    """
+    from functions.delay_store import recording
+    from functions.gtfs_rt import LIVE_SOURCE, fetch_gtfs_rt
+    from functions.incremental import IncrementalTrains
+    from functions.siri import fetch_vehicle_monitoring
+
+    if LIVE_SOURCE == "gtfs-rt":
+        fetch = lambda: fetch_gtfs_rt(api_key)
+    else:
+        # Only trains that changed since the last poll are re-parsed
+        tracker = IncrementalTrains()
+        fetch = lambda: fetch_vehicle_monitoring(api_key, tracker)
+    # Delays are written from the poller thread, never from a rerun
+    fetch = recording(fetch, store)
+    return Poller(fetch, interval=interval, name="511-poller", schedule=policy.after if policy else None,
+                  retry=policy.after_failure if policy else None)
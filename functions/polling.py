@@ -0,0 +1,214 @@
+"""
+How long the 511 poller waits between calls.
+
+AdaptivePolicy polls every fast seconds while a train is a few minutes
+from a station someone is watching, every normal seconds otherwise, and
+only every idle seconds outside service hours. Every poll counts against
+the hourly 511 quota, so fast polling near trains is paid for by slower
+polling between them, and a busy hour waits rather than going over.
+"""
+import collections
+import datetime
+import os
+
+import pytz
+
+from functions.metrics import METRICS
+from functions.timemodel import PACIFIC, gtfs_day_start
+
+# "adaptive" follows the timetable and the trains, "fixed" polls every minute
+POLL_POLICY = os.environ.get("CALTRAIN_POLL_POLICY", "adaptive")
+# 511 allows 60 requests an hour per API key unless the limit was raised
+QUOTA_PER_HOUR = int(os.environ.get("CALTRAIN_511_QUOTA", 60))
+
+# Caltrain's usual first and last calls, in seconds into the service day,
+# used without a GTFS timetable
+DEFAULT_SERVICE_START = 4 * 3600 + 15 * 60
+DEFAULT_SERVICE_END = 25 * 3600 + 45 * 60
+
+
+class HourlyQuota:
+    """
+    The 511 calls made in the last window seconds, held to per_hour over
+    every rolling hour, not just on average
+    """
+
+    def __init__(self, per_hour, window=3600):
+        self.per_hour = per_hour
+        self.window = window
+        self._calls = collections.deque()
+
+    def remaining(self, now) -> int:
+        while self._calls and self._calls[0] <= now - self.window:
+            self._calls.popleft()
+        return self.per_hour - len(self._calls)
+
+    def record(self, calls, at):
+        self._calls.extend([at] * calls)
+
+    def next_slot(self, calls, at) -> float:
+        """
+        The earliest epoch second from `at` on at which `calls` more calls fit
+        in the quota
+        """
+        # Drops the calls that have left the window by then
+        self.remaining(at)
+        excess = len(self._calls) + min(calls, self.per_hour) - self.per_hour
+        if excess <= 0:
+            return at
+        # Wait until enough of the oldest calls leave the window
+        return self._calls[excess - 1] + self.window
+
+
+class ServiceHours:
+    """
+    When trains run, from the GTFS timetable's first and last call of each
+    service day if one is given, otherwise from the default hours. margin
+    seconds either side count as in service too.
+    """
+
+    def __init__(self, timetable=None, start=DEFAULT_SERVICE_START, end=DEFAULT_SERVICE_END, margin=15 * 60):
+        self.timetable = timetable
+        self.start = start
+        self.end = end
+        self.margin = margin
+        self._spans = {}
+
+    def span(self, day):
+        # (start, end) in seconds into the service day, or None without service
+        if day not in self._spans:
+            if self.timetable is not None:
+                self._spans[day] = self.timetable.service_span(day)
+            else:
+                self._spans[day] = (self.start, self.end)
+        return self._spans[day]
+
+    def seconds_until_service(self, now) -> float:
+        """
+        0 while trains run, otherwise the seconds until the next service
+        day starts (looking at most a week ahead)
+        """
+        today = now.astimezone(PACIFIC).date()
+        now = now.timestamp()
+        for offset in range(-1, 8):
+            day = today + datetime.timedelta(days=offset)
+            span = self.span(day)
+            if span is None:
+                continue
+            # Spans are GTFS times, counted from noon minus 12 hours
+            reference = gtfs_day_start(day)
+            start = reference + span[0] - self.margin
+            end = reference + span[1] + self.margin
+            if now < start:
+                return float(start - now)
+            if now <= end:
+                return 0.0
+        return float("inf")
+
+
+def next_arrival(trains, stations, now) -> float:
+    """
+    Seconds until the next train is expected at any of stations, or at any
+    station if there are none, or None without trains
+    """
+    if trains is None or not len(trains):
+        return None
+    expected = trains["expected_arrival_time"].to_numpy()
+    if stations:
+        expected = expected[trains["stopname"].isin(list(stations)).to_numpy()]
+    seconds = expected - now.timestamp()
+    # A train that was due a minute ago may still be pulling in
+    seconds = seconds[seconds > -60]
+    return float(max(seconds.min(), 0.0)) if len(seconds) else None
+
+
+class AdaptivePolicy:
+    """
+    Picks the delay before each poll. calls_per_poll is how many 511
+    requests one poll makes.
+    """
+
+    def __init__(self, service=None, quota_per_hour=QUOTA_PER_HOUR, calls_per_poll=1,
+                 fast=40, normal=90, idle=30 * 60, near=5 * 60, watch_seconds=10 * 60):
+        self.service = service or ServiceHours()
+        self.quota = HourlyQuota(quota_per_hour)
+        self.calls_per_poll = calls_per_poll
+        self.fast = fast
+        self.normal = normal
+        self.idle = idle
+        self.near = near
+        self.watch_seconds = watch_seconds
+        # station -> when a session last showed it
+        self._watched = {}
+
+    def watch(self, station, now=None):
+        """
+        Marks station as on someone's screen; it counts for watch_seconds
+        """
+        self._watched[station] = (now or datetime.datetime.now(pytz.utc)).timestamp()
+
+    def watched(self, now):
+        cutoff = now.timestamp() - self.watch_seconds
+        return [station for station, seen in list(self._watched.items()) if seen >= cutoff]
+
+    def interval(self, now, arrival=None) -> float:
+        """
+        The delay the trains call for, before the quota is applied
+        """
+        until_service = self.service.seconds_until_service(now)
+        if until_service > 0:
+            return min(max(until_service, self.normal), self.idle)
+        if arrival is not None and arrival <= self.near:
+            return self.fast
+        return self.normal
+
+    def next_delay(self, now, arrival=None) -> float:
+        """
+        Counts the poll just made and returns how long to wait for the next
+        """
+        return self._wait(now, self.interval(now, arrival))
+
+    def _wait(self, now, seconds) -> float:
+        # Counts the poll just made and waits seconds, or longer if the quota is spent
+        at = now.timestamp()
+        self.quota.record(self.calls_per_poll, at)
+        delay = self.quota.next_slot(self.calls_per_poll, at + seconds) - at
+        METRICS.gauge("poll_interval_seconds", delay)
+        METRICS.gauge("quota_remaining", self.quota.remaining(at))
+        return delay
+
+    def after(self, snapshot) -> float:
+        """
+        Poller schedule callback: the delay after snapshot was published
+        """
+        now = datetime.datetime.now(pytz.utc)
+        trains = snapshot.payload if snapshot is not None else None
+        return self.next_delay(now, next_arrival(trains, self.watched(now), now))
+
+    def after_failure(self, backoff, now=None) -> float:
+        """
+        Poller retry callback: a failed poll may still have reached 511, so
+        it counts against the quota too, and the next waits at least backoff
+        """
+        return self._wait(now or datetime.datetime.now(pytz.utc), backoff)
+
+
+def live_policy():
+    """
+    The policy CALTRAIN_POLL_POLICY asks for, or None for fixed polling.
+    Service hours come from the GTFS timetable when it is the schedule
+    source.
+    """
+    from functions.ct_functions import GTFS_PATH, SCHEDULE_SOURCE
+    from functions.gtfs_rt import LIVE_SOURCE
+
+    if POLL_POLICY != "adaptive":
+        return None
+    timetable = None
+    if SCHEDULE_SOURCE == "gtfs" and os.path.exists(GTFS_PATH):
+        from functions.gtfs_schedule import load_timetable
+        from functions.stations import get_stations
+
+        timetable = load_timetable(GTFS_PATH, get_stations().frame)
+    # A GTFS-RT poll is two calls, TripUpdates and VehiclePositions
+    return AdaptivePolicy(ServiceHours(timetable), calls_per_poll=2 if LIVE_SOURCE == "gtfs-rt" else 1)
@@ -0,0 +1,87 @@
+"""
+caltrain.com stop predictions for several stations at once.
+
+build_caltrain_df asks for one station per call, so showing an origin and a
+destination, or a wall of stations, used to cost one round trip after
+another. PredictionFetcher sends them side by side on a small thread pool,
+so a batch takes about as long as its slowest station. Sessions asking for
+a station that is already being fetched wait for that request instead of
+sending their own.
+"""
+import concurrent.futures
+import os
+import threading
+
+import pandas as pd
+
+from functions.ct_functions import build_caltrain_df
+from functions.metrics import METRICS
+
+# Most caltrain.com requests in flight at once, across every session; the
+# shared HTTP client pools 8 connections per host
+MAX_CONCURRENCY = int(os.environ.get("CALTRAIN_FETCH_CONCURRENCY", 4))
+
+
+class PredictionFetcher:
+    """
+    Fetches build_caltrain_df for a set of stations concurrently, at most
+    max_workers at a time, with one request per station in flight however
+    many callers want it
+    """
+
+    def __init__(self, max_workers=MAX_CONCURRENCY, fetch=build_caltrain_df):
+        self.fetch = fetch
+        self._pool = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="predictions")
+        self._lock = threading.Lock()
+        # station -> Future of the request in flight for it
+        self._in_flight = {}
+
+    def submit(self, station) -> concurrent.futures.Future:
+        """
+        Returns the future of station's request, joining one in flight
+        """
+        with self._lock:
+            future = self._in_flight.get(station)
+            if future is not None:
+                METRICS.count("cache_hits_total", cache="predictions")
+                return future
+            METRICS.count("cache_misses_total", cache="predictions")
+            future = self._pool.submit(self.fetch, station)
+            self._in_flight[station] = future
+        future.add_done_callback(lambda done: self._forget(station, done))
+        return future
+
+    def _forget(self, station, future):
+        with self._lock:
+            if self._in_flight.get(station) is future:
+                del self._in_flight[station]
+
+    def fetch_all(self, stations) -> pd.DataFrame:
+        """
+        Returns every station's predictions in one frame with a stopname
+        column, in the order the stations were given. Raises the first
+        station's error if any request failed, once all have finished.
+        """
+        stations = list(dict.fromkeys(stations))
+        with METRICS.span("fetch", endpoint="caltrain-predictions-batch"):
+            futures = [self.submit(station) for station in stations]
+            concurrent.futures.wait(futures)
+
+        frames = []
+        for station, future in zip(stations, futures):
+            df = future.result()
+            if not df.empty:
+                frames.append(df.assign(stopname=station))
+        if not frames:
+            return pd.DataFrame()
+        return pd.concat(frames, ignore_index=True)
+
+
+PREDICTIONS = PredictionFetcher()
+
+
+def fetch_predictions(stations) -> pd.DataFrame:
+    """
+    build_caltrain_df for each of stations, fetched concurrently and merged
+    """
+    return PREDICTIONS.fetch_all(stations)
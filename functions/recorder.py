@@ -0,0 +1,203 @@
+"""
+Record-and-replay for the upstream feeds.
+
+FeedRecorder appends every raw response to a gzip-compressed JSON-lines log,
+one gzip member per record, so the file is append-only and stays readable
+while it grows. ReplayAdapter mounts on a requests session and answers from
+such a log instead of the network, so the real fetch and parse code runs
+offline.
+
+Record the app's feeds by setting CALTRAIN_RECORD_PATH before starting it,
+or capture all four feeds from the command line:
+    python -m functions.recorder feeds.jsonl.gz --station "Redwood City"
+
+Replay them through the shared client, optionally at wall-clock pace:
+    install_replay(CLIENT.session, "feeds.jsonl.gz", speed=10)
+"""
+import argparse
+import base64
+import datetime
+import gzip
+import json
+import os
+import re
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import BaseAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+# Headers worth keeping; the body is stored decompressed, so length and encoding are not
+RECORDED_HEADERS = ["Content-Type", "ETag", "Last-Modified", "Date"]
+
+
+def redact(url):
+    return re.sub(r"(api_key=)[^&]+", r"\1REDACTED", url)
+
+
+def feed_key(url):
+    """
+    Responses are matched by host and path, so cache-busting query strings
+    and api keys don't matter
+    """
+    parts = urlsplit(url)
+    return f"{parts.netloc}{parts.path}"
+
+
+class FeedRecorder:
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def record(self, endpoint, response):
+        record = {
+            "ts": time.time(),
+            "endpoint": endpoint,
+            "url": redact(response.url),
+            "status": response.status_code,
+            "headers": {name: response.headers[name] for name in RECORDED_HEADERS if name in response.headers},
+            "body": base64.b64encode(response.content).decode("ascii"),
+        }
+        line = json.dumps(record).encode("utf-8") + b"\n"
+        with self._lock, open(self.path, "ab") as f:
+            f.write(gzip.compress(line))
+
+    def hook(self, endpoint):
+        """
+        Returns a requests response hook that records into this log, for
+        sessions outside the shared client:
+            session.hooks["response"].append(recorder.hook("tripupdates"))
+        """
+        def record_response(response, *args, **kwargs):
+            self.record(endpoint, response)
+            return response
+
+        return record_response
+
+
+def read_log(path, endpoint=None):
+    """
+    Yields the records of a log in the order they were written
+    """
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            record = json.loads(line)
+            if endpoint is None or record["endpoint"] == endpoint:
+                yield record
+
+
+def record_body(record):
+    return base64.b64decode(record["body"])
+
+
+class ReplayAdapter(BaseAdapter):
+    """
+    A transport adapter that answers requests from recorded responses.
+
+    Without a speed, each request for a feed gets that feed's next
+    recording, and the last one repeats once they run out. With a speed,
+    recordings are replayed against the clock: a request gets the latest
+    recording made no later than the first recording's time plus the
+    elapsed time multiplied by speed.
+    """
+
+    def __init__(self, records, speed=None, clock=time.monotonic):
+        super().__init__()
+        self.speed = speed
+        self.clock = clock
+        self._feeds = {}
+        for record in records:
+            self._feeds.setdefault(feed_key(record["url"]), []).append(record)
+        self._positions = {key: 0 for key in self._feeds}
+        self._lock = threading.Lock()
+        self._started = None
+        self._first_ts = min((r["ts"] for feed in self._feeds.values() for r in feed), default=0)
+
+    def _next_record(self, key):
+        feed = self._feeds.get(key)
+        if not feed:
+            return None
+        with self._lock:
+            if self.speed:
+                if self._started is None:
+                    self._started = self.clock()
+                replay_ts = self._first_ts + (self.clock() - self._started) * self.speed
+                position = 0
+                while position + 1 < len(feed) and feed[position + 1]["ts"] <= replay_ts:
+                    position += 1
+                return feed[position]
+            position = self._positions[key]
+            self._positions[key] = min(position + 1, len(feed) - 1)
+            return feed[position]
+
+    def send(self, request, **kwargs):
+        record = self._next_record(feed_key(request.url))
+        response = requests.Response()
+        response.request = request
+        response.url = request.url
+        if record is None:
+            response.status_code = 404
+            response.reason = "Not Recorded"
+            response._content = b""
+            return response
+
+        response.status_code = record["status"]
+        response.reason = "OK" if record["status"] < 400 else "Recorded Error"
+        response.headers = CaseInsensitiveDict(record["headers"])
+        response.encoding = get_encoding_from_headers(response.headers)
+        response._content = record_body(record)
+        return response
+
+    def close(self):
+        pass
+
+
+def install_replay(session, path, speed=None):
+    """
+    Serves every https request made through session from the log at path
+    """
+    adapter = ReplayAdapter(read_log(path), speed=speed)
+    # Including the adapters mounted for one host, like 511's
+    for prefix in [prefix for prefix in session.adapters if prefix.startswith("https://")]:
+        session.mount(prefix, adapter)
+    return adapter
+
+
+def main():
+    # Imported here so the app never pulls in the SMS function
+    from caltrain_response import main as sms
+    from functions.ct_functions import TIMETABLE_CACHE
+    from functions.predictions import fetch_predictions
+    from functions.siri import fetch_vehicle_monitoring
+    from functions.transport import CLIENT
+
+    parser = argparse.ArgumentParser(description="Record every upstream feed to a replayable log")
+    parser.add_argument("path", help="Log to append to, e.g. feeds.jsonl.gz")
+    parser.add_argument("--station", action="append", default=[], help="Stations to record predictions for")
+    parser.add_argument("--interval", type=float, default=60, help="Seconds between captures")
+    parser.add_argument("--count", type=int, default=1, help="Number of captures, 0 to run until stopped")
+    args = parser.parse_args()
+
+    recorder = FeedRecorder(args.path)
+    CLIENT.recorder = recorder
+    sms.SESSION.hooks["response"].append(recorder.hook("caltrain-tripupdates"))
+    api_key = os.environ["CALTRAIN_511_KEY"]
+
+    capture = 0
+    while args.count == 0 or capture < args.count:
+        started = time.monotonic()
+        fetch_vehicle_monitoring(api_key)
+        TIMETABLE_CACHE.fetch()
+        if args.station:
+            fetch_predictions(args.station)
+        sms.build_caltrain_df()
+        capture += 1
+        print(f"{datetime.datetime.now():%H:%M:%S} capture {capture} written to {args.path}")
+        time.sleep(max(0.0, args.interval - (time.monotonic() - started)))
+
+
+if __name__ == "__main__":
+    main()
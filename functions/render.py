@@ -0,0 +1,86 @@
+import numpy as np
+import pandas as pd
+
+from functions.ct_functions import train_labels, train_types
+from functions.timemodel import format_clock, whole_minutes
+
+DELAYED_LABEL = "!!!!!--  I SLOW  --!!!!!"
+
+
+def clock_column(epochs: pd.Series) -> pd.Series:
+    """
+    An epoch seconds column as Pacific "%I:%M %p" labels
+    """
+    return pd.Series(format_clock(epochs.to_numpy()), index=epochs.index)
+
+
+def minutes_column(seconds: pd.Series) -> pd.Series:
+    """
+    A seconds column as whole minutes, truncated toward zero like int(x / 60)
+    """
+    return pd.Series(whole_minutes(seconds.to_numpy()), index=seconds.index)
+
+
+def prepare_live_frame(caltrain_data: pd.DataFrame) -> pd.DataFrame:
+    """
+    Adds the display columns the live boards use: train type labels,
+    Pacific clock times and the stops away // current stop // distance
+    summary
+    """
+    caltrain_data = caltrain_data.copy()
+    caltrain_data["Train Type"] = train_types(caltrain_data["Train #"])
+    caltrain_data["Train #"] = train_labels(caltrain_data["Train #"])
+
+    caltrain_data["Departure Time"] = clock_column(caltrain_data["Departure Time"])
+    caltrain_data["Scheduled Time"] = clock_column(caltrain_data["Scheduled Time"])
+    caltrain_data["AimedDepartureTime"] = clock_column(caltrain_data["AimedDepartureTime"])
+
+    caltrain_data = caltrain_data.reset_index(drop=True)
+
+    idx = (caltrain_data
+           .sort_values(["id", "aimed_arrival_time"])
+           .groupby("id")
+           .head(1)
+           .index)
+
+    # Clean up one name per train, then spread it over the train's rows
+    first_stops = caltrain_data.loc[idx, ["id", "stop_name"]].drop_duplicates().set_index("id")["stop_name"]
+    first_stops = first_stops.astype(str).str.replace(
+        r'\s*Caltrain Station\s+(Northbound|Southbound)\s*$',
+        '', regex=True
+    ).str.strip()
+    caltrain_data["stopsaway2"] = (
+        caltrain_data["stops_away"].astype(str)
+        + " // " + caltrain_data["id"].map(first_stops).astype(str)
+        + " // " + caltrain_data["distance"]
+    )
+    return caltrain_data
+
+
+def clean_up_df(data: pd.DataFrame, typical_delay: pd.Series = None) -> pd.DataFrame:
+    """
+    Builds a board table with one column per train from prepared live rows.
+    typical_delay, one label per row, adds the historical delay row.
+    """
+    eta = minutes_column(data["ETA"])
+    scheduled_eta = minutes_column(data["ScheduledETA"])
+    aimed_departure_eta = minutes_column(data["AimedDepartureTimeETA"])
+
+    data = pd.DataFrame(
+        {
+            "Train #": data["Train #"],
+            "API Arrival": data["Departure Time"].astype(str) + " // Train in " + eta.astype(str) + " min",
+            "Scheduled Depature": (
+                data["AimedDepartureTime"].astype(str) + " // Train in " + aimed_departure_eta.astype(str) + " min"
+            ),
+            "Delayed": np.where(eta > scheduled_eta + 1, DELAYED_LABEL, ""),
+            "Stops Away": data["stopsaway2"],
+        }
+    )
+    if typical_delay is not None:
+        data.insert(4, "Typical Delay", typical_delay.to_numpy())
+
+    data = data.T
+    data.columns = data.iloc[0]
+    data = data.drop(data.index[0])
+    return data
@@ -0,0 +1,265 @@
+import datetime
+import io
+import json
+
+import numpy as np
+import pandas as pd
+import pytz
+
+from functions.metrics import METRICS
+from functions.poller import ChangeSet, Snapshot
+from functions.stations import get_stations
+from functions.timemodel import now_epoch
+from functions.transport import CLIENT
+
+try:
+    import ijson
+except ImportError:  # ijson is optional; without it bodies are decoded in one go
+    ijson = None
+
+VEHICLE_COLUMNS = [
+    "stop_name",
+    "stop_id",
+    "aimed_arrival_time",
+    "expected_arrival_time",
+    "AimedDepartureTime",
+    "id",
+    "origin",
+    "origin_id",
+    "direction",
+    "line_type",
+    "destination",
+    "train_longitude",
+    "train_latitude",
+    "stops_away",
+]
+
+
+def iso_to_epoch(value):
+    """
+    Converts a Siri timestamp such as 2024-05-06T17:04:00Z to epoch seconds
+    """
+    return int(datetime.datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp())
+
+
+# What parse_journeys and journey_fingerprint read, and all that is kept of a journey
+JOURNEY_FIELDS = ["VehicleRef", "OriginName", "OriginRef", "DirectionRef", "PublishedLineName", "DestinationName"]
+CALL_FIELDS = ["StopPointRef", "StopPointName", "AimedArrivalTime", "ExpectedArrivalTime", "AimedDepartureTime"]
+
+JOURNEY_PREFIX = "Siri.ServiceDelivery.VehicleMonitoringDelivery.VehicleActivity.item.MonitoredVehicleJourney"
+TIMESTAMP_PREFIX = "Siri.ServiceDelivery.ResponseTimestamp"
+# Bytes handed to the streaming parser at a time
+STREAM_CHUNK = 64 * 1024
+
+
+def compact_journey(journey: dict):
+    """
+    Returns a copy of a MonitoredVehicleJourney with only the fields the
+    live view reads, or None for a train without OnwardCalls
+    """
+    if journey.get("OnwardCalls") is None:
+        return None
+    compact = {field: journey[field] for field in JOURNEY_FIELDS}
+    location = journey["VehicleLocation"]
+    compact["VehicleLocation"] = {"Latitude": location["Latitude"], "Longitude": location["Longitude"]}
+    compact["MonitoredCall"] = {field: journey["MonitoredCall"][field] for field in CALL_FIELDS}
+    compact["OnwardCalls"] = {
+        "OnwardCall": [{field: call[field] for field in CALL_FIELDS} for call in journey["OnwardCalls"]["OnwardCall"]]
+    }
+    return compact
+
+
+def read_vehicle_monitoring(content: bytes):
+    """
+    Decodes a VehicleMonitoring body into (compact monitored journeys,
+    ResponseTimestamp). The journeys are None when the feed has no
+    vehicles at all.
+
+    With ijson the body is parsed in chunks and each journey is compacted
+    as soon as it is complete, so neither the decoded text nor the full
+    dict tree is ever held.
+    """
+    if ijson is None:
+        data = json.loads(content.decode("utf-8-sig"))
+        delivery = data["Siri"]["ServiceDelivery"]
+        activity = delivery["VehicleMonitoringDelivery"].get("VehicleActivity")
+        if not activity:
+            return None, delivery["ResponseTimestamp"]
+        journeys = (compact_journey(train["MonitoredVehicleJourney"]) for train in activity)
+        return [journey for journey in journeys if journey is not None], delivery["ResponseTimestamp"]
+
+    stream = io.BytesIO(content)
+    start = 3 if content[:3] == b"\xef\xbb\xbf" else 0
+    # The timestamp comes before the vehicles, so this reads only the first chunk
+    stream.seek(start)
+    response_time = next(ijson.items(stream, TIMESTAMP_PREFIX, buf_size=STREAM_CHUNK))
+
+    stream.seek(start)
+    journeys, seen = [], 0
+    for journey in ijson.items(stream, JOURNEY_PREFIX, buf_size=STREAM_CHUNK):
+        seen += 1
+        journey = compact_journey(journey)
+        if journey is not None:
+            journeys.append(journey)
+    return (journeys if seen else None), response_time
+
+
+def monitored_journeys(data: dict) -> list:
+    """
+    Returns the MonitoredVehicleJourney of every train with OnwardCalls
+    """
+    journeys = []
+    for train in data["Siri"]["ServiceDelivery"]["VehicleMonitoringDelivery"]["VehicleActivity"]:
+        train_obj = train["MonitoredVehicleJourney"]
+        if train_obj.get("OnwardCalls") is not None:
+            journeys.append(train_obj)
+    return journeys
+
+
+def parse_vehicle_activity(data: dict) -> pd.DataFrame:
+    """
+    Walks VehicleActivity once, filling one typed buffer per column, and
+    builds a single DataFrame with one row per monitored or onward call.
+    Trains without OnwardCalls are skipped.
+    """
+    return parse_journeys(monitored_journeys(data))
+
+
+def parse_journeys(journeys: list) -> pd.DataFrame:
+    stop_name, stop_id, stops_away = [], [], []
+    aimed_arrival, expected_arrival, aimed_departure = [], [], []
+
+    # Per-train values, repeated over each train's calls at the end
+    calls_per_train = []
+    train_id, origin, origin_id, direction, line_type, destination = [], [], [], [], [], []
+    train_longitude, train_latitude = [], []
+
+    for train_obj in journeys:
+        calls = [train_obj["MonitoredCall"]] + train_obj["OnwardCalls"]["OnwardCall"]
+        for call in calls:
+            stop_name.append(call["StopPointName"])
+            stop_id.append(int(call["StopPointRef"]))
+            aimed_arrival.append(iso_to_epoch(call["AimedArrivalTime"]))
+            expected_arrival.append(iso_to_epoch(call["ExpectedArrivalTime"]))
+            aimed_departure.append(iso_to_epoch(call["AimedDepartureTime"]))
+
+        # The monitored call and the first onward call are both 0 stops away
+        stops_away.append(0)
+        stops_away.extend(range(len(calls) - 1))
+
+        calls_per_train.append(len(calls))
+        train_id.append(train_obj["VehicleRef"])
+        origin.append(train_obj["OriginName"])
+        origin_id.append(int(train_obj["OriginRef"]))
+        direction.append(train_obj["DirectionRef"] + "B")
+        line_type.append(train_obj["PublishedLineName"])
+        destination.append(train_obj["DestinationName"])
+        train_longitude.append(float(train_obj["VehicleLocation"]["Longitude"]))
+        train_latitude.append(float(train_obj["VehicleLocation"]["Latitude"]))
+
+    counts = np.asarray(calls_per_train, dtype="int64")
+
+    def per_train(values, dtype):
+        return np.repeat(np.asarray(values, dtype=dtype), counts)
+
+    return pd.DataFrame(
+        {
+            "stop_name": np.asarray(stop_name, dtype=object),
+            "stop_id": np.asarray(stop_id, dtype="int64").astype("float64"),
+            "aimed_arrival_time": np.asarray(aimed_arrival, dtype="int64"),
+            "expected_arrival_time": np.asarray(expected_arrival, dtype="int64"),
+            "AimedDepartureTime": np.asarray(aimed_departure, dtype="int64"),
+            "id": per_train(train_id, object),
+            "origin": per_train(origin, object),
+            "origin_id": per_train(origin_id, "int64").astype("float64"),
+            "direction": per_train(direction, object),
+            "line_type": per_train(line_type, object),
+            "destination": per_train(destination, object),
+            "train_longitude": per_train(train_longitude, "float64"),
+            "train_latitude": per_train(train_latitude, "float64"),
+            "stops_away": np.asarray(stops_away, dtype="int64"),
+        },
+        columns=VEHICLE_COLUMNS,
+    )
+
+
+def fetch_vehicle_monitoring(api_key: str, tracker=None) -> Snapshot:
+    """
+    Fetches 511 VehicleMonitoring for Caltrain. The snapshot's payload is
+    the locate_trains frame, or None when 511 reports no vehicles. With an
+    IncrementalTrains tracker only the trains that changed since the last
+    poll are re-parsed, and the snapshot carries the tracker's ChangeSet.
+    Raises if the request fails so the poller keeps its last snapshot.
+    """
+    url = f"https://api.511.org/transit/VehicleMonitoring?api_key={api_key}&agency=CT"
+    if tracker is None:
+        trains, response_time = CLIENT.get_parsed(url, "511-vehicle-monitoring", parse_vehicle_monitoring_response)
+        return Snapshot(trains, datetime.datetime.now(pytz.utc), response_time)
+
+    updates = tracker.updates
+    trains, response_time = CLIENT.get_parsed(url, "511-vehicle-monitoring", tracker.parse_response)
+    # A 304 skips the parse, so nothing changed
+    changes = tracker.changes if tracker.updates != updates else ChangeSet((), (), ())
+    return Snapshot(trains, datetime.datetime.now(pytz.utc), response_time, changes)
+
+
+def parse_vehicle_monitoring_response(response):
+    with METRICS.span("decode", source="siri"):
+        journeys, response_time = read_vehicle_monitoring(response.content)
+    trains = None
+    if journeys is not None:
+        with METRICS.span("parse", source="siri"):
+            vehicles = parse_journeys(journeys)
+        trains = locate_trains(vehicles)
+    return trains, response_time
+
+
+def create_caltrain_dfs(data: dict, now=None, distance_method="ellipsoidal") -> pd.DataFrame:
+    return add_clock_columns(locate_trains(parse_vehicle_activity(data), distance_method), now)
+
+
+def locate_trains(vehicles: pd.DataFrame, distance_method="ellipsoidal") -> pd.DataFrame:
+    """
+    Joins parsed vehicles to their stations and measures each train's
+    distance to each of its stations. vehicles is not modified.
+    """
+    stations = get_stations()
+    with METRICS.span("merge", step="join"):
+        trains_df = stations.join(vehicles)
+    trains_df["distance"] = train_distances(trains_df, distance_method)
+    return trains_df
+
+
+def train_distances(trains: pd.DataFrame, distance_method="ellipsoidal") -> pd.Series:
+    """
+    Each row's distance from its train's position to its station, as the
+    "1.2 mi" labels the boards show
+    """
+    stations = get_stations()
+    # Measure each train against every station once, then pick each row's station
+    train_codes, _ = pd.factorize(trains["id"])
+    station_index = trains["stopname"].map(stations.order).to_numpy()
+    with METRICS.span("distance", method=distance_method):
+        distance = stations.distances(distance_method).for_rows(
+            train_codes, trains["train_latitude"].to_numpy(), trains["train_longitude"].to_numpy(), station_index
+        )
+    return pd.Series(distance, index=trains.index).round(1).astype("str") + " mi"
+
+
+def add_clock_columns(trains: pd.DataFrame, now=None) -> pd.DataFrame:
+    """
+    Returns a copy of a locate_trains frame with the ETAs as of now, in
+    seconds, so a shared snapshot frame is never modified
+    """
+    trains_df = trains.copy()
+    trains_df["Departure Time"] = trains_df["expected_arrival_time"]
+    trains_df["Scheduled Time"] = trains_df["aimed_arrival_time"]
+    trains_df["Current Time"] = now_epoch(now)
+    trains_df["ETA"] = trains_df["Departure Time"] - trains_df["Current Time"]
+    trains_df["ScheduledETA"] = trains_df["Scheduled Time"] - trains_df["Current Time"]
+    trains_df["AimedDepartureTimeETA"] = trains_df["AimedDepartureTime"] - trains_df["Current Time"]
+
+    trains_df["Train #"] = trains_df["id"]
+    trains_df["Direction"] = trains_df["direction"]
+
+    return trains_df
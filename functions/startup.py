@@ -0,0 +1,49 @@
+import collections
+import datetime
+import json
+import logging
+import os
+import statistics
+import threading
+
+logger = logging.getLogger(__name__)
+
+# JSON lines of first-paint times are appended here when set
+PAINT_LOG_PATH = os.environ.get("CALTRAIN_PAINT_LOG")
+
+
+class PaintTimer:
+    """
+    Seconds from the start of a session's first script run to its first
+    board on screen. The first one a process records is its cold start,
+    imports included; later ones are new sessions on a warm server.
+    """
+
+    def __init__(self, log_path=PAINT_LOG_PATH, keep=100):
+        self.log_path = log_path
+        self.cold = None
+        self.recent = collections.deque(maxlen=keep)
+        self._lock = threading.Lock()
+
+    def record(self, seconds, view):
+        with self._lock:
+            cold = self.cold is None
+            if cold:
+                self.cold = seconds
+            self.recent.append(seconds)
+        logger.info("First paint of the %s view after %.2fs%s", view, seconds, " (cold start)" if cold else "")
+        if self.log_path:
+            record = {"at": datetime.datetime.now().isoformat(timespec="seconds"), "view": view,
+                      "seconds": round(seconds, 3), "cold": cold}
+            with self._lock, open(self.log_path, "a") as f:
+                f.write(json.dumps(record) + "\n")
+
+    def summary(self):
+        """
+        Returns {cold, median, last, count} in seconds, None before any paint
+        """
+        with self._lock:
+            if not self.recent:
+                return None
+            return {"cold": self.cold, "median": statistics.median(self.recent),
+                    "last": self.recent[-1], "count": len(self.recent)}
@@ -0,0 +1,78 @@
+import functools
+import os
+
+import numpy as np
+import pandas as pd
+
+from functions.distance import StationDistances
+
+STOP_IDS_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "stop_ids.csv")
+
+
+class StationRegistry:
+    """
+    stop_ids.csv loaded once, with dict lookups by stop id and station name
+    and the coordinates as NumPy arrays. Stations are kept in file order,
+    which runs from San Francisco south to Gilroy.
+    """
+
+    def __init__(self, frame: pd.DataFrame):
+        self.frame = frame
+        self.names = frame["stopname"].tolist()
+        self.order = {name: i for i, name in enumerate(self.names)}
+        self.urlname = dict(zip(self.names, frame["urlname"]))
+        self.lat = frame["lat"].to_numpy(dtype="float64")
+        self.lon = frame["lon"].to_numpy(dtype="float64")
+        self.coordinates = {name: (lat, lon) for name, lat, lon in zip(self.names, self.lat, self.lon)}
+
+        self.stop1 = frame["stop1"].to_numpy(dtype="int64")
+        self.stop2 = frame["stop2"].to_numpy(dtype="int64")
+        self._stop1_index = pd.Index(self.stop1)
+        self._stop2_index = pd.Index(self.stop2)
+        self.station_of_stop = {int(stop): i for i, stop in enumerate(self.stop2)}
+        self.station_of_stop.update({int(stop): i for i, stop in enumerate(self.stop1)})
+
+        self._distances = {}
+
+    def station(self, stop_id):
+        """
+        Returns the station name for a platform stop id
+        """
+        return self.names[self.station_of_stop[int(stop_id)]]
+
+    def is_northbound(self, chosen_station, chosen_destination):
+        return self.order[chosen_station] > self.order[chosen_destination]
+
+    def distances(self, method="ellipsoidal"):
+        if method not in self._distances:
+            self._distances[method] = StationDistances(self.lat, self.lon, method=method)
+        return self._distances[method]
+
+    def join(self, frame: pd.DataFrame, stop_column="stop_id") -> pd.DataFrame:
+        """
+        Appends the stop_ids.csv columns to each row of frame whose stop id
+        is a stop1 platform, followed by the rows whose stop id is a stop2
+        platform. This is the same result as an inner merge on stop1
+        concatenated with an inner merge on stop2, without the merges.
+        """
+        stop_ids = frame[stop_column].to_numpy()
+        match1 = self._stop1_index.get_indexer(stop_ids)
+        match2 = self._stop2_index.get_indexer(stop_ids)
+        rows1 = np.flatnonzero(match1 >= 0)
+        rows2 = np.flatnonzero(match2 >= 0)
+        rows = np.concatenate([rows1, rows2])
+        station_rows = np.concatenate([match1[rows1], match2[rows2]])
+
+        joined = frame.iloc[rows].reset_index(drop=True)
+        stations = self.frame.iloc[station_rows].reset_index(drop=True)
+        joined = pd.concat([joined, stations], axis=1)
+        joined.index = np.concatenate([np.arange(len(rows1)), np.arange(len(rows2))])
+        return joined
+
+
+@functools.lru_cache(maxsize=None)
+def get_stations(path=STOP_IDS_PATH) -> StationRegistry:
+    """
+    Returns the station registry, reading the csv once per process
+    """
+    return StationRegistry(pd.read_csv(path))
@@ -0,0 +1,157 @@
+"""
+The one time representation the pipeline uses: int64 epoch seconds.
+
+Every feed is converted once, where it is read: Siri and GTFS-Realtime
+timestamps are epoch seconds already, and timetable times like "7:05am"
+become seconds into a Pacific service day, which runs from midnight until
+SERVICE_DAY_START_HOUR the next morning, so a 12:30am train is at 24:30.
+wall_clock_epochs and gtfs_day_start place them on the same axis, taking
+the day's UTC offset into account on daylight saving changes. ETAs, delays
+and sort keys are then integer differences, and clock labels and
+countdowns are only formatted for display.
+"""
+import datetime
+import functools
+
+import numpy as np
+import pandas as pd
+import pytz
+
+PACIFIC = pytz.timezone("US/Pacific")
+# Times before this hour belong to the previous service day
+SERVICE_DAY_START_HOUR = 4
+DAY = 24 * 3600
+
+# "%I:%M %p" for every minute of the day, so times are formatted by lookup
+CLOCK_LABELS = np.array(
+    [f"{(minute // 60 - 1) % 12 + 1:02d}:{minute % 60:02d} {'AM' if minute < 720 else 'PM'}" for minute in range(1440)],
+    dtype=object,
+)
+# The caltrain.com timetable's style, e.g. 7:05am
+TIMETABLE_LABELS = np.array(
+    [f"{(minute // 60 - 1) % 12 + 1}:{minute % 60:02d}{'am' if minute < 720 else 'pm'}" for minute in range(1440)],
+    dtype=object,
+)
+
+
+def now_epoch(now=None) -> int:
+    """
+    Epoch seconds of now (a datetime), or of the current time
+    """
+    return int((now or datetime.datetime.now(pytz.utc)).timestamp())
+
+
+def service_day(now=None) -> datetime.date:
+    """
+    The Pacific service day now falls in
+    """
+    now = now or datetime.datetime.now(PACIFIC)
+    return (now.astimezone(PACIFIC) - datetime.timedelta(hours=SERVICE_DAY_START_HOUR)).date()
+
+
+@functools.lru_cache(maxsize=64)
+def gtfs_day_start(day: datetime.date) -> int:
+    """
+    Epoch seconds GTFS times on service day `day` count from: noon minus
+    12 hours, which is midnight except on daylight saving changes
+    """
+    noon = PACIFIC.localize(datetime.datetime.combine(day, datetime.time(12)))
+    return int(noon.timestamp()) - 12 * 3600
+
+
+@functools.lru_cache(maxsize=4096)
+def _wall_clock_epoch(day: datetime.date, seconds: int) -> int:
+    days, seconds = divmod(seconds, DAY)
+    clock = datetime.datetime.combine(day + datetime.timedelta(days=days), datetime.time())
+    return int(PACIFIC.localize(clock + datetime.timedelta(seconds=seconds)).timestamp())
+
+
+def wall_clock_epochs(day: datetime.date, seconds) -> np.ndarray:
+    """
+    Seconds into service day `day`, read as Pacific wall-clock times like
+    the timetable's, in epoch seconds
+    """
+    seconds = np.asarray(seconds, dtype="int64")
+    # A timetable has few distinct times, so localize each one once
+    times, inverse = np.unique(seconds, return_inverse=True)
+    epochs = np.array([_wall_clock_epoch(day, int(time)) for time in times], dtype="int64")
+    return epochs[inverse].reshape(seconds.shape)
+
+
+@functools.lru_cache(maxsize=2048)
+def service_seconds(label: str) -> int:
+    """
+    A timetable time like "7:05am" in seconds into the service day
+    """
+    clock = datetime.datetime.strptime(label, "%I:%M%p")
+    seconds = clock.hour * 3600 + clock.minute * 60
+    if clock.hour < SERVICE_DAY_START_HOUR:
+        seconds += DAY
+    return seconds
+
+
+def utc_offsets(epochs: np.ndarray) -> np.ndarray:
+    """
+    Pacific's UTC offset in seconds at each epoch second
+    """
+    epochs = np.asarray(epochs, dtype="int64")
+    # Offsets only change on the hour, so look each hour up once
+    hours, inverse = np.unique(epochs // 3600, return_inverse=True)
+    offsets = np.array(
+        [datetime.datetime.fromtimestamp(int(hour) * 3600, PACIFIC).utcoffset().total_seconds() for hour in hours],
+        dtype="int64",
+    )
+    return offsets[inverse].reshape(epochs.shape)
+
+
+def local_seconds(epochs: np.ndarray) -> np.ndarray:
+    """
+    Seconds since Pacific midnight of each epoch second
+    """
+    epochs = np.asarray(epochs, dtype="int64")
+    return (epochs + utc_offsets(epochs)) % DAY
+
+
+def local_days(epochs: np.ndarray) -> np.ndarray:
+    """
+    Days since 1970-01-01 of each epoch second's Pacific date
+    """
+    epochs = np.asarray(epochs, dtype="int64")
+    return (epochs + utc_offsets(epochs)) // DAY
+
+
+def format_clock(epochs) -> np.ndarray:
+    """
+    Epoch seconds as Pacific "%I:%M %p" labels
+    """
+    return CLOCK_LABELS[local_seconds(epochs) // 60]
+
+
+def format_timetable_clock(epochs) -> np.ndarray:
+    """
+    Epoch seconds as Pacific timetable labels like 7:05am
+    """
+    return TIMETABLE_LABELS[local_seconds(epochs) // 60]
+
+
+def format_countdown(seconds) -> np.ndarray:
+    """
+    Seconds as "HH:MM" countdowns, the hours wrapping at a day
+    """
+    minutes = np.asarray(seconds, dtype="int64") // 60
+    return np.array([f"{hours % 24:02d}:{minute:02d}" for hours, minute in zip(*np.divmod(minutes, 60))],
+                    dtype=object)
+
+
+def whole_minutes(seconds) -> np.ndarray:
+    """
+    Seconds as whole minutes, truncated toward zero
+    """
+    return np.trunc(np.asarray(seconds, dtype="int64") / 60).astype("int64")
+
+
+def to_datetimes(epochs) -> pd.DatetimeIndex:
+    """
+    Epoch seconds as tz-aware UTC datetimes, for callers outside the pipeline
+    """
+    return pd.DatetimeIndex(np.asarray(epochs, dtype="int64").astype("M8[s]").astype("M8[ns]")).tz_localize("UTC")
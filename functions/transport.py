@@ -0,0 +1,171 @@
+import os
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from functions.metrics import METRICS, Sample
+from functions.recorder import FeedRecorder, install_replay
+
+# (connect, read) timeouts in seconds per upstream endpoint
+ENDPOINT_TIMEOUTS = {
+    "511-vehicle-monitoring": (3.05, 15),
+    "511-trip-updates": (3.05, 10),
+    "511-vehicle-positions": (3.05, 10),
+    "caltrain-schedule": (3.05, 20),
+    "caltrain-predictions": (3.05, 10),
+}
+DEFAULT_TIMEOUT = (3.05, 15)
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+# Every 511 call counts against the hourly quota, so its 429s are not retried
+QUOTA_PREFIX = "https://api.511.org/"
+QUOTA_RETRY_STATUSES = (500, 502, 503, 504)
+
+
+class EndpointStats:
+    __slots__ = ("requests", "not_modified", "errors", "seconds", "wire_bytes", "body_bytes")
+
+    def __init__(self):
+        self.requests = 0
+        self.not_modified = 0
+        self.errors = 0
+        self.seconds = 0.0
+        self.wire_bytes = 0
+        self.body_bytes = 0
+
+    def as_dict(self):
+        stats = {name: getattr(self, name) for name in self.__slots__}
+        stats["mean_ms"] = self.seconds / self.requests * 1000 if self.requests else 0.0
+        return stats
+
+
+class HttpClient:
+    """
+    One requests session for every upstream feed: keep-alive connections
+    are pooled per host, responses are gzip-compressed, 5xx and, except
+    from 511, 429s are retried with backoff, and every call has a
+    per-endpoint timeout.
+
+    get_parsed revalidates with ETag / Last-Modified when the server sends
+    them, and a 304 hands back the payload parsed from the previous 200.
+    Latency and bytes are tallied per endpoint in stats().
+    """
+
+    def __init__(self, retries=2, backoff=0.5, pool_size=8, recorder=None):
+        self.session = requests.Session()
+        # A FeedRecorder that every response is appended to
+        self.recorder = recorder
+        for prefixes, statuses in [(("https://", "http://"), RETRY_STATUSES), ((QUOTA_PREFIX,), QUOTA_RETRY_STATUSES)]:
+            retry = Retry(
+                total=retries,
+                backoff_factor=backoff,
+                status_forcelist=statuses,
+                allowed_methods=("GET",),
+            )
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+            for prefix in prefixes:
+                self.session.mount(prefix, adapter)
+        self.session.headers["Accept-Encoding"] = "gzip, deflate"
+
+        self._lock = threading.Lock()
+        self._stats = {}
+        # url -> (etag, last_modified, parsed payload)
+        self._validators = {}
+
+    def _tally(self, endpoint):
+        with self._lock:
+            return self._stats.setdefault(endpoint, EndpointStats())
+
+    def get(self, url, endpoint, headers=None) -> requests.Response:
+        """
+        GETs url, raising for error statuses. 304s are returned, not raised.
+        """
+        stats = self._tally(endpoint)
+        start = time.perf_counter()
+        try:
+            with METRICS.span("fetch", endpoint=endpoint):
+                response = self.session.get(url, headers=headers, timeout=ENDPOINT_TIMEOUTS.get(endpoint, DEFAULT_TIMEOUT))
+            if self.recorder is not None:
+                self.recorder.record(endpoint, response)
+            response.raise_for_status()
+        except requests.RequestException:
+            with self._lock:
+                stats.errors += 1
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                stats.requests += 1
+                stats.seconds += elapsed
+
+        with self._lock:
+            # Content-Length is the compressed size when the body was gzipped;
+            # without it the size on the wire is unknown and left uncounted
+            if "Content-Length" in response.headers:
+                stats.wire_bytes += int(response.headers["Content-Length"])
+            stats.body_bytes += len(response.content)
+            if response.status_code == 304:
+                stats.not_modified += 1
+        return response
+
+    def get_parsed(self, url, endpoint, parse):
+        """
+        Returns parse(response) for url, or the previous result unchanged if
+        the server answers 304 Not Modified
+        """
+        etag, last_modified, parsed = self._validators.get(url, (None, None, None))
+        headers = {}
+        if etag:
+            headers["If-None-Match"] = etag
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
+
+        response = self.get(url, endpoint, headers=headers)
+        if response.status_code == 304 and parsed is not None:
+            METRICS.count("cache_hits_total", cache="http", endpoint=endpoint)
+            return parsed
+        METRICS.count("cache_misses_total", cache="http", endpoint=endpoint)
+
+        parsed = parse(response)
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+        if etag or last_modified:
+            self._validators[url] = (etag, last_modified, parsed)
+        return parsed
+
+    def stats(self):
+        """
+        Returns {endpoint: {requests, not_modified, errors, seconds,
+        wire_bytes, body_bytes, mean_ms}}
+        """
+        with self._lock:
+            return {endpoint: stats.as_dict() for endpoint, stats in self._stats.items()}
+
+    def samples(self):
+        """
+        The per-endpoint tallies as metrics Samples
+        """
+        samples = []
+        for endpoint, stats in self.stats().items():
+            labels = (("endpoint", endpoint),)
+            samples += [
+                Sample("upstream_requests_total", "counter", stats["requests"], labels),
+                Sample("upstream_not_modified_total", "counter", stats["not_modified"], labels),
+                Sample("upstream_errors_total", "counter", stats["errors"], labels),
+                Sample("upstream_seconds_total", "counter", stats["seconds"], labels),
+                Sample("upstream_wire_bytes_total", "counter", stats["wire_bytes"], labels),
+                Sample("upstream_body_bytes_total", "counter", stats["body_bytes"], labels),
+            ]
+        return samples
+
+
+CLIENT = HttpClient(
+    recorder=FeedRecorder(os.environ["CALTRAIN_RECORD_PATH"]) if os.environ.get("CALTRAIN_RECORD_PATH") else None
+)
+if os.environ.get("CALTRAIN_REPLAY_PATH"):
+    # Serves the shared client from a recorded log instead of the network
+    install_replay(CLIENT.session, os.environ["CALTRAIN_REPLAY_PATH"],
+                   speed=float(os.environ.get("CALTRAIN_REPLAY_SPEED", 1)))
+METRICS.add_collector(CLIENT.samples)
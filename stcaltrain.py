@@ -1,158 +1,172 @@
-import requests
+import time
+
+# Taken before the heavy imports, so a cold start's first paint includes them
+RUN_STARTED = time.perf_counter()
+
+import os
 import pandas as pd
-import numpy as np
 import streamlit as st
 import pytz
 import datetime
-from streamlit_extras.badges import badge
 from functions.ct_functions import (
     get_schedule,
-    assign_train_type,
+    train_labels,
     is_northbound,
 )
-from geopy.distance import geodesic
-import json
+from functions.metrics import METRICS, Sample, serve_metrics
+from functions.startup import PaintTimer
+from functions.stations import get_stations
+
+# The live modules are imported where they are first used, so a
+# schedule-only monitor never loads them
 
 st.set_page_config(page_title="Caltrain Platform", page_icon="🚆", layout="wide")
 
-@st.cache_resource(ttl="60s")
-def ping_train() -> dict:
-    url = f"https://api.511.org/transit/VehicleMonitoring?api_key={st.secrets['511_key']}&agency=CT"
-    response = requests.get(url)
-    if response.status_code != 200:
-        return False
-
-    decoded_content = response.content.decode("utf-8-sig")
-    data = json.loads(decoded_content)
-
-    if data["Siri"]["ServiceDelivery"]["VehicleMonitoringDelivery"].get("VehicleActivity") is None:
-        return False
-    return data
-
-API_RESPONSE_DATA = ping_train()
-
-def create_caltrain_dfs(data: dict) -> pd.DataFrame:
-    trains = []
-
-    for train in data["Siri"]["ServiceDelivery"]["VehicleMonitoringDelivery"]["VehicleActivity"]:
-        train_obj = train["MonitoredVehicleJourney"]
-
-        if train_obj.get("OnwardCalls") is None:
-            continue
-
-        next_stop_df = pd.DataFrame(
-            [
-                [
-                    train_obj["MonitoredCall"]["StopPointName"],
-                    train_obj["MonitoredCall"]["StopPointRef"],
-                    train_obj["MonitoredCall"]["AimedArrivalTime"],
-                    train_obj["MonitoredCall"]["ExpectedArrivalTime"],
-                    train_obj["MonitoredCall"]["AimedDepartureTime"],
-                ]
-            ],
-            columns=["stop_name", "stop_id", "aimed_arrival_time",
-                     "expected_arrival_time", "AimedDepartureTime"],
-        )
+# Seconds between 511 calls, shared by every session, with
+# CALTRAIN_POLL_POLICY=fixed; the adaptive policy picks its own
+POLL_INTERVAL = 60
+# Only a cold start waits for the first snapshot, and only this long
+FIRST_SNAPSHOT_WAIT = 10
+# Older snapshots are treated as the API being down
+MAX_SNAPSHOT_AGE = 5 * 60
+# "auto" shows live trains and falls back to the schedule, "live" and
+# "schedule" show only one and skip loading the other
+APP_MODE = os.environ.get("CALTRAIN_APP_MODE", "auto")
+
+
+@st.cache_resource
+def metrics_server():
+    # Serves /metrics when CALTRAIN_METRICS_PORT is set
+    return serve_metrics()
+
+
+@st.cache_resource
+def paint_timer() -> PaintTimer:
+    timer = PaintTimer()
+
+    def paint_samples():
+        summary = timer.summary()
+        if summary is None:
+            return []
+        return [Sample("first_paint_cold_seconds", "gauge", summary["cold"]),
+                Sample("first_paint_median_seconds", "gauge", summary["median"]),
+                Sample("first_paints_total", "counter", summary["count"])]
+
+    METRICS.add_collector(paint_samples)
+    return timer
+
+
+@st.cache_resource
+def delay_store():
+    from functions.delay_store import open_delay_store
+
+    return open_delay_store()
+
+
+@st.cache_resource
+def poll_policy():
+    """
+    The adaptive polling policy, None when CALTRAIN_POLL_POLICY=fixed
+    """
+    from functions.polling import live_policy
+
+    return live_policy()
+
+
+@st.cache_resource
+def vehicle_poller():
+    from functions.poller import vehicle_poller as live_poller
+
+    poller = live_poller(st.secrets["511_key"], delay_store(), poll_policy(), interval=POLL_INTERVAL)
+
+    def snapshot_samples():
+        snapshot = poller.latest()
+        return [] if snapshot is None else [Sample("snapshot_age_seconds", "gauge", snapshot.age())]
+
+    METRICS.add_collector(snapshot_samples)
+    return poller.start()
+
+
+def typical_delay(trains, station):
+    """
+    p50 / p90 delay labels for the trains on a board, None without a store
+    """
+    from functions.delay_store import format_typical_delay
+
+    store = delay_store()
+    if store is None:
+        return None
+    return format_typical_delay(store.typical_delays(trains["id"].unique(), station), trains["id"])
 
-        destinations_df = pd.DataFrame(
-            [
-                [
-                    stop["StopPointName"],
-                    stop["StopPointRef"],
-                    stop["AimedArrivalTime"],
-                    stop["ExpectedArrivalTime"],
-                    stop["AimedDepartureTime"]
-                ]
-                for stop in train_obj["OnwardCalls"]["OnwardCall"]
-            ],
-            columns=["stop_name", "stop_id", "aimed_arrival_time",
-                     "expected_arrival_time", "AimedDepartureTime"],
-        )
 
-        destinations_df = pd.concat([next_stop_df, destinations_df])
-        destinations_df["id"] = train_obj["VehicleRef"]
-        destinations_df["origin"] = train_obj["OriginName"]
-        destinations_df["origin_id"] = train_obj["OriginRef"]
-        destinations_df["direction"] = train_obj["DirectionRef"] + "B"
-        destinations_df["line_type"] = train_obj["PublishedLineName"]
-        destinations_df["destination"] = train_obj["DestinationName"]
-        destinations_df["train_longitude"] = train_obj["VehicleLocation"]["Longitude"]
-        destinations_df["train_latitude"] = train_obj["VehicleLocation"]["Latitude"]
-        destinations_df["stops_away"] = destinations_df.index
-
-        trains.append(destinations_df)
-
-    trains_df = pd.concat(trains)
-
-    trains_df["aimed_arrival_time"] = pd.to_datetime(trains_df["aimed_arrival_time"])
-    trains_df["expected_arrival_time"] = pd.to_datetime(trains_df["expected_arrival_time"])
-    trains_df["AimedDepartureTime"] = pd.to_datetime(trains_df["AimedDepartureTime"])
-    trains_df["train_longitude"] = trains_df["train_longitude"].astype(float)
-    trains_df["train_latitude"] = trains_df["train_latitude"].astype(float)
-    trains_df["stop_id"] = trains_df["stop_id"].astype(float)
-    trains_df["origin_id"] = trains_df["origin_id"].astype(float)
-
-    stop_ids = pd.read_csv("stop_ids.csv")
-
-    sb_trains_df = pd.merge(trains_df, stop_ids, left_on="stop_id",
-                            right_on="stop1", how="inner")
-    nb_trains_df = pd.merge(trains_df, stop_ids, left_on="stop_id",
-                            right_on="stop2", how="inner")
-    trains_df = pd.concat([sb_trains_df, nb_trains_df])
-
-    trains_df["distance"] = trains_df.apply(
-        lambda x: geodesic((x["train_latitude"], x["train_longitude"]),
-                           (x["lat"], x["lon"])).miles,
-        axis=1,
-    )
-    trains_df["distance"] = trains_df["distance"].round(1).astype("str") + " mi"
-
-    trains_df["Departure Time"] = trains_df["expected_arrival_time"]
-    trains_df["Scheduled Time"] = trains_df["aimed_arrival_time"]
-    trains_df["Current Time"] = datetime.datetime.now(pytz.timezone("UTC"))
-    trains_df["ETA"] = trains_df["Departure Time"] - trains_df["Current Time"]
-    trains_df["ScheduledETA"] = trains_df["Scheduled Time"] - trains_df["Current Time"]
-    trains_df["AimedDepartureTimeETA"] = trains_df["AimedDepartureTime"] - trains_df["Current Time"]
-
-    trains_df["Train #"] = trains_df["id"]
-    trains_df["Direction"] = trains_df["direction"]
-
-    return trains_df
-
-
-def clean_up_df(data: pd.DataFrame) -> pd.DataFrame:
-    data["ETA"] = data["ETA"].apply(lambda x: int(x.total_seconds() / 60))
-    data["ETA_COMPARE"] = data["ETA"]
-    data["ETA"] = data["ETA"].astype(str) + " min"
-
-    data["ScheduledETA"] = data["ScheduledETA"].apply(lambda x: int(x.total_seconds() / 60))
-    data["ScheduledETA_COMPARE"] = data["ScheduledETA"]
-    data["delayed"] = np.where(data["ETA_COMPARE"] > data["ScheduledETA_COMPARE"] + 1,
-                               '!!!!!--  I SLOW  --!!!!!', '')
-    data["ScheduledETA"] = data["ScheduledETA"].astype(str) + " min"
-
-    data["AimedDepartureTimeETA"] = data["AimedDepartureTimeETA"].apply(
-        lambda x: int(x.total_seconds() / 60))
-    data["AimedDepartureTimeETA"] = data["AimedDepartureTimeETA"].astype(str) + " min"
-
-    data["API Time"] = data.apply(
-        lambda row: f"{row['Departure Time']} // Train in {row['ETA']}", axis=1)
-    data["Scheduled Time"] = data.apply(
-        lambda row: f"{row['Departure Time']} // Train in {row['ScheduledETA']}", axis=1)
-    data["AimedDepartureTime"] = data.apply(
-        lambda row: f"{row['AimedDepartureTime']} // Train in {row['AimedDepartureTimeETA']}", axis=1)
-
-    data = data[["Train #", "API Time", "AimedDepartureTime", "delayed", "stopsaway2"]]
-    data.columns = ["Train #", "API Arrival", "Scheduled Depature", "Delayed", "Stops Away"]
-
-    data = data.T
-    data.columns = data.iloc[0]
-    data = data.drop(data.index[0])
-    return data
-
-
-if API_RESPONSE_DATA is not False:
-    caltrain_data = create_caltrain_dfs(API_RESPONSE_DATA)
+@st.cache_resource
+def board_cache():
+    from functions.boards import BoardCache
+    from functions.interpolate import INTERPOLATE, TICK_SECONDS
+
+    # Interpolated boards change every tick, the others once a minute
+    resolution = TICK_SECONDS if INTERPOLATE and TICK_SECONDS else 60
+    return BoardCache(typical_delay, resolution=resolution, interpolate=INTERPOLATE)
+
+
+def tick():
+    # An idle live page reruns every CALTRAIN_TICK seconds, reusing the latest snapshot
+    from functions.interpolate import TICK_SECONDS
+
+    if TICK_SECONDS:
+        time.sleep(TICK_SECONDS)
+        st.rerun()
+
+
+def debug_panel():
+    """
+    Process-wide stage timings and counters, for CALTRAIN_METRICS=1
+    """
+    stages = METRICS.stages()
+    with st.expander("Performance", expanded=False):
+        if stages:
+            rows = [
+                {"stage": stage, "labels": ", ".join(f"{k}={v}" for k, v in labels), "count": times["count"],
+                 "mean ms": round(times["mean_ms"], 1), "last ms": round(times["last_ms"], 1),
+                 "max ms": round(times["max_ms"], 1)}
+                for (stage, labels), times in sorted(stages.items())
+            ]
+            st.dataframe(pd.DataFrame(rows), hide_index=True, use_container_width=True)
+        samples = [
+            {"metric": sample.name, "labels": ", ".join(f"{k}={v}" for k, v in sample.labels), "value": sample.value}
+            for sample in METRICS.samples()
+        ]
+        if samples:
+            st.dataframe(pd.DataFrame(samples), hide_index=True, use_container_width=True)
+
+
+def first_paint(view):
+    # Only a session's first run counts
+    if "first_paint" not in st.session_state:
+        st.session_state["first_paint"] = time.perf_counter() - RUN_STARTED
+        paint_timer().record(st.session_state["first_paint"], view)
+
+
+metrics_server()
+
+# A placeholder board is on screen while a new session waits for data
+loading = st.empty()
+if "first_paint" not in st.session_state:
+    with loading.container():
+        st.subheader("Northbound Trains")
+        st.info("🚆 Loading trains...")
+        st.subheader("Southbound Trains")
+        st.info("🚆 Loading trains...")
+
+snapshot = None
+if APP_MODE != "schedule":
+    poller = vehicle_poller()
+    snapshot = poller.latest() or poller.wait(FIRST_SNAPSHOT_WAIT)
+
+# Overnight the poller waits longer than MAX_SNAPSHOT_AGE on purpose
+if snapshot is not None and snapshot.payload is not None and \
+        snapshot.age() < max(MAX_SNAPSHOT_AGE, poller.delay + POLL_INTERVAL):
+    caltrain_data = snapshot.payload
 else:
     caltrain_data = False
 
@@ -160,7 +174,7 @@ else:
 pacific = pytz.timezone("US/Pacific")
 current_time = datetime.datetime.now(pacific).strftime("%I:%M %p")
 
-caltrain_stations = pd.read_csv("stop_ids.csv")
+caltrain_stations = get_stations().names
 
 
 # ----------------------------
@@ -168,25 +182,30 @@ caltrain_stations = pd.read_csv("stop_ids.csv")
 # ----------------------------
 # with st.expander("Change Stations and Schedule Type", expanded=False):
 #     chosen_station = st.selectbox("Choose Origin Station",
-#                                   caltrain_stations["stopname"], index=8)
+#                                   caltrain_stations, index=8)
 
 #     chosen_destination = st.selectbox("Choose Destination Station",
-#                                       ["--"] + caltrain_stations["stopname"].tolist(),
+#                                       ["--"] + caltrain_stations,
 #                                       index=0)
 
 with st.sidebar:
     st.header("Settings")
     chosen_station = st.selectbox("Choose Origin Station",
-                                  caltrain_stations["stopname"], index=8)
+                                  caltrain_stations, index=8)
 
     chosen_destination = st.selectbox("Choose Destination Station",
-                                      ["--"] + caltrain_stations["stopname"].tolist(),
+                                      ["--"] + caltrain_stations,
                                       index=0)
 
     api_working = isinstance(caltrain_data, pd.DataFrame)
+    if APP_MODE != "schedule" and poll_policy() is not None:
+        # Trains near the stations on screen are polled for more often
+        poll_policy().watch(chosen_station)
     scheduled = False
 
-    if api_working:
+    if APP_MODE == "live":
+        display = "Live"
+    elif api_working:
         display = st.radio(
             "Show trains",
             ["Live", "Scheduled"],
@@ -202,46 +221,65 @@ with st.sidebar:
             disabled=True
         )
 
+    if METRICS.enabled:
+        debug_panel()
+
+loading.empty()
+
 # -------------------------------------
 #  SCHEDULE VIEW
 # -------------------------------------
 if display == "Scheduled":
     st.warning("📆 Pulling the current schedule from the Caltrain website...")
 
-    if chosen_destination != "--" and chosen_destination != chosen_station:
-        if is_northbound(chosen_station, chosen_destination):
-            caltrain_data = get_schedule("northbound", chosen_station, chosen_destination)
+    with METRICS.span("format", view="schedule"):
+        if chosen_destination != "--" and chosen_destination != chosen_station:
+            if is_northbound(chosen_station, chosen_destination):
+                caltrain_data = get_schedule("northbound", chosen_station, chosen_destination)
+            else:
+                caltrain_data = get_schedule("southbound", chosen_station, chosen_destination)
         else:
-            caltrain_data = get_schedule("southbound", chosen_station, chosen_destination)
-    else:
-        caltrain_data = pd.concat([
-            get_schedule("northbound", chosen_station, chosen_destination),
-            get_schedule("southbound", chosen_station, chosen_destination)
-        ])
-
-    caltrain_data = caltrain_data.sort_values(by=["ETA"])
-    caltrain_data["Train #"] = caltrain_data["Train #"].map(
-        lambda c: f"{assign_train_type(c)}-{c}")
-
-    # NORTHBOUND
-    st.subheader(f"Northbound Trains - {current_time}")
-    nb_data = caltrain_data.query("Direction == 'NB'").drop("Direction", axis=1)
-    nb_data = nb_data.T
-    nb_data.columns = nb_data.iloc[0]
-    st.dataframe(nb_data.drop(nb_data.index[0]), use_container_width=True)
-
-    # SOUTHBOUND
-    st.subheader(f"Southbound Trains - {current_time}")
-    sb_data = caltrain_data.query("Direction == 'SB'").drop("Direction", axis=1)
-    sb_data = sb_data.T
-    sb_data.columns = sb_data.iloc[0]
-    st.dataframe(sb_data.drop(sb_data.index[0]), use_container_width=True)
+            caltrain_data = pd.concat([
+                get_schedule("northbound", chosen_station, chosen_destination),
+                get_schedule("southbound", chosen_station, chosen_destination)
+            ])
+
+        caltrain_data = caltrain_data.sort_values(by=["ETA"])
+        caltrain_data["Train #"] = train_labels(caltrain_data["Train #"])
+
+    with METRICS.span("render", view="schedule"):
+        # NORTHBOUND
+        st.subheader(f"Northbound Trains - {current_time}")
+        nb_data = caltrain_data.query("Direction == 'NB'").drop("Direction", axis=1)
+        nb_data = nb_data.T
+        nb_data.columns = nb_data.iloc[0]
+        st.dataframe(nb_data.drop(nb_data.index[0]), use_container_width=True)
+
+        # SOUTHBOUND
+        st.subheader(f"Southbound Trains - {current_time}")
+        sb_data = caltrain_data.query("Direction == 'SB'").drop("Direction", axis=1)
+        sb_data = sb_data.T
+        sb_data.columns = sb_data.iloc[0]
+        st.dataframe(sb_data.drop(sb_data.index[0]), use_container_width=True)
+
+    first_paint("schedule")
 
 # -------------------------------------
 #  LIVE VIEW
 # -------------------------------------
 else:
-    api_live_responsetime = API_RESPONSE_DATA["Siri"]["ServiceDelivery"]["ResponseTimestamp"]
+    from functions.boards import BOARD_MODE
+    from functions.interpolate import INTERPOLATE, interpolate_trains
+    from functions.journeys import JourneyIndex
+    from functions.render import clean_up_df, prepare_live_frame
+    from functions.siri import add_clock_columns
+
+    if not api_working:
+        st.error("❌ No live data from the 511 API right now")
+        tick()
+        st.stop()
+
+    api_live_responsetime = snapshot.response_time
     api_live_responsetime_dt = datetime.datetime.strptime(api_live_responsetime, '%Y-%m-%dT%H:%M:%SZ') \
         .replace(tzinfo=pytz.utc) \
         .astimezone(pytz.timezone('US/Pacific'))
@@ -259,68 +297,64 @@ else:
     else:
         st.error(f"❌ Caltrain API Time is off by {api_live_responsetime_dt - current_time_dt} minutes")
 
-    caltrain_data["Train Type"] = caltrain_data["Train #"].apply(assign_train_type)
-    caltrain_data["Train #"] = caltrain_data["Train #"].map(
-        lambda c: f"{assign_train_type(c)}-{c}")
-
-    caltrain_data["Departure Time"] = pd.to_datetime(
-        caltrain_data["Departure Time"]).dt.tz_convert("US/Pacific").dt.strftime("%I:%M %p")
-    caltrain_data["Scheduled Time"] = pd.to_datetime(
-        caltrain_data["Scheduled Time"]).dt.tz_convert("US/Pacific").dt.strftime("%I:%M %p")
-    caltrain_data["AimedDepartureTime"] = pd.to_datetime(
-        caltrain_data["AimedDepartureTime"]).dt.tz_convert("US/Pacific").dt.strftime("%I:%M %p")
-
-    caltrain_data = caltrain_data.reset_index(drop=True)
-
-    idx = (caltrain_data
-           .sort_values(["id", "aimed_arrival_time"])
-           .groupby("id")
-           .head(1)
-           .index)
-
-    first_stops = caltrain_data.loc[idx, ["id", "stop_name"]].drop_duplicates().set_index("id")["stop_name"]
-    caltrain_data["stopsaway2"] = caltrain_data["id"].map(first_stops)
-    caltrain_data["stopsaway2"] = caltrain_data["stopsaway2"].astype(str).str.replace(
-        r'\s*Caltrain Station\s+(Northbound|Southbound)\s*$',
-        '', regex=True
-    ).str.strip()
-    caltrain_data["stopsaway2"] = (
-        caltrain_data["stops_away"].astype(str)
-        + " // " + caltrain_data["stopsaway2"]
-        + " // " + caltrain_data["distance"]
-    )
+    if snapshot.changes:
+        changes = snapshot.changes
+        st.caption(f"Last update: {len(changes.new)} new, {len(changes.updated)} updated, "
+                   f"{len(changes.departed)} departed")
 
     valid_destinations = ["San Francisco", "Tamien", "San Jose Diridon"]
-
-    if chosen_destination not in ["--"] + valid_destinations:
-        dest_ids = caltrain_data[caltrain_data["stopname"] == chosen_destination]["id"]
-        caltrain_data = caltrain_data[caltrain_data["id"].isin(dest_ids)]
-
-    if chosen_destination != "--" and chosen_destination != chosen_station:
-        if is_northbound(chosen_station, chosen_destination):
-            caltrain_data = caltrain_data.query("direction == 'NB'")
+    direction_filter = chosen_destination != "--" and chosen_destination != chosen_station
+    dest_filter = direction_filter and chosen_destination not in valid_destinations
+    if direction_filter:
+        show_direction = "NB" if is_northbound(chosen_station, chosen_destination) else "SB"
+
+    with METRICS.span("format", view="live"):
+        if BOARD_MODE == "all":
+            boards = board_cache().boards(snapshot)
+            dest_ids = boards.journeys.serving(chosen_station, chosen_destination) if dest_filter else None
+            nb_board = boards.board(chosen_station, "NB", dest_ids)
+            sb_board = boards.board(chosen_station, "SB", dest_ids)
+            if direction_filter and show_direction == "NB":
+                sb_board = None
+            elif direction_filter:
+                nb_board = None
         else:
-            caltrain_data = caltrain_data.query("direction == 'SB'")
-
-    # NORTHBOUND
-    st.subheader(f"Northbound Trains - {current_time}")
-    nb_trains = caltrain_data.query("Direction == 'NB'").drop("Direction", axis=1)
-    nb_trains = nb_trains[nb_trains["stopname"] == chosen_station].sort_values("ETA")
-
-    if nb_trains.empty:
-        st.info("No trains northbound.")
-    else:
-        st.dataframe(clean_up_df(nb_trains), use_container_width=True)
+            now = datetime.datetime.now(pytz.utc)
+            if INTERPOLATE:
+                caltrain_data = interpolate_trains(caltrain_data, snapshot.fetched_at, now)
+            caltrain_data = prepare_live_frame(add_clock_columns(caltrain_data, now))
+
+            if dest_filter:
+                dest_ids = JourneyIndex.from_trains(caltrain_data).serving(chosen_station, chosen_destination)
+                caltrain_data = caltrain_data[caltrain_data["id"].isin(list(dest_ids))]
+
+            if direction_filter:
+                caltrain_data = caltrain_data.query("direction == @show_direction")
+
+            nb_trains = caltrain_data.query("Direction == 'NB'").drop("Direction", axis=1)
+            nb_trains = nb_trains[nb_trains["stopname"] == chosen_station].sort_values("ETA")
+            nb_board = None if nb_trains.empty else clean_up_df(nb_trains, typical_delay(nb_trains, chosen_station))
+
+            sb_trains = caltrain_data.query("direction == 'SB'").drop("direction", axis=1)
+            sb_trains = sb_trains[sb_trains["stopname"] == chosen_station].sort_values("ETA")
+            sb_board = None if sb_trains.empty else clean_up_df(sb_trains, typical_delay(sb_trains, chosen_station))
+
+    with METRICS.span("render", view="live"):
+        # NORTHBOUND
+        st.subheader(f"Northbound Trains - {current_time}")
+        if nb_board is None:
+            st.info("No trains northbound.")
+        else:
+            st.dataframe(nb_board, use_container_width=True)
 
-    # SOUTHBOUND
-    st.subheader(f"Southbound Trains - {current_time}")
-    sb_trains = caltrain_data.query("direction == 'SB'").drop("direction", axis=1)
-    sb_trains = sb_trains[sb_trains["stopname"] == chosen_station].sort_values("ETA")
+        # SOUTHBOUND
+        st.subheader(f"Southbound Trains - {current_time}")
+        if sb_board is None:
+            st.info("No trains southbound.")
+        else:
+            st.dataframe(sb_board, use_container_width=True)
 
-    if sb_trains.empty:
-        st.info("No trains southbound.")
-    else:
-        st.dataframe(clean_up_df(sb_trains), use_container_width=True)
+    first_paint("live")
 
 
 # -------------------------
@@ -332,7 +366,8 @@ st.markdown("""
 1. **API Arrival** — Expected arrival time from the 511 API  
 2. **Scheduled Depature** — Aimed departure from the schedule  
 3. **Delayed** — Triggered when API ETA is behind schedule  
-4. **Stops Away** — Stops until origin // nearest major station // distance  
+4. **Typical Delay** — This train's median (p50) and 90th percentile delay here over the last 30 days  
+5. **Stops Away** — Stops until origin // nearest major station // distance  
 """)
 
 st.subheader("About")
@@ -340,4 +375,7 @@ st.markdown("""
 - This app provides **real-time Caltrain status** using the 511 API.  
 - If real-time data is unavailable, the app automatically switches to the live Caltrain schedule.  
 - Forked from the original project by Tyler Simons with major enhancements.
-""")
\ No newline at end of file
+""")
+
+if display == "Live":
+    tick()